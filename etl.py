@@ -4,7 +4,12 @@
 # pylint: disable=unused-argument
 
 import argparse
+import pylib.aggregate
 import pylib.db as db
+import pylib.export
+import pylib.metrics as metrics
+import pylib.migrate
+import pylib.parquet
 from pylib.util import log
 import pylib.clements_ingest
 import pylib.bbl_ingest
@@ -48,6 +53,10 @@ def parse_args():
 
     create_parser = subparsers.add_parser(
         'create', help="""Create the SQLite3 database tables & indices.""")
+    create_parser.add_argument(
+        '--defer-indexes', action='store_true',
+        help="""Create the tables without their secondary indexes. Use this
+            with ingest --defer-indexes for a bulk load.""")
     create_parser.set_defaults(func=create)
 
     ingest_parser = subparsers.add_parser(
@@ -57,23 +66,90 @@ def parse_args():
         'datasets', nargs='+', choices=INGEST_OPTIONS,
         help=f"""Ingest a dataset into the SQLite3 database.
             Note: 'all' will ingest all datasets.""")
+    ingest_parser.add_argument(
+        '--workers', type=int, default=1,
+        help="""Use this many processes to parse & transform the eBird data.
+            (default: %(default)s)""")
+    ingest_parser.add_argument(
+        '--resume', action='store_true',
+        help="""Continue an interrupted eBird ingest from its last checkpoint
+            instead of starting over.""")
+    ingest_parser.add_argument(
+        '--incremental', action='store_true',
+        help="""Update the datasets' records in place from their raw data
+            instead of deleting & reloading them. Only new & changed records
+            are written. Datasets without natural keys are reloaded.""")
+    ingest_parser.add_argument(
+        '--defer-indexes', action='store_true',
+        help="""Drop the secondary indexes before the ingest and build them
+            all once it is done.""")
+    ingest_parser.add_argument(
+        '--profile', metavar='PATH',
+        help="""Time each stage of the ingest and write a report of wall &
+            CPU time, rows, rows per second, and peak memory to this file.
+            It is a CSV file if the name ends with .csv, otherwise JSON.""")
     ingest_parser.set_defaults(func=ingest)
 
+    aggregate_parser = subparsers.add_parser(
+        'aggregate',
+        help="""Build or refresh the daily & weekly summary tables of counts &
+            effort by taxon, year, day or week, geohash cell, & dataset. Once
+            they are built every ingest refreshes them.""")
+    aggregate_parser.add_argument(
+        '--rebuild', action='store_true',
+        help="""Rebuild the tables for every dataset instead of refreshing
+            the datasets that were ingested since the last refresh.""")
+    aggregate_parser.set_defaults(func=aggregate)
+
     csv_parser = subparsers.add_parser(
         'export',
-        help="""Export data from an SQLite3 database to CSV files.""")
+        help="""Export data from an SQLite3 database to CSV or Parquet
+            files.""")
     csv_parser.add_argument(
         'datasets', nargs='+', choices=EXPORT_OPTIONS,
         help="""Export a dataset or table to CSV file(s).
             Note: 'all' will export everything.""")
     csv_parser.add_argument(
-        'path', help="""Export the CSV files to this directory.""")
+        'path', help="""Export the files to this directory.""")
+    csv_parser.add_argument(
+        '--format', choices=['csv', 'parquet'], default='csv',
+        help="""Export tables to CSV files, or datasets to a Parquet
+            dataset of their counts joined to their places, events, & taxa,
+            partitioned by dataset & year. Parquet needs the pyarrow
+            package. (default: %(default)s)""")
+    csv_parser.add_argument(
+        '--json', choices=pylib.parquet.JSON_MODES, default='string',
+        help="""Keep the Parquet JSON columns as strings in the counts files or
+            split them out into their own files. (default: %(default)s)""")
+    csv_parser.add_argument(
+        '--shard-rows', type=int, default=pylib.export.SHARD_ROWS,
+        help="""Split big tables into CSV files of at most this many rows.
+            (default: %(default)s)""")
+    csv_parser.add_argument(
+        '--compress', choices=['gzip', 'zstd'],
+        help="""Compress the CSV files. zstd needs the zstandard package.""")
+    csv_parser.add_argument(
+        '--workers', type=int, default=1,
+        help="""Write this many CSV files or Parquet partitions at once.
+            (default: %(default)s)""")
     csv_parser.set_defaults(func=export)
 
     postgres_parser = subparsers.add_parser(
         'postgres', help="""Create the PostgreSQL database.""")
     postgres_parser.set_defaults(func=postgres)
 
+    migrate_parser = subparsers.add_parser(
+        'migrate', help="""Copy the SQLite3 database straight into a new
+            PostgreSQL database.""")
+    migrate_parser.add_argument(
+        '--shard-rows', type=int, default=pylib.migrate.SHARD_ROWS,
+        help="""Copy big tables in pieces of this many rows.
+            (default: %(default)s)""")
+    migrate_parser.add_argument(
+        '--workers', type=int, default=1,
+        help="""Copy this many pieces at once. (default: %(default)s)""")
+    migrate_parser.set_defaults(func=migrate)
+
     load_parser = subparsers.add_parser(
         'import', help="""Import CSV files into the PostgreSQL database.""")
     load_parser.set_defaults(func=import_)
@@ -86,9 +162,9 @@ def backup(_):
     db.backup_database()
 
 
-def create(_):
+def create(args):
     """Create the SQLite3 database."""
-    db.create()
+    db.create(defer_indexes=args.defer_indexes)
 
 
 def ingest(args):
@@ -96,21 +172,70 @@ def ingest(args):
     if 'all' in args.datasets:
         args.datasets = INGEST_OPTIONS
 
+    if args.profile:
+        metrics.start()
+
+    if args.defer_indexes:
+        log(SEPARATOR)
+        with metrics.stage('drop_indexes'), db.IngestSession() as session:
+            db.drop_indexes(session)
+
     # Order matters
     for _ingest, module in DATASETS:
         if _ingest in args.datasets:
             log(SEPARATOR)
-            module.ingest()
+            incremental = args.incremental
+            if incremental and not hasattr(module, 'NATURAL_KEYS'):
+                log(f'{_ingest} has no natural keys so reloading it')
+                incremental = False
+            with metrics.stage(_ingest), db.IngestSession(
+                    workers=args.workers, resume=args.resume,
+                    incremental=incremental) as session:
+                module.ingest(session)
+
+    if args.defer_indexes:
+        log(SEPARATOR)
+        with metrics.stage('create_indexes'), db.IngestSession(
+                workers=args.workers) as session:
+            db.create_indexes(session)
+    log(SEPARATOR)
+
+    with db.IngestSession(workers=args.workers) as session:
+        if pylib.aggregate.exists(session.cxn):
+            with metrics.stage('aggregate'):
+                ingested = [d for d in args.datasets if d in DATASET_NAMES]
+                pylib.aggregate.aggregate(session, dataset_ids=ingested)
+            log(SEPARATOR)
+
+    if args.profile:
+        for line in metrics.summary_lines():
+            log(line)
+        metrics.write_report(args.profile)
+        log(f'Wrote the ingest profile to {args.profile}')
+        log(SEPARATOR)
+
+
+def aggregate(args):
+    """Build or refresh the summary tables."""
+    log(SEPARATOR)
+    with db.IngestSession() as session:
+        pylib.aggregate.aggregate(session, rebuild=args.rebuild)
     log(SEPARATOR)
 
 
 def export(args):
-    """Export the SQLite3 database to CSV files."""
+    """Export the SQLite3 database to CSV or Parquet files."""
     if 'all' in args.datasets:
         args.datasets = EXPORTS
-    for item in args.datasets:
-        log(SEPARATOR)
-        db.export_to_csv_files(item, args.path)
+    log(SEPARATOR)
+    if args.format == 'parquet':
+        dataset_ids = [d for d in args.datasets if d not in db.TABLES]
+        pylib.parquet.export_parquet(
+            dataset_ids, args.path, json=args.json, workers=args.workers)
+    else:
+        pylib.export.export_csv(
+            args.datasets, args.path, shard_rows=args.shard_rows,
+            compress=args.compress, workers=args.workers)
     log(SEPARATOR)
 
 
@@ -119,6 +244,13 @@ def postgres(_):
     db.create_postgres()
 
 
+def migrate(args):
+    """Copy the SQLite3 database into the PostgreSQL database."""
+    log(SEPARATOR)
+    pylib.migrate.migrate(shard_rows=args.shard_rows, workers=args.workers)
+    log(SEPARATOR)
+
+
 def import_(_):
     """Import the CSV files into the PostgreSQL database."""
     db.import_postgres()
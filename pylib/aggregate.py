@@ -0,0 +1,218 @@
+"""
+Summary tables of counts & effort for phenology queries.
+
+Most analyses total the counts by taxon, date, and area. Instead of joining
+the counts, events, & places every time, we keep those totals in tables:
+
+daily_counts & weekly_counts, per dataset, taxon, year, day or week, & cell:
+- records: the count records,
+- total: the sum of the counts,
+- events: the events with a count of the taxon.
+
+daily_effort & weekly_effort, per dataset, year, day or week, & cell:
+- checklists: all of the events, with or without counts,
+- timed: the events with a start & end time,
+- minutes: the total minutes of the timed events.
+
+A cell is a geohash prefix of the place (see geohash.py), a cell with
+CELL_PRECISION characters is about 40 km across. Weeks run from day 1 of the
+year, so week 1 is days 1-7. Each table's key starts with what the queries
+filter on, so a phenology curve for a taxon is one index range scan. The
+detection rate in a cell is events / checklists for the same day or week.
+
+The tables are refreshed a dataset at a time: its rows are deleted and built
+again from the dataset's records. The aggregated_datasets table remembers the
+version & extraction time of each dataset that was aggregated, a dataset that
+has been ingested since then is stale.
+"""
+
+from . import db
+from .util import log
+
+CELL_PRECISION = 4
+TABLES = 'daily_counts weekly_counts daily_effort weekly_effort'.split()
+
+CREATE = """
+    CREATE TABLE IF NOT EXISTS daily_counts (
+      taxon_id   INTEGER NOT NULL,
+      year       INTEGER NOT NULL,
+      day        INTEGER NOT NULL,
+      cell       VARCHAR(8) NOT NULL,
+      dataset_id VARCHAR(12) NOT NULL,
+      records    INTEGER NOT NULL,
+      total      INTEGER NOT NULL,
+      events     INTEGER NOT NULL,
+      PRIMARY KEY (taxon_id, year, day, cell, dataset_id)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS weekly_counts (
+      taxon_id   INTEGER NOT NULL,
+      year       INTEGER NOT NULL,
+      week       INTEGER NOT NULL,
+      cell       VARCHAR(8) NOT NULL,
+      dataset_id VARCHAR(12) NOT NULL,
+      records    INTEGER NOT NULL,
+      total      INTEGER NOT NULL,
+      events     INTEGER NOT NULL,
+      PRIMARY KEY (taxon_id, year, week, cell, dataset_id)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS daily_effort (
+      year       INTEGER NOT NULL,
+      day        INTEGER NOT NULL,
+      cell       VARCHAR(8) NOT NULL,
+      dataset_id VARCHAR(12) NOT NULL,
+      checklists INTEGER NOT NULL,
+      timed      INTEGER NOT NULL,
+      minutes    INTEGER,
+      PRIMARY KEY (year, day, cell, dataset_id)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS weekly_effort (
+      year       INTEGER NOT NULL,
+      week       INTEGER NOT NULL,
+      cell       VARCHAR(8) NOT NULL,
+      dataset_id VARCHAR(12) NOT NULL,
+      checklists INTEGER NOT NULL,
+      timed      INTEGER NOT NULL,
+      minutes    INTEGER,
+      PRIMARY KEY (year, week, cell, dataset_id)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS daily_counts_dataset_id
+        ON daily_counts (dataset_id);
+    CREATE INDEX IF NOT EXISTS weekly_counts_dataset_id
+        ON weekly_counts (dataset_id);
+    CREATE INDEX IF NOT EXISTS daily_effort_dataset_id
+        ON daily_effort (dataset_id);
+    CREATE INDEX IF NOT EXISTS weekly_effort_dataset_id
+        ON weekly_effort (dataset_id);
+
+    CREATE TABLE IF NOT EXISTS aggregated_datasets (
+      dataset_id     VARCHAR(12) NOT NULL PRIMARY KEY,
+      version        VARCHAR(16),
+      extracted      TIMESTAMP,
+      cell_precision INTEGER NOT NULL,
+      refreshed      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+
+CELL = "COALESCE(substr(places.geohash, 1, :precision), '')"
+
+# Minutes between the start & end times, when both are HH:MM on the same day
+MINUTES = """
+    CASE WHEN started GLOB '[0-2][0-9]:[0-5][0-9]*'
+              AND ended GLOB '[0-2][0-9]:[0-5][0-9]*'
+              AND substr(ended, 1, 5) >= substr(started, 1, 5)
+         THEN (substr(ended, 1, 2) * 60 + substr(ended, 4, 2))
+            - (substr(started, 1, 2) * 60 + substr(started, 4, 2))
+    END"""
+
+WEEK = '(day - 1) / 7 + 1'
+
+DAILY_COUNTS = f"""
+    INSERT INTO daily_counts
+           (taxon_id, year, day, cell, dataset_id, records, total, events)
+    SELECT taxon_id, year, day, {CELL} AS cell, counts.dataset_id,
+           COUNT(*), COALESCE(SUM(count), 0), COUNT(DISTINCT event_id)
+      FROM counts
+      JOIN events USING (event_id)
+      JOIN places USING (place_id)
+     WHERE counts.dataset_id = :dataset_id
+  GROUP BY taxon_id, year, day, cell"""
+
+DAILY_EFFORT = f"""
+    INSERT INTO daily_effort
+           (year, day, cell, dataset_id, checklists, timed, minutes)
+    SELECT year, day, {CELL} AS cell, events.dataset_id,
+           COUNT(*), COUNT(minutes), SUM(minutes)
+      FROM (SELECT *, {MINUTES} AS minutes
+              FROM events
+             WHERE dataset_id = :dataset_id) AS events
+      JOIN places USING (place_id)
+  GROUP BY year, day, cell"""
+
+# The daily totals add up to the weekly ones, an event is on only one day
+WEEKLY_COUNTS = f"""
+    INSERT INTO weekly_counts
+           (taxon_id, year, week, cell, dataset_id, records, total, events)
+    SELECT taxon_id, year, {WEEK} AS week, cell, dataset_id,
+           SUM(records), SUM(total), SUM(events)
+      FROM daily_counts
+     WHERE dataset_id = :dataset_id
+  GROUP BY taxon_id, year, week, cell"""
+
+WEEKLY_EFFORT = f"""
+    INSERT INTO weekly_effort
+           (year, week, cell, dataset_id, checklists, timed, minutes)
+    SELECT year, {WEEK} AS week, cell, dataset_id,
+           SUM(checklists), SUM(timed), SUM(minutes)
+      FROM daily_effort
+     WHERE dataset_id = :dataset_id
+  GROUP BY year, week, cell"""
+
+
+def aggregate(session, dataset_ids=None, rebuild=False):
+    """
+    Refresh the summary tables.
+
+    By default only the stale datasets are refreshed. Pass dataset_ids to
+    refresh those datasets anyway, or rebuild to refresh every dataset.
+    """
+    if rebuild:
+        log('Dropping the summary tables')
+        for table in TABLES + ['aggregated_datasets']:
+            db.drop_table(session, table)
+
+    session.cxn.executescript(CREATE)
+
+    current = {
+        r[0]: (r[1], r[2], CELL_PRECISION) for r in session.cxn.execute(
+            'SELECT dataset_id, version, extracted FROM datasets')}
+    done = {
+        r[0]: tuple(r[1:]) for r in session.cxn.execute(
+            """SELECT dataset_id, version, extracted, cell_precision
+                 FROM aggregated_datasets""")}
+
+    refresh = set(dataset_ids or [])
+    refresh |= {d for d, v in current.items() if done.get(d) != v}
+    refresh |= set(done) - set(current)  # Deleted datasets
+
+    if not refresh:
+        log('The summary tables are up to date')
+
+    for dataset_id in sorted(refresh):
+        refresh_dataset(session, dataset_id, current.get(dataset_id))
+        session.commit()
+
+
+def refresh_dataset(session, dataset_id, version):
+    """
+    Replace the dataset's rows in the summary tables.
+
+    The version is the dataset's (version, extracted, cell precision), it is
+    None if the dataset was deleted.
+    """
+    log(f'Aggregating {dataset_id}')
+    cxn = session.cxn
+    params = {'dataset_id': dataset_id, 'precision': CELL_PRECISION}
+
+    for table in TABLES + ['aggregated_datasets']:
+        cxn.execute(
+            f'DELETE FROM {table} WHERE dataset_id = ?', (dataset_id, ))
+
+    if version is None:
+        return
+
+    for sql in (DAILY_COUNTS, DAILY_EFFORT, WEEKLY_COUNTS, WEEKLY_EFFORT):
+        cxn.execute(sql, params)
+
+    cxn.execute("""
+        INSERT INTO aggregated_datasets
+               (dataset_id, version, extracted, cell_precision)
+        VALUES (?, ?, ?, ?)""", (dataset_id, *version))
+
+
+def exists(cxn):
+    """Check if the summary tables have been built."""
+    return db.table_exists(cxn, 'aggregated_datasets')
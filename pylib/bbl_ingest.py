@@ -4,7 +4,7 @@ from pathlib import Path
 
 import pandas as pd
 
-from . import db, util
+from . import dates, db, geohash, metrics, readers, util
 
 DATASET_ID = 'bbl'
 RAW_DIR = Path('data') / 'raw' / DATASET_ID
@@ -17,14 +17,24 @@ ONE_MIN = 111.32 * 1000
 TEN_MIN = 111.32 * 1000 * 10
 EXACT = 0
 
+BANDING_EVENT_JSON = """ BAND_NUM BANDING_DATE TYPE """.split()
+BANDING_COUNT_JSON = """
+    AGE_CODE SEX_CODE SPECIES_ID SPECIES_NAME TYPE """.split()
+ENCOUNTER_EVENT_JSON = """ BAND_NUM ENCOUNTER_DATE TYPE """.split()
+ENCOUNTER_COUNT_JSON = """
+    B_AGE_CODE B_SEX_CODE B_SPECIES_ID B_SPECIES_NAME MIN_AGE_AT_ENC
+    ORIGINAL_BAND TYPE """.split()
+CATEGORIES = """COORD_PRECISION E_COORD_PRECISION AGE_CODE SEX_CODE
+    B_AGE_CODE B_SEX_CODE SPECIES_NAME B_SPECIES_NAME""".split()
 
-def ingest():
+
+def ingest(session):
     """Ingest USGS Bird Banding Laboratory data."""
-    db.delete_dataset_records(DATASET_ID)
+    db.delete_dataset_records(session, DATASET_ID)
 
-    to_taxon_id = get_taxa()
+    to_taxon_id = get_taxa(session)
 
-    db.insert_dataset({
+    db.insert_dataset(session, {
         'dataset_id': DATASET_ID,
         'title': 'Bird Banding Laboratory (BBL)',
         'version': '2020.0',
@@ -33,13 +43,15 @@ def ingest():
 
     to_place_id = {}
 
-    to_place_id = insert_banding_data(to_place_id, to_taxon_id)
+    to_place_id = insert_banding_data(session, to_place_id, to_taxon_id)
     to_place_id = insert_encounter_data(
-        ENCOUNTERS, to_place_id, to_taxon_id, 'encounter')
-    insert_encounter_data(RECAPTURES, to_place_id, to_taxon_id, 'recapture')
+        session, ENCOUNTERS, to_place_id, to_taxon_id, 'encounter')
+    insert_encounter_data(
+        session, RECAPTURES, to_place_id, to_taxon_id, 'recapture')
 
 
-def get_taxa():
+@metrics.timed
+def get_taxa(session):
     """Build a taxa table to link to our taxa."""
     codes = pd.read_html(str(SPECIES))[0]
     codes = codes.rename(columns={
@@ -50,7 +62,7 @@ def get_taxa():
     codes = codes.set_index('sci_name')['species_id'].to_dict()
 
     sql = """SELECT taxon_id, sci_name FROM taxa WHERE "class"='aves';"""
-    taxa = pd.read_sql(sql, db.connect())
+    taxa = pd.read_sql(sql, session.cxn)
     taxa = taxa.set_index('sci_name')['taxon_id'].to_dict()
 
     to_taxon_id = {str(v).zfill(4): i for k, v in codes.items()
@@ -59,7 +71,8 @@ def get_taxa():
     return to_taxon_id
 
 
-def insert_banding_data(to_place_id, to_taxon_id):
+@metrics.timed
+def insert_banding_data(session, to_place_id, to_taxon_id):
     """Insert raw banding data."""
     util.log(f'Inserting {DATASET_ID} banding data')
 
@@ -67,24 +80,26 @@ def insert_banding_data(to_place_id, to_taxon_id):
         util.log(f'File {path}')
 
         df = read_csv(
-            path, 'LON_DECIMAL_DEGREES', 'LAT_DECIMAL_DEGREES', 'banding')
+            path, 'LON_DECIMAL_DEGREES', 'LAT_DECIMAL_DEGREES', 'banding',
+            ['BANDING_DATE', 'SPECIES_ID', 'COORD_PRECISION']
+            + BANDING_EVENT_JSON + BANDING_COUNT_JSON)
 
         df = filter_data(
             df, to_taxon_id, 'BANDING_DATE', 'SPECIES_ID', 'COORD_PRECISION')
 
-        to_place_id = insert_places(df, to_place_id, 'COORD_PRECISION')
+        to_place_id = insert_places(
+            session, df, to_place_id, 'COORD_PRECISION')
 
-        event_json = """ BAND_NUM BANDING_DATE TYPE """.split()
-        insert_events(df, event_json)
+        insert_events(session, df, BANDING_EVENT_JSON)
+        insert_counts(session, df, BANDING_COUNT_JSON)
 
-        count_json = """
-            AGE_CODE SEX_CODE SPECIES_ID SPECIES_NAME TYPE """.split()
-        insert_counts(df, count_json)
+        session.commit()
 
     return to_place_id
 
 
-def insert_encounter_data(dir_, to_place_id, to_taxon_id, type_):
+@metrics.timed
+def insert_encounter_data(session, dir_, to_place_id, to_taxon_id, type_):
     """Insert raw encounter and recapture data."""
     util.log(f'Inserting {DATASET_ID} {type_} data')
 
@@ -92,28 +107,33 @@ def insert_encounter_data(dir_, to_place_id, to_taxon_id, type_):
         util.log(f'File {path}')
 
         df = read_csv(
-            path, 'E_LON_DECIMAL_DEGREES', 'E_LAT_DECIMAL_DEGREES', type_)
+            path, 'E_LON_DECIMAL_DEGREES', 'E_LAT_DECIMAL_DEGREES', type_,
+            ['ENCOUNTER_DATE', 'B_SPECIES_ID', 'E_COORD_PRECISION']
+            + ENCOUNTER_EVENT_JSON + ENCOUNTER_COUNT_JSON)
 
         df = filter_data(
             df, to_taxon_id,
             'ENCOUNTER_DATE', 'B_SPECIES_ID', 'E_COORD_PRECISION')
 
-        to_place_id = insert_places(df, to_place_id, 'E_COORD_PRECISION')
+        to_place_id = insert_places(
+            session, df, to_place_id, 'E_COORD_PRECISION')
 
-        event_json = """ BAND_NUM ENCOUNTER_DATE TYPE """.split()
-        insert_events(df, event_json)
+        insert_events(session, df, ENCOUNTER_EVENT_JSON)
+        insert_counts(session, df, ENCOUNTER_COUNT_JSON)
 
-        count_json = """
-            B_AGE_CODE B_SEX_CODE B_SPECIES_ID B_SPECIES_NAME MIN_AGE_AT_ENC
-            ORIGINAL_BAND TYPE """.split()
-        insert_counts(df, count_json)
+        session.commit()
 
     return to_place_id
 
 
-def read_csv(path, lng, lat, type_):
-    """Read in a CSV file."""
-    df = pd.read_csv(path, dtype='unicode').fillna('')
+@metrics.timed
+def read_csv(path, lng, lat, type_, columns):
+    """Read in only the columns we use from a CSV file."""
+    df = readers.read_csv(
+        path,
+        columns=set(columns + [lng, lat]),
+        categories=CATEGORIES,
+        numbers=[lng, lat])
     util.normalize_columns_names(df)
     df = df.rename(columns={lng: 'lng', lat: 'lat'})
     df['TYPE'] = type_
@@ -121,6 +141,7 @@ def read_csv(path, lng, lat, type_):
     return df
 
 
+@metrics.timed
 def filter_data(df, to_taxon_id, event_date, species_id, coord_precision):
     """Remove records that will not work for our analysis."""
     df['date'] = pd.to_datetime(df[event_date], errors='coerce')
@@ -138,7 +159,8 @@ def filter_data(df, to_taxon_id, event_date, species_id, coord_precision):
     return df
 
 
-def insert_places(df, to_place_id, coord_precision):
+@metrics.timed
+def insert_places(session, df, to_place_id, coord_precision):
     """Insert place records."""
     util.filter_lng_lat(df, 'lng', 'lat')
 
@@ -153,12 +175,12 @@ def insert_places(df, to_place_id, coord_precision):
     old_places = places['place_key'].isin(to_place_id)
     places = places[~old_places]
 
-    places['place_id'] = db.create_ids(places, 'places')
+    places['place_id'] = db.create_ids(session, places, 'places')
 
     places['place_json'] = util.json_object(places, [coord_precision])
+    places['geohash'] = geohash.encode(places.lng, places.lat)
 
-    places.loc[:, db.PLACE_FIELDS].to_sql(
-        'places', db.connect(), if_exists='append', index=False)
+    db.insert_records(session, 'places', places.loc[:, db.PLACE_FIELDS])
 
     new_place_ids = places.set_index('place_key')['place_id'].to_dict()
     to_place_id = {**to_place_id, **new_place_ids}
@@ -168,30 +190,31 @@ def insert_places(df, to_place_id, coord_precision):
     return to_place_id
 
 
-def insert_events(df, event_json):
+@metrics.timed
+def insert_events(session, df, event_json):
     """Insert event records."""
-    df['event_id'] = db.create_ids(df, 'events')
-    df['year'] = df['date'].dt.strftime('%Y')
-    df['day'] = df['date'].dt.strftime('%j')
+    df['event_id'] = db.create_ids(session, df, 'events')
+    df['year'] = dates.year(df['date'])
+    df['day'] = dates.day(df['date'])
     df['started'] = None
     df['ended'] = None
 
     df['event_json'] = util.json_object(df, event_json)
 
-    df.loc[:, db.EVENT_FIELDS].to_sql(
-        'events', db.connect(), if_exists='append', index=False)
+    db.insert_records(session, 'events', df.loc[:, db.EVENT_FIELDS])
 
 
-def insert_counts(df, count_json):
+@metrics.timed
+def insert_counts(session, df, count_json):
     """Insert count records."""
-    df['count_id'] = db.create_ids(df, 'counts')
+    df['count_id'] = db.create_ids(session, df, 'counts')
     df['count'] = 1
 
     df['count_json'] = util.json_object(df, count_json)
 
-    df.loc[:, db.COUNT_FIELDS].to_sql(
-        'counts', db.connect(), if_exists='append', index=False)
+    db.insert_records(session, 'counts', df.loc[:, db.COUNT_FIELDS])
 
 
 if __name__ == '__main__':
-    ingest()
+    with db.IngestSession() as SESSION:
+        ingest(SESSION)
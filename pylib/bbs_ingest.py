@@ -5,31 +5,45 @@ from pathlib import Path
 
 import pandas as pd
 
-from . import db, util
+from . import dates, db, geohash, metrics, util
+from .delta import Delta, key_hashes
 from .util import log
 
 DATASET_ID = 'bbs'
 RAW_DIR = Path('data') / 'raw' / DATASET_ID
 BBS_DB = str(RAW_DIR / 'breed-bird-survey.sqlite.db')
 
+NATURAL_KEYS = {
+    'places': ['statenum', 'route'],
+    'events': ['routedataid'],
+    'counts': ['record_id']}
 
-def ingest():
+
+def ingest(session):
     """Ingest Breed Bird Survey data."""
-    db.delete_dataset_records(DATASET_ID)
+    if not session.incremental:
+        db.delete_dataset_records(session, DATASET_ID)
 
-    db.insert_dataset({
+    db.insert_dataset(session, {
         'dataset_id': DATASET_ID,
         'title': 'North American Breeding Bird Survey (BBS)',
         'version': '2016.0',
         'url': 'https://www.pwrc.usgs.gov/bbs/'})
 
-    to_taxon_id = insert_taxa()
-    to_place_id = insert_places()
-    to_event_id = insert_events(to_place_id)
-    insert_counts(to_event_id, to_taxon_id)
+    deltas = {table: Delta(session, table, DATASET_ID, keys, repeats=False)
+              for table, keys in NATURAL_KEYS.items()}
+
+    to_taxon_id = insert_taxa(session)
+    to_place_id = insert_places(session, deltas['places'])
+    to_event_id = insert_events(session, deltas['events'], to_place_id)
+    insert_counts(session, deltas['counts'], to_event_id, to_taxon_id)
+
+    for table in ['counts', 'events', 'places']:
+        deltas[table].delete_missing()
 
 
-def insert_taxa():
+@metrics.timed
+def insert_taxa(session):
     """Insert taxa."""
     log(f'Inserting {DATASET_ID} taxa')
 
@@ -44,8 +58,8 @@ def insert_taxa():
         inplace=True)
 
     taxa = raw_taxa.copy()
-    taxa = db.drop_duplicate_taxa(taxa)
-    taxa['taxon_id'] = db.create_ids(taxa, 'taxa')
+    taxa = db.drop_duplicate_taxa(session, taxa)
+    taxa['taxon_id'] = db.create_ids(session, taxa, 'taxa')
     taxa.taxon_id = taxa.taxon_id.astype(int)
     taxa['class'] = 'aves'
     taxa['group'] = None
@@ -53,61 +67,57 @@ def insert_taxa():
     taxa['category'] = None
     fields = 'species_id aou french_common_name spanish_common_name'.split()
     taxa['taxon_json'] = util.json_object(taxa, fields)
-    taxa.loc[:, db.TAXON_FIELDS].to_sql(
-        'taxa', db.connect(), if_exists='append', index=False)
+    db.insert_records(session, 'taxa', taxa.loc[:, db.TAXON_FIELDS])
 
     raw_taxa = raw_taxa.set_index('sci_name')
     sql = """SELECT * FROM taxa"""
-    taxa = pd.read_sql(sql, db.connect()).set_index('sci_name')
+    taxa = pd.read_sql(sql, session.cxn).set_index('sci_name')
     taxa = taxa.merge(raw_taxa, left_index=True, right_index=True)
-    db.update_taxa_json(taxa, fields)
+    db.update_taxa_json(session, taxa, fields)
 
     to_taxon_id = taxa.set_index('aou').taxon_id.to_dict()
     return to_taxon_id
 
 
-def insert_places():
-    """Insert places."""
+@metrics.timed
+def insert_places(session, delta):
+    """Insert or update places."""
     log(f'Inserting {DATASET_ID} places')
 
     sql = """SELECT * FROM breed_bird_survey_routes"""
     raw_places = pd.read_sql(sql, db.connect(BBS_DB))
 
     places = pd.DataFrame()
-    raw_places['place_id'] = db.create_ids(raw_places, 'places')
-    places['place_id'] = raw_places['place_id']
-    places['dataset_id'] = DATASET_ID
     places['lng'] = raw_places['longitude']
     places['lat'] = raw_places['latitude']
     places['radius'] = 1609.344 * 25  # twenty-five miles in meters
+    places['geohash'] = geohash.encode(places.lng, places.lat)
 
     fields = """countrynum statenum route routename active stratum bcr
         routetypeid routetypedetailid""".split()
     places['place_json'] = util.json_object(raw_places, fields)
 
-    places.to_sql('places', db.connect(), if_exists='append', index=False)
+    raw_places['place_id'] = delta.save(
+        places, key_hashes(raw_places.loc[:, NATURAL_KEYS['places']]))
 
     # Build dictionary to map events to place IDs
     return raw_places.set_index(['statenum', 'route']).place_id.to_dict()
 
 
-def insert_events(to_place_id):
-    """Insert events."""
+@metrics.timed
+def insert_events(session, delta, to_place_id):
+    """Insert or update events."""
     log(f'Inserting {DATASET_ID} events')
 
     sql = """SELECT * FROM breed_bird_survey_weather"""
     raw_events = pd.read_sql(sql, db.connect(BBS_DB))
 
     events = pd.DataFrame()
-
-    raw_events['event_id'] = db.create_ids(raw_events, 'events')
-    events['event_id'] = raw_events['event_id']
-    events['dataset_id'] = DATASET_ID
     raw_events['place_key'] = tuple(zip(raw_events.statenum, raw_events.route))
     events['place_id'] = raw_events.place_key.map(to_place_id)
     events['year'] = raw_events['year']
-    events['day'] = pd.to_datetime(raw_events.loc[:, ['year', 'month', 'day']])
-    events['day'] = events['day'].dt.strftime('%j')
+    events['day'] = dates.day(dates.from_parts(
+        raw_events['year'], raw_events['month'], raw_events['day']))
     events['started'] = raw_events['starttime']
     convert_to_time(events, 'started')
     events['ended'] = raw_events['endtime']
@@ -117,7 +127,9 @@ def insert_events(to_place_id):
         totalspp starttemp endtemp tempscale startwind endwind startsky endsky
         assistant runtype""".split()
     events['event_json'] = util.json_object(raw_events, fields)
-    events.to_sql('events', db.connect(), if_exists='append', index=False)
+
+    raw_events['event_id'] = delta.save(
+        events, key_hashes(raw_events.loc[:, NATURAL_KEYS['events']]))
 
     # Build dictionary to map events to place IDs
     return raw_events.set_index(
@@ -127,15 +139,13 @@ def insert_events(to_place_id):
 def convert_to_time(df, column):
     """Convert the time field from int hMM format to HH:MM format."""
     is_na = pd.to_numeric(df[column], errors='coerce').isna()
-    df[column] = df[column].fillna(0).astype(int).astype(str)
-    df[column] = df[column].str.pad(4, fillchar='0')
-    df[column] = pd.to_datetime(df[column], format='%H%M', errors='coerce')
-    df[column] = df[column].dt.strftime('%H:%M')
+    df[column] = dates.to_hh_mm(dates.hmm_to_minutes(df[column]))
     df.loc[is_na, column] = ''
 
 
-def insert_counts(to_event_id, to_taxon_id):
-    """Insert counts."""
+@metrics.timed
+def insert_counts(session, delta, to_event_id, to_taxon_id):
+    """Insert or update counts."""
     log(f'Inserting {DATASET_ID} counts')
 
     sql = """SELECT * FROM breed_bird_survey_counts"""
@@ -143,8 +153,6 @@ def insert_counts(to_event_id, to_taxon_id):
 
     raw_counts['taxon_id'] = raw_counts.aou.map(to_taxon_id)
     counts = pd.DataFrame()
-    counts['count_id'] = db.create_ids(raw_counts, 'counts')
-    counts['dataset_id'] = DATASET_ID
     raw_counts['event_key'] = tuple(zip(
         raw_counts.statenum,
         raw_counts.route,
@@ -158,9 +166,12 @@ def insert_counts(to_event_id, to_taxon_id):
         count20 count30 count40 count50 stoptotal""".split()
     counts['count_json'] = util.json_object(raw_counts, fields)
 
-    counts = counts[counts.event_id.notna() & counts.taxon_id.notna()]
-    counts.to_sql('counts', db.connect(), if_exists='append', index=False)
+    keep = counts.event_id.notna() & counts.taxon_id.notna()
+    delta.save(
+        counts[keep],
+        key_hashes(raw_counts.loc[keep, NATURAL_KEYS['counts']]))
 
 
 if __name__ == '__main__':
-    ingest()
+    with db.IngestSession() as SESSION:
+        ingest(SESSION)
@@ -2,7 +2,10 @@
 
 from pathlib import Path
 import pandas as pd
+from . import dates
 from . import db
+from . import geohash
+from . import metrics
 from . import util
 from .util import log
 
@@ -16,29 +19,28 @@ PLANT_CSV = RAW_DIR / f'{FILE_DATE}_Plant.csv'
 SITE_CSV = RAW_DIR / f'{FILE_DATE}_Site.csv'
 
 
-def ingest():
+def ingest(session):
     """Ingest the data."""
-    db.delete_dataset_records(DATASET_ID)
+    db.delete_dataset_records(session, DATASET_ID)
 
-    db.insert_dataset({
+    db.insert_dataset(session, {
         'dataset_id': DATASET_ID,
         'title': 'Caterpillar Counts',
         'version': '2018-09-18',
         'url': ('https://caterpillarscount.unc.edu/'
                 'iuFYr1xREQOp2ioB5MHvnCTY39UHv2/')})
 
-    to_taxon_id = insert_taxa()
-    to_place_id = insert_places()
-    to_event_id = insert_events(to_place_id)
-    insert_counts(to_event_id, to_taxon_id)
+    to_taxon_id = insert_taxa(session)
+    to_place_id = insert_places(session)
+    to_event_id = insert_events(session, to_place_id)
+    insert_counts(session, to_event_id, to_taxon_id)
 
 
-def insert_taxa():
+@metrics.timed
+def insert_taxa(session):
     """Insert taxa."""
     log(f'Inserting {DATASET_ID} taxa')
 
-    cxn = db.connect()
-
     taxa = pd.read_csv(SIGHTINGS_CSV, encoding='ISO-8859-1')
 
     firsts = taxa.Group.duplicated(keep='first')
@@ -54,17 +56,19 @@ def insert_taxa():
     taxa['target'] = None
     taxa['common_name'] = ''
 
-    taxa = db.drop_duplicate_taxa(taxa)
-    taxa['taxon_id'] = db.create_ids(taxa, 'taxa')
+    taxa = db.drop_duplicate_taxa(session, taxa)
+    taxa['taxon_id'] = db.create_ids(session, taxa, 'taxa')
     taxa.taxon_id = taxa.taxon_id.astype(int)
 
-    taxa.to_sql('taxa', cxn, if_exists='append', index=False)
+    db.insert_records(session, 'taxa', taxa)
 
     sql = """SELECT sci_name, taxon_id FROM taxa WHERE "group" IS NOT NULL"""
-    return pd.read_sql(sql, cxn).set_index('sci_name').taxon_id.to_dict()
+    return pd.read_sql(sql, session.cxn).set_index(
+        'sci_name').taxon_id.to_dict()
 
 
-def insert_places():
+@metrics.timed
+def insert_places(session):
     """Insert places."""
     log(f'Inserting {DATASET_ID} places')
 
@@ -72,7 +76,7 @@ def insert_places():
 
     places = pd.DataFrame()
 
-    raw_places['place_id'] = db.create_ids(raw_places, 'places')
+    raw_places['place_id'] = db.create_ids(session, raw_places, 'places')
     places['place_id'] = raw_places['place_id']
 
     places['dataset_id'] = DATASET_ID
@@ -81,16 +85,19 @@ def insert_places():
 
     places['lat'] = raw_places['Latitude']
 
+    places['geohash'] = geohash.encode(places.lng, places.lat)
+
     fields = """ID Name Description Region""".split()
     places['place_json'] = util.json_object(raw_places, fields)
 
-    places.to_sql('places', db.connect(), if_exists='append', index=False)
+    db.insert_records(session, 'places', places)
 
     # Build dictionary to map events to place IDs
     return raw_places.set_index('ID').place_id.to_dict()
 
 
-def insert_events(to_place_id):
+@metrics.timed
+def insert_events(session, to_place_id):
     """Insert events."""
     log(f'Inserting {DATASET_ID} events')
 
@@ -102,15 +109,15 @@ def insert_events(to_place_id):
 
     events = pd.DataFrame()
 
-    raw_events['event_id'] = db.create_ids(raw_events, 'events')
+    raw_events['event_id'] = db.create_ids(session, raw_events, 'events')
     events['event_id'] = raw_events['event_id']
 
     events['place_id'] = raw_events.SiteFK.map(to_place_id)
 
     raw_events['raw_date'] = pd.to_datetime(
         raw_events.LocalDate, format='%Y-%m-%d', errors='coerce')
-    events['year'] = raw_events.raw_date.dt.strftime('%Y')
-    events['day'] = raw_events.raw_date.dt.strftime('%j')
+    events['year'] = dates.year(raw_events.raw_date)
+    events['day'] = dates.day(raw_events.raw_date)
 
     events['started'] = raw_events['LocalTime'].str[:5]
 
@@ -122,20 +129,21 @@ def insert_events(to_place_id):
         SubmittedThroughApp MinimumTemperature MaximumTemperature""".split()
     events['event_json'] = util.json_object(raw_events, fields)
 
-    events.to_sql('events', db.connect(), if_exists='append', index=False)
+    db.insert_records(session, 'events', events)
 
     # Build dictionary to map events to place IDs
     return raw_events.set_index('ID_survey').event_id.to_dict()
 
 
-def insert_counts(to_event_id, to_taxon_id):
+@metrics.timed
+def insert_counts(session, to_event_id, to_taxon_id):
     """Insert counts."""
     log(f'Inserting {DATASET_ID} counts')
 
     raw_counts = pd.read_csv(SIGHTINGS_CSV, encoding='ISO-8859-1')
 
     counts = pd.DataFrame()
-    counts['count_id'] = db.create_ids(raw_counts, 'counts')
+    counts['count_id'] = db.create_ids(session, raw_counts, 'counts')
 
     counts['event_id'] = raw_counts.SurveyFK.map(to_event_id)
     counts['taxon_id'] = raw_counts.Group.map(to_taxon_id)
@@ -151,8 +159,9 @@ def insert_counts(to_event_id, to_taxon_id):
     has_count = counts['count'].notna()
     counts = counts.loc[has_event_id & has_taxon_id & has_count, :]
 
-    counts.to_sql('counts', db.connect(), if_exists='append', index=False)
+    db.insert_records(session, 'counts', counts)
 
 
 if __name__ == '__main__':
-    ingest()
+    with db.IngestSession() as SESSION:
+        ingest(SESSION)
@@ -11,16 +11,16 @@ DATASET_ID = 'clements'
 TAXON_DIR = Path('data') / 'raw' / 'taxonomy'
 
 
-def ingest():
+def ingest(session):
     """Extract, transform, & load Clements taxonomy into the database."""
     csv_path = \
         TAXON_DIR / 'eBird-Clements-v2018-integrated-checklist-August-2018.csv'
 
-    db.delete_dataset_records(DATASET_ID)
+    db.delete_dataset_records(session, DATASET_ID)
 
     log(f'Ingesting {DATASET_ID} data')
 
-    db.insert_dataset({
+    db.insert_dataset(session, {
         'dataset_id': DATASET_ID,
         'version': 'August 2018',
         'title': 'eBird Clements integrated checklists',
@@ -35,7 +35,7 @@ def ingest():
     taxa.rename(columns=lambda x: x.replace(' ', '_'), inplace=True)
 
     taxa.sci_name = taxa.sci_name.str.split().str.join(' ')
-    taxa = db.drop_duplicate_taxa(taxa)
+    taxa = db.drop_duplicate_taxa(session, taxa)
 
     taxa['genus'] = taxa.sci_name.str.split().str[0]
     taxa['class'] = 'aves'
@@ -47,10 +47,10 @@ def ingest():
     fields = 'eBird_species_code_2018 sort_v2018 range extinct'.split()
     taxa['taxon_json'] = util.json_object(taxa, fields)
 
-    taxa['taxon_id'] = db.create_ids(taxa, 'taxa')
-    taxa.loc[:, db.TAXON_FIELDS].to_sql(
-        'taxa', db.connect(), if_exists='append', index=False)
+    taxa['taxon_id'] = db.create_ids(session, taxa, 'taxa')
+    db.insert_records(session, 'taxa', taxa.loc[:, db.TAXON_FIELDS])
 
 
 if __name__ == '__main__':
-    ingest()
+    with db.IngestSession() as SESSION:
+        ingest(SESSION)
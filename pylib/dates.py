@@ -0,0 +1,72 @@
+"""
+Vectorized date & time conversions for the event fields.
+
+Events store the year & day of the year as integers and the start & end
+times as HH:MM strings. Times are handled as minutes after midnight so that
+arithmetic on them is plain float math. They are only turned into strings at
+the end, by a table lookup.
+"""
+
+import numpy as np
+import pandas as pd
+
+MINUTES_PER_DAY = 24 * 60
+HH_MM = np.array(
+    [f'{h:02d}:{m:02d}' for h in range(24) for m in range(60)], dtype=object)
+
+
+def from_parts(year, month, day):
+    """Build datetimes from year, month, & day columns."""
+    parts = pd.DataFrame({'year': year, 'month': month, 'day': day})
+    return pd.to_datetime(parts)
+
+
+def year(dates):
+    """Get the year of each datetime."""
+    return dates.dt.year
+
+
+def day(dates):
+    """Get the day of the year of each datetime."""
+    return dates.dt.dayofyear
+
+
+def minutes(datetimes):
+    """Get the minutes after midnight of each datetime. Seconds are kept."""
+    return (datetimes.dt.hour * 60 + datetimes.dt.minute
+            + datetimes.dt.second / 60.0)
+
+
+def parse_minutes(times, format_='%H:%M:%S', errors='raise'):
+    """
+    Parse time strings into minutes after midnight.
+
+    There are few distinct times in a column so we parse each one once.
+    """
+    codes, uniques = pd.factorize(times)
+    parsed = pd.Series(pd.to_datetime(uniques, format=format_, errors=errors))
+    parsed = np.append(minutes(parsed).to_numpy(dtype=float), np.nan)
+    return pd.Series(parsed[codes], index=times.index)
+
+
+def hmm_to_minutes(times):
+    """Convert integer hMM times (930 is 9:30) into minutes after midnight."""
+    times = np.trunc(pd.to_numeric(times, errors='coerce'))
+    hours, mins = times // 100, times % 100
+    good = hours.between(0, 23) & mins.between(0, 59)
+    return (hours * 60 + mins).where(good)
+
+
+def to_hh_mm(mins):
+    """
+    Format minutes after midnight as HH:MM strings.
+
+    Partial minutes are dropped and times past midnight wrap around like a
+    clock. Missing times become None.
+    """
+    values = mins.to_numpy(dtype=float)
+    is_na = np.isnan(values)
+    values = np.floor(np.where(is_na, 0.0, values)).astype(np.int64)
+    times = HH_MM[values % MINUTES_PER_DAY]
+    times[is_na] = None
+    return pd.Series(times, index=mins.index)
@@ -1,27 +1,68 @@
 """Common functions for dealing with database connections."""
 
-from os import fspath, remove, makedirs
-from os.path import abspath, exists, join
+from os import fspath, remove
+from os.path import abspath, exists
 from datetime import datetime
+import re
 import sqlite3
 import subprocess
+import threading
+from collections import defaultdict
+from itertools import islice
 from pathlib import Path
+from timeit import default_timer
 import pandas as pd
+from . import metrics
 from .util import log, update_json
 
 
 PROCESSED = Path('data') / 'processed'
 DB_FILE = abspath(PROCESSED / 'sightings.sqlite.db')
 SCRIPT_PATH = Path('sql')
+INDEX_SCRIPT = 'create_indexes_sqlite.sql'
+POSTGRES_INDEX_SCRIPT = 'create_indexes_postgres.sql'
+PSQL = 'psql -d sightings'
 
 SPLIT_TABLES = 'places events counts'.split()
 TABLES = 'datasets taxa'.split() + SPLIT_TABLES
+ID_TABLES = ['taxa'] + SPLIT_TABLES
 TAXON_FIELDS = """taxon_id sci_name group class order family genus common_name
     category target taxon_json""".split()
-PLACE_FIELDS = 'place_id dataset_id lng lat radius place_json'.split()
+PLACE_FIELDS = """place_id dataset_id lng lat radius place_json
+    geohash""".split()
 EVENT_FIELDS = """event_id place_id dataset_id year day started ended
     event_json""".split()
 COUNT_FIELDS = 'count_id event_id taxon_id dataset_id count count_json'.split()
+FIELDS = {
+    'places': PLACE_FIELDS,
+    'events': EVENT_FIELDS,
+    'counts': COUNT_FIELDS}
+JSON_COLUMNS = {
+    'taxa': 'taxon_json',
+    'places': 'place_json',
+    'events': 'event_json',
+    'counts': 'count_json'}
+
+# JSON fields that we look records up by. Each entry gets an expression index
+# in SQLite3 & PostgreSQL, limited to the dataset's rows if there is one.
+# Query them with json_field() so that the expressions match the index.
+HOT_JSON = [
+    {'table': 'events', 'dataset_id': 'ebird',
+     'keys': ['SAMPLING_EVENT_IDENTIFIER']},
+    {'table': 'taxa', 'keys': ['eBird_species_code_2018']}]
+
+CACHE_SIZE = -2**20  # Negative values are in KiB, so this is 1 GiB
+BATCH_SIZE = 100_000
+
+SQL_TYPES = {
+    'floating': 'REAL',
+    'integer': 'INTEGER',
+    'boolean': 'INTEGER',
+    'timedelta64': 'INTEGER',
+    'datetime64': 'TIMESTAMP',
+    'datetime': 'TIMESTAMP',
+    'date': 'DATE',
+    'time': 'TIME'}
 
 
 def connect(path=None):
@@ -35,17 +76,202 @@ def connect(path=None):
     return cxn
 
 
-def create():
-    """Create the database."""
+class IngestSession:
+    """
+    Share one connection and transaction across an ingest.
+
+    The connection is tuned for bulk loading: we turn off syncing and keep
+    temporary data in memory. Changes are only committed when the ingest
+    asks for it (per dataset or per chunk) or when the session is closed.
+    If the ingest fails then the uncommitted work is rolled back.
+
+    The session also carries the run options for the ingest modules. The
+    workers option is the number of processes to use for datasets that can
+    transform their data in parallel. The resume option tells datasets that
+    save checkpoints to continue from their last one. The incremental option
+    tells datasets with natural keys to update their records in place
+    instead of deleting & reloading them (see delta.py).
+
+    When the session closes it logs how fast rows were written to each table.
+    """
+
+    def __init__(self, path=None, workers=1, resume=False, incremental=False):
+        self.workers = workers
+        self.resume = resume
+        self.incremental = incremental
+        self.cxn = connect(path)
+        self.cxn.execute('PRAGMA synchronous = OFF')
+        self.cxn.execute(f'PRAGMA cache_size = {CACHE_SIZE}')
+        self.cxn.execute('PRAGMA temp_store = MEMORY')
+        self.ids = IdAllocator(self.cxn)
+        self.writes = defaultdict(lambda: [0, 0.0])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.cxn.rollback()
+        else:
+            self.cxn.commit()
+            self.log_writes()
+        self.cxn.close()
+
+    def inserted(self, table, rows, seconds):
+        """Tally rows written to a table and how long it took."""
+        self.writes[table][0] += rows
+        self.writes[table][1] += seconds
+
+    def log_writes(self):
+        """Log the insert rate for each table."""
+        for table, (rows, seconds) in self.writes.items():
+            rate = rows / seconds if seconds else 0.0
+            log(f'Inserted {rows:,} {table} rows '
+                f'in {seconds:.1f} s ({rate:,.0f} rows/s)')
+
+    def commit(self):
+        """Commit the current transaction."""
+        self.cxn.commit()
+
+
+class IdAllocator:
+    """
+    Hand out contiguous ID ranges for the core tables.
+
+    The high-water mark of each table is read once when the allocator is
+    created and all later IDs are assigned in memory. This means that every
+    insert into the core tables must get its IDs from here. Reserving a range
+    is thread safe. Worker processes should not share an allocator, they ask
+    the process that owns the session for their IDs instead.
+    """
+
+    def __init__(self, cxn):
+        self.lock = threading.Lock()
+        self.next = {t: next_id(cxn, t) for t in ID_TABLES}
+
+    def reserve(self, table, count):
+        """Reserve the next count IDs for the table."""
+        with self.lock:
+            start = self.next[table]
+            self.next[table] += count
+        return range(start, start + count)
+
+    def refresh(self, cxn, table):
+        """Re-read the high-water mark after an insert that bypassed us."""
+        with self.lock:
+            self.next[table] = max(self.next[table], next_id(cxn, table))
+
+
+def create(defer_indexes=False):
+    """
+    Create the database.
+
+    If we are deferring the indexes then only the tables are created. Build
+    the indexes after the bulk load with create_indexes().
+    """
     log(f'Creating database')
 
-    script = fspath(SCRIPT_PATH / 'create_db_sqlite.sql')
-    cmd = f'sqlite3 {DB_FILE} < {script}'
+    scripts = ['create_db_sqlite.sql']
+    if not defer_indexes:
+        scripts.append(INDEX_SCRIPT)
 
     if exists(DB_FILE):
         remove(DB_FILE)
 
-    subprocess.check_call(cmd, shell=True)
+    for script in scripts:
+        script = fspath(SCRIPT_PATH / script)
+        cmd = f'sqlite3 {DB_FILE} < {script}'
+        subprocess.check_call(cmd, shell=True)
+
+    if not defer_indexes:
+        cxn = connect()
+        for _, sql in hot_json_indexes():
+            cxn.execute(sql)
+        cxn.commit()
+        cxn.close()
+
+
+def index_statements():
+    """Get the kind, name, & SQL of everything in the index script."""
+    script = (SCRIPT_PATH / INDEX_SCRIPT).read_text()
+    script = re.sub(r'--.*$', '', script, flags=re.MULTILINE)
+
+    # Triggers have semicolons inside them so split on complete statements
+    statements, sql = [], ''
+    for part in script.split(';'):
+        sql += part + ';'
+        if not sql.strip(' \n;'):
+            sql = ''
+        elif sqlite3.complete_statement(sql):
+            statements.append(sql.strip())
+            sql = ''
+
+    pattern = r'(INDEX|TABLE|TRIGGER)\s+IF\s+NOT\s+EXISTS\s+(\w+)'
+    kinds = [re.search(pattern, s).groups() for s in statements]
+    statements = [(k, n, s) for (k, n), s in zip(kinds, statements)]
+    return statements + [('INDEX', n, s) for n, s in hot_json_indexes()]
+
+
+def json_field(table, key, dialect='sqlite'):
+    """Get the SQL expression for a field in a table's JSON column."""
+    column = JSON_COLUMNS[table]
+    if dialect == 'postgres':
+        return f"({column} ->> '{key}')"
+    return f"json_extract({column}, '$.{key}')"
+
+
+def hot_json_indexes(dialect='sqlite'):
+    """Get the name & SQL of the indexes on the HOT_JSON fields."""
+    return [hot_json_index(hot, dialect) for hot in HOT_JSON]
+
+
+def hot_json_index(hot, dialect='sqlite'):
+    """Get the name & SQL of the index for one HOT_JSON entry."""
+    table, dataset_id = hot['table'], hot.get('dataset_id')
+    name = '_'.join(x for x in (table, dataset_id, 'json') if x)
+
+    fields = ', '.join(json_field(table, k, dialect) for k in hot['keys'])
+    exists_ = 'IF NOT EXISTS ' if dialect == 'sqlite' else ''
+    sql = f'CREATE INDEX {exists_}{name} ON {table} ({fields})'
+    if dataset_id:
+        sql += f" WHERE dataset_id = '{dataset_id}'"
+    return name, sql
+
+
+def drop_indexes(session):
+    """Drop the secondary indexes so that a bulk load doesn't update them."""
+    log('Dropping indexes')
+    for kind, name, _ in reversed(index_statements()):
+        session.cxn.execute(f'DROP {kind} IF EXISTS {name}')
+    session.commit()
+
+
+def create_indexes(session):
+    """
+    Build any missing secondary indexes and report how long each one took.
+
+    SQLite sorts the whole table for each index so this is much faster than
+    maintaining the index one row at a time during the load. The sort can
+    use the session's workers as helper threads.
+    """
+    log('Creating indexes')
+    session.cxn.execute(f'PRAGMA threads = {session.workers}')
+    for kind, name, sql in index_statements():
+        start = default_timer()
+        session.cxn.execute(sql)
+        if name == 'places_rtree':
+            fill_places_rtree(session)
+        session.commit()
+        log(f'{kind.title()} {name} took {default_timer() - start:.1f} s')
+
+
+def fill_places_rtree(session):
+    """Load all of the places into the R*Tree if it was just created."""
+    if session.cxn.execute('SELECT 1 FROM places_rtree LIMIT 1').fetchone():
+        return
+    session.cxn.execute("""
+        INSERT INTO places_rtree
+        SELECT place_id, lng, lng, lat, lat FROM places""")
 
 
 def backup_database():
@@ -57,48 +283,200 @@ def backup_database():
     subprocess.check_call(cmd, shell=True)
 
 
-def drop_table(table):
+def drop_table(session, table):
     """Drop the given table."""
-    cxn = connect()
-    sql = f"""DROP TABLE IF EXISTS {table};"""
-    cxn.executescript(sql)
+    session.cxn.execute(f"""DROP TABLE IF EXISTS {table};""")
 
 
-def insert_dataset(dataset):
-    """Insert the DB version."""
-    cxn = connect()
-    sql = """INSERT INTO datasets (dataset_id, version, title, url)
+def insert_dataset(session, dataset):
+    """Insert the DB version, replacing it if the dataset is already there."""
+    sql = """INSERT OR REPLACE INTO datasets (dataset_id, version, title, url)
                   VALUES (:dataset_id, :version, :title, :url)"""
-    cxn.execute(sql, dataset)
-    cxn.commit()
+    session.cxn.execute(sql, dataset)
 
 
-def delete_dataset_records(dataset_id):
+def delete_dataset_records(session, dataset_id):
     """Clear dataset from the database."""
     log(f'Deleting old {dataset_id} records')
 
-    cxn = connect()
+    cxn = session.cxn
     cxn.execute('DELETE FROM datasets WHERE dataset_id = ?', (dataset_id, ))
     cxn.execute('DELETE FROM places WHERE dataset_id = ?', (dataset_id, ))
     cxn.execute('DELETE FROM events WHERE dataset_id = ?', (dataset_id, ))
     cxn.execute('DELETE FROM counts WHERE dataset_id = ?', (dataset_id, ))
-    cxn.commit()
+    delete_checkpoint(session, dataset_id)
+
+
+def delete_checkpoint(session, dataset_id):
+    """Forget the dataset's checkpoint so that it can't be resumed."""
+    if table_exists(session.cxn, 'checkpoints'):
+        session.cxn.execute(
+            'DELETE FROM checkpoints WHERE dataset_id = ?', (dataset_id, ))
+
+
+def create_checkpoints(session):
+    """
+    Create the table that records how far a chunked ingest has gotten.
+
+    This is bookkeeping for the ingest and not part of the exported data.
+    """
+    session.cxn.execute("""
+        CREATE TABLE IF NOT EXISTS checkpoints (
+          dataset_id   VARCHAR(12) NOT NULL PRIMARY KEY,
+          chunk        INTEGER NOT NULL,
+          position     BIGINT  NOT NULL,
+          raw_position BIGINT,
+          saved        TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""")
+
+
+def save_checkpoint(session, dataset_id, chunk, position, raw_position=None):
+    """
+    Record the last chunk that was ingested.
+
+    This should be in the same transaction as the chunk's data so that the
+    two are committed together.
+    """
+    sql = """INSERT OR REPLACE INTO checkpoints
+                    (dataset_id, chunk, position, raw_position)
+             VALUES (?, ?, ?, ?)"""
+    session.cxn.execute(sql, (dataset_id, chunk, position, raw_position))
+
+
+def get_checkpoint(session, dataset_id):
+    """Get the last checkpoint for the dataset or None if there isn't one."""
+    if not table_exists(session.cxn, 'checkpoints'):
+        return None
+    sql = """SELECT chunk, position, raw_position
+               FROM checkpoints
+              WHERE dataset_id = ?"""
+    row = session.cxn.execute(sql, (dataset_id, )).fetchone()
+    if not row:
+        return None
+    return dict(zip(['chunk', 'position', 'raw_position'], row))
+
+
+def insert_records(session, table, df, batch_size=BATCH_SIZE, staged=False):
+    """
+    Append the data frame to the table.
+
+    Unlike DataFrame.to_sql() this does not commit, so the rows become part
+    of the session's current transaction. Each column is converted to Python
+    values in one go and the rows are handed to one prepared INSERT a batch
+    at a time.
+
+    If staged is set the rows are first loaded into an in-memory temp table
+    and then copied into the table with a single INSERT ... SELECT.
+    """
+    start = default_timer()
+
+    with metrics.stage(f'insert {table}', rows_in=df.shape[0]):
+        columns = ', '.join(f'"{c}"' for c in df.columns)
+        target = f'temp.staged_{table}' if staged else table
+
+        if staged:
+            session.cxn.execute(f"""
+                CREATE TEMP TABLE staged_{table} AS
+                SELECT {columns} FROM main.{table} WHERE 0""")
+
+        params = ', '.join('?' * df.shape[1])
+        sql = f'INSERT INTO {target} ({columns}) VALUES ({params})'
+        rows = zip(*[column_values(df.iloc[:, i])
+                     for i in range(df.shape[1])])
+        while batch := list(islice(rows, batch_size)):
+            session.cxn.executemany(sql, batch)
+
+        if staged:
+            session.cxn.execute(f"""
+                INSERT INTO main.{table} ({columns})
+                SELECT {columns} FROM temp.staged_{table}""")
+            session.cxn.execute(f'DROP TABLE temp.staged_{table}')
+
+        metrics.written(df.shape[0])
+
+    session.inserted(table, df.shape[0], default_timer() - start)
+
+
+def update_records(session, table, df, batch_size=BATCH_SIZE):
+    """Update the table's rows from the data frame, matched on their IDs."""
+    id_ = id_field(table)
+    fields = [c for c in df.columns if c != id_]
+
+    with metrics.stage(f'update {table}', rows_in=df.shape[0]):
+        sets = ', '.join(f'"{c}" = ?' for c in fields)
+        sql = f'UPDATE {table} SET {sets} WHERE {id_} = ?'
+        rows = zip(*[column_values(df[c]) for c in fields + [id_]])
+        while batch := list(islice(rows, batch_size)):
+            session.cxn.executemany(sql, batch)
+        metrics.written(df.shape[0])
+
+
+def delete_records(session, table, ids, batch_size=BATCH_SIZE):
+    """Delete the table's rows with the given IDs in one statement."""
+    id_ = id_field(table)
+
+    with metrics.stage(f'delete {table}', rows_in=len(ids)):
+        session.cxn.execute(
+            'CREATE TEMP TABLE doomed (id INTEGER PRIMARY KEY)')
+
+        rows = ((int(i), ) for i in ids)
+        while batch := list(islice(rows, batch_size)):
+            session.cxn.executemany(
+                'INSERT INTO temp.doomed VALUES (?)', batch)
+
+        session.cxn.execute(
+            f'DELETE FROM {table} WHERE {id_} IN (SELECT id FROM temp.doomed)')
+        session.cxn.execute('DROP TABLE temp.doomed')
+        metrics.written(len(ids))
+
+
+def replace_table(session, table, df, batch_size=BATCH_SIZE):
+    """
+    Replace the table with the data frame.
+
+    This is for scratch tables. The column types are guessed from the data
+    the same way DataFrame.to_sql() does it.
+    """
+    columns = ', '.join(
+        f'"{c}" {sql_type(df.iloc[:, i])}' for i, c in enumerate(df.columns))
+    session.cxn.execute(f'DROP TABLE IF EXISTS {table}')
+    session.cxn.execute(f'CREATE TABLE {table} ({columns})')
+    insert_records(session, table, df, batch_size=batch_size)
+
+
+def column_values(column):
+    """Convert a column to Python values with None for missing values."""
+    values = column.to_numpy(dtype=object)
+    is_na = column.isna().to_numpy()
+    if is_na.any():
+        values[is_na] = None
+    return values
 
 
-def create_ids(df, table):
+def sql_type(column):
+    """Guess the SQLite column type for a data frame column."""
+    guess = pd.api.types.infer_dtype(column, skipna=True)
+    return SQL_TYPES.get(guess, 'TEXT')
+
+
+def create_ids(session, df, table):
     """Get IDs to add to the dataframe."""
-    start = next_id(table)
-    return range(start, start + df.shape[0])
+    return session.ids.reserve(table, df.shape[0])
+
 
+def id_field(table):
+    """Get the name of the table's ID field."""
+    return 'taxon_id' if table == 'taxa' else table[:-1] + '_id'
 
-def next_id(table):
+
+def next_id(cxn, table):
     """Get the max value from the table's ID field."""
-    cxn = connect()
     if not table_exists(cxn, table):
         return 1
-    field = 'taxon_id' if table == 'taxa' else table[:-1] + '_id'
+    field = id_field(table)
     sql = 'SELECT COALESCE(MAX({}), 0) AS id FROM {}'.format(field, table)
-    return cxn.execute(sql).fetchone()[0] + 1
+    with metrics.stage(f'next_id {table}'):
+        return cxn.execute(sql).fetchone()[0] + 1
 
 
 def table_exists(cxn, table):
@@ -112,59 +490,47 @@ def table_exists(cxn, table):
     return results.fetchone()[0]
 
 
-def export_to_csv_files(export, export_path):
-    """Export the SQLite3 database to CSV files."""
-    log('Exporting into CSV files.')
+def create_postgres(defer_indexes=False):
+    """Create the PostgreSQL DB."""
+    run_postgres_script('create_db_postgres.sql')
+    if not defer_indexes:
+        create_postgres_indexes()
 
-    makedirs(export_path, exist_ok=True)
 
-    if export in TABLES:
-        log(f'Exporting {export}')
-        csv_file = join(export_path, f'{export}.csv')
-        cmd = f'sqlite3 -csv "{DB_FILE}" '
-        cmd += f'"select * from {export};" > "{csv_file}"'
-        subprocess.check_call(cmd, shell=True)
-    else:
-        for table in SPLIT_TABLES:
-            log(f'Exporting {export} {table}')
-            csv_file = join(export_path, f'{table}_{export}.csv')
-            sql = f"select * from {table} where dataset_id = '{export}';"
-            cmd = f'sqlite3 -csv "{DB_FILE}" '
-            cmd += f'"{sql}" > "{csv_file}"'
-            subprocess.check_call(cmd, shell=True)
+def create_postgres_indexes():
+    """Build the PostgreSQL keys, constraints, & indexes."""
+    log('Creating PostgreSQL indexes')
+    run_postgres_script(POSTGRES_INDEX_SCRIPT)
+    sql = ';\n'.join(s for _, s in hot_json_indexes('postgres')) + ';\n'
+    subprocess.run(f'{PSQL} -a', shell=True, input=sql, text=True, check=True)
 
 
-def create_postgres():
-    """Create the PostgreSQL DB."""
-    script = fspath(SCRIPT_PATH / 'create_db_postgres.sql')
-    cmd = f'psql -d sightings -a -f {script}'
+def run_postgres_script(script):
+    """Run an SQL script in the PostgreSQL DB with psql."""
+    script = fspath(SCRIPT_PATH / script)
+    cmd = f'{PSQL} -a -f {script}'
     subprocess.check_call(cmd, shell=True)
 
 
 def import_postgres():
     """Load data into the PostgreSQL database from CSV files."""
     log('Importing into PostgreSQL database')
-    script = fspath(SCRIPT_PATH / 'import_db_postgres.sql')
-    cmd = f'psql -d sightings -a -f {script}'
-    subprocess.check_call(cmd, shell=True)
+    run_postgres_script('import_db_postgres.sql')
 
 
-def drop_duplicate_taxa(taxa):
+def drop_duplicate_taxa(session, taxa):
     """Remove taxa already in the database from the data frame."""
-    cxn = connect()
-    existing = pd.read_sql('SELECT sci_name, taxon_id FROM taxa', cxn)
+    existing = pd.read_sql('SELECT sci_name, taxon_id FROM taxa', session.cxn)
     existing = existing.set_index('sci_name').taxon_id.to_dict()
     in_existing = taxa.sci_name.isin(existing)
     return taxa.loc[~in_existing, :].drop_duplicates('sci_name').copy()
 
 
-def update_taxa_json(taxa, fields):
+def update_taxa_json(session, taxa, fields):
     """Update json in the taxon_json with the data from the fields."""
     taxa.taxon_json = taxa.apply(
         lambda x: update_json(x, fields), axis='columns')
 
     batch = taxa.loc[:, ['taxon_json', 'taxon_id']].values.tolist()
-    cxn = connect()
     sql = """UPDATE taxa SET taxon_json = ? WHERE taxon_id = ?"""
-    cxn.executemany(sql, batch)
-    cxn.commit()
+    session.cxn.executemany(sql, batch)
@@ -0,0 +1,206 @@
+"""
+Read dBASE (DBF) files into data frames.
+
+A DBF file is a header, a list of field descriptors, and then fixed width
+records. We memory map the records as a NumPy structured array, with one
+bytes field per column, and decode them a chunk at a time. A column usually
+has few distinct values, so each distinct raw value is decoded once and then
+picked out for every row with one array lookup.
+
+Every value comes back as text, or None if it is empty, the same way that the
+old simpledbf to_dataframe() -> to_csv() -> pd.read_csv(dtype='unicode') round
+trip read it. Dates are YYYY-MM-DD and numbers are written the way pandas
+wrote them. An N column with any decimals or blanks in the file was a float
+column in pandas, so all of its numbers get a decimal point, 18 reads as
+'18.0'. F columns are always floats. Text that read_csv() takes for a missing
+value, like 'NA', is None.
+
+Decoded files are cached as Feather files keyed by the SHA-256 of the DBF
+file's contents. Reading them back skips the decoding and a changed DBF file
+gets a new cache entry. The cache needs pyarrow, without it we always decode.
+"""
+
+import datetime
+import os
+import struct
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from . import db, metrics
+from .util import log, sha256
+
+try:
+    from pyarrow import feather
+except ImportError:
+    feather = None
+
+CACHE_DIR = db.PROCESSED / 'dbf_cache'
+CACHE_VERSION = 2  # Bump this when the decoded values change
+CHUNK_ROWS = 1_000_000
+ENCODING = 'utf-8'
+DELETED = b'*'
+FIELD_END = 0x0D
+TRUE = b'TtYy'
+FALSE = b'FfNn'
+CSV_NA = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+          '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'n/a',
+          'nan', 'null'}  # pd.read_csv()'s default missing values'
+
+
+@metrics.timed
+def read_dbf(path, encoding=ENCODING, cache=True):
+    """Read the whole DBF file, from the cache if we have decoded it before."""
+    path = Path(path)
+    if not (cache and feather):
+        return pd.concat(chunks(path, encoding=encoding), ignore_index=True)
+
+    digest = sha256(path)
+    cached = CACHE_DIR / f'{path.stem}_{digest}_v{CACHE_VERSION}.feather'
+    if cached.exists():
+        return feather.read_table(cached).to_pandas()
+
+    log(f'Decoding {path}')
+    df = pd.concat(chunks(path, encoding=encoding), ignore_index=True)
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    temp = cached.with_suffix('.tmp')
+    feather.write_feather(df, temp)
+    os.replace(temp, cached)  # So that a crash can't leave half a file
+
+    return df
+
+
+def chunks(path, chunk_rows=CHUNK_ROWS, encoding=ENCODING):
+    """Decode the DBF file's records a chunk at a time."""
+    rows, header_size, dtype, fields = read_header(path)
+    columns = [name for name, _ in fields]
+
+    if rows == 0:
+        yield pd.DataFrame(columns=columns, dtype=object)
+        return
+
+    records = np.memmap(
+        path, dtype=dtype, mode='r', offset=header_size, shape=(rows, ))
+    fields = float_fields(records, fields)
+
+    for start in range(0, rows, chunk_rows):
+        chunk = records[start:start + chunk_rows]
+        chunk = chunk[chunk['deleted'] != DELETED]
+        yield pd.DataFrame({
+            name: decode(chunk[name], type_, encoding)
+            for name, type_ in fields}, columns=columns)
+
+
+def float_fields(records, fields):
+    """
+    Change the type of N fields that pandas would have read as floats to F.
+
+    That is an N field with a decimal or a blank in any record of the file.
+    """
+    live = records['deleted'] != DELETED
+    changed = []
+    for name, type_ in fields:
+        if type_ == 'N':
+            _, uniques = factorize(records[name][live])
+            if any(b'.' in v or decode_value(v, type_) is None
+                   for v in uniques):
+                type_ = 'F'
+        changed.append((name, type_))
+    return changed
+
+
+def read_header(path):
+    """
+    Get the record count, header size, record dtype, and fields of a file.
+
+    The fields are (name, type) pairs. The dtype lays the fields out at their
+    offsets in the record, after the deleted flag.
+    """
+    with open(path, 'rb') as in_file:
+        header = in_file.read(32)
+        rows, header_size, record_size = struct.unpack('<4xLHH20x', header)
+        descriptors = in_file.read(header_size - 32)
+
+    names, formats, offsets, fields = ['deleted'], ['S1'], [0], []
+    offset = 1
+    for start in range(0, len(descriptors), 32):
+        descriptor = descriptors[start:start + 32]
+        if descriptor[0] == FIELD_END or len(descriptor) < 32:
+            break
+        name = descriptor[:11].split(b'\x00')[0].decode('ascii')
+        type_ = chr(descriptor[11])
+        size = descriptor[16]
+        names.append(name)
+        formats.append(f'S{size}')
+        offsets.append(offset)
+        fields.append((name, type_))
+        offset += size
+
+    dtype = np.dtype({
+        'names': names,
+        'formats': formats,
+        'offsets': offsets,
+        'itemsize': record_size})
+    return rows, header_size, dtype, fields
+
+
+def decode(column, type_, encoding=ENCODING):
+    """Decode one column of raw field values."""
+    codes, uniques = factorize(column)
+    values = [decode_value(v, type_, encoding) for v in uniques]
+    values = np.array(values, dtype=object)
+    return values[codes]
+
+
+def factorize(column):
+    """
+    Get the codes & distinct values of a column of fixed width bytes.
+
+    Hashing bytes objects is slow so we cut each value into 8 byte words and
+    factorize those as integers, folding in one word at a time.
+    """
+    rows, width = column.shape[0], column.dtype.itemsize
+    words = np.zeros((rows, -(-width // 8) * 8), dtype=np.uint8)
+    words[:, :width] = np.ascontiguousarray(column).view(np.uint8).reshape(
+        rows, width)
+
+    codes = np.zeros(rows, dtype=np.int64)
+    for word in words.view(np.uint64).T:
+        word_codes, word_uniques = pd.factorize(word)
+        codes, _ = pd.factorize(codes * len(word_uniques) + word_codes)
+
+    first = pd.Series(codes).drop_duplicates().index
+    return codes, column[first]
+
+
+def decode_value(value, type_, encoding=ENCODING):
+    """Decode one raw field value to text, empty or bad values are None."""
+    value = value.strip(b' \x00')
+    if not value:
+        return None
+
+    if type_ in 'NF':
+        try:
+            if type_ == 'F' or b'.' in value:
+                return repr(float(value))
+            return str(int(value))
+        except ValueError:
+            return None
+
+    if type_ == 'D':
+        try:
+            date = datetime.date(
+                int(value[:4]), int(value[4:6]), int(value[6:8]))
+        except ValueError:
+            return None
+        return date.isoformat()
+
+    if type_ == 'L':
+        if value in TRUE:
+            return 'True'
+        return 'False' if value in FALSE else None
+
+    value = value.decode(encoding)
+    return None if value in CSV_NA else value
@@ -0,0 +1,215 @@
+"""
+Update a dataset's records in place from a new release of its raw data.
+
+A full ingest deletes all of a dataset's records and loads them again, which
+rewrites everything even when a new release only adds or edits a few percent
+of them. Instead we match the incoming records to the ones we already have by
+their natural keys, like eBird's GLOBAL_UNIQUE_IDENTIFIER, and:
+1) insert the records with keys we don't have,
+2) update the records whose contents changed, they keep their IDs,
+3) delete the records whose keys are not in the new release.
+
+Each table gets a Delta that holds its existing rows as a KeyMap from the
+hashed natural key to the row, plus the row's ID, a hash of its contents, and
+whether the ingest has synced it yet. That is ~33 bytes per row, so a chunked
+ingest can stream the new release through it and only write what changed. A
+record's contents are hashed the same way whether they came from the database
+or from the raw data, so any change to any field, like eBird's
+LAST_EDITED_DATE in the count_json, makes an update.
+
+The natural keys are columns or fields in the table's JSON column. A record
+that is only unique within its parent, like a NestWatch count within its
+nesting attempt, can also use fields from the parent's JSON column, named like
+'events.ATTEMPT_ID'. The raw key values have to be hashed from the same types
+that they read back from the database as, strings for JSON strings and so on.
+"""
+
+import numpy as np
+import pandas as pd
+
+from . import db
+from .keymap import KeyMap, hash_keys
+from .util import log
+
+READ_ROWS = 1_000_000
+MISSING = '\x00'  # Missing text, so it doesn't match the string 'None'
+
+# SQLite gives a column numeric affinity if its type contains one of these
+NUMERIC_TYPES = 'INT REAL FLOA DOUB NUM DEC'.split()
+
+
+def key_columns(keys):
+    """Get the raw data columns of the natural keys, without their tables."""
+    return [k.rpartition('.')[2] for k in keys]
+
+
+def key_hashes(keys):
+    """Hash the natural keys in a data frame of key columns."""
+    if keys.shape[1] == 1:
+        return hash_keys(keys.iloc[:, 0])
+    return hash_keys(keys)
+
+
+class Delta:
+    """Sync one table's records for a dataset by their natural keys."""
+
+    def __init__(
+            self, session, table, dataset_id, keys, synced=False,
+            repeats=True):
+        """
+        Read the dataset's existing rows.
+
+        If synced is set then the existing rows count as already synced by
+        this run and their contents are not read. This is for resuming a full
+        ingest. Set repeats to False if a key can only come once in a run,
+        like a count's, so that we don't have to add new keys to the map.
+        """
+        self.session = session
+        self.table = table
+        self.dataset_id = dataset_id
+        self.repeats = repeats
+        self.id_field = db.id_field(table)
+        self.fields = [f for f in db.FIELDS[table]
+                       if f not in (self.id_field, 'dataset_id')]
+        self.numeric = numeric_fields(session.cxn, table)
+
+        hashes, ids, contents = [], [], []
+        for chunk in self.read_rows(keys, synced):
+            hashes.append(key_hashes(chunk.iloc[:, 1:len(keys) + 1]))
+            ids.append(chunk[self.id_field].to_numpy(dtype=np.int64))
+            if not synced:
+                contents.append(self.content_hashes(chunk))
+
+        self.ids = np.concatenate(ids or [np.empty(0, dtype=np.int64)])
+        self.old = self.size = self.ids.shape[0]
+        self.rows = KeyMap(np.concatenate(hashes or [[]]), np.arange(self.old))
+        self.synced = np.full(self.old, synced)
+        self.contents = np.concatenate(
+            contents or [np.zeros(self.old, dtype=np.uint64)])
+        self.tally = {'inserted': 0, 'updated': 0, 'deleted': 0}
+
+    def read_rows(self, keys, synced):
+        """Read the IDs, keys, & maybe the fields of the dataset's rows."""
+        table = self.table
+        columns = {r[1] for r in self.session.cxn.execute(
+            f'PRAGMA table_info({table})')}
+        selects, joins = [f'{table}.{self.id_field}'], {}
+        for i, key in enumerate(keys):
+            parent, _, field = key.rpartition('.')
+            if parent:
+                expr = db.json_field(parent, field)
+                joins[parent] = f'JOIN {parent} USING ({db.id_field(parent)})'
+            elif key in columns:
+                expr = f'{table}.{key}'
+            else:
+                expr = db.json_field(table, key)
+            selects.append(f'{expr} AS key_{i}')
+        if not synced:
+            selects += [f'{table}."{f}"' for f in self.fields]
+
+        sql = f"""SELECT {', '.join(selects)}
+                    FROM {table} {' '.join(joins.values())}
+                   WHERE {table}.dataset_id = ?"""
+        return pd.read_sql(
+            sql, self.session.cxn, params=[self.dataset_id],
+            chunksize=READ_ROWS)
+
+    def content_hashes(self, df):
+        """Hash the fields of each record, normalized by their SQL types."""
+        columns = {}
+        for field in self.fields:
+            column = df[field]
+            if field in self.numeric:
+                column = pd.to_numeric(column, errors='coerce').astype(float)
+            else:
+                column = column.astype(str).where(column.notna(), MISSING)
+            columns[field] = column.to_numpy()
+        return hash_keys(pd.DataFrame(columns))
+
+    def get(self, hashes):
+        """Get the IDs of records we have already saved."""
+        return self.ids[self.rows.get(hashes)]
+
+    def save(self, df, hashes, staged=False):
+        """
+        Insert, update, or skip each record and get all of their IDs.
+
+        The data frame has the table's fields other than the ID & dataset_id.
+        The keys must be unique within a call. The first record with a key
+        in a run wins, a key that has already been synced is skipped like it
+        is in a full ingest.
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        rows, found = self.rows.lookup(hashes)
+
+        ids = np.zeros(hashes.shape, dtype=np.int64)
+        ids[found] = self.ids[rows[found]]
+
+        is_old = found.copy()
+        is_old[found] = ~self.synced[rows[found]]
+        if is_old.any():
+            self.update(df[is_old], ids[is_old], rows[is_old])
+
+        is_new = ~found
+        if is_new.any():
+            ids[is_new] = self.insert(df[is_new], hashes[is_new], staged)
+
+        return ids
+
+    def update(self, df, ids, rows):
+        """Update the old records that changed and mark them all synced."""
+        changed = self.content_hashes(df) != self.contents[rows]
+        self.synced[rows] = True
+
+        if changed.any():
+            df = df.loc[changed, self.fields].copy()
+            df[self.id_field] = ids[changed]
+            db.update_records(self.session, self.table, df)
+            self.tally['updated'] += df.shape[0]
+
+    def insert(self, df, hashes, staged):
+        """Insert the new records and add their keys to the map."""
+        df = df.copy()
+        df[self.id_field] = db.create_ids(self.session, df, self.table)
+        df['dataset_id'] = self.dataset_id
+        db.insert_records(
+            self.session, self.table, df.loc[:, db.FIELDS[self.table]],
+            staged=staged)
+        self.tally['inserted'] += df.shape[0]
+
+        ids = df[self.id_field].to_numpy(dtype=np.int64)
+        if self.repeats:
+            start, self.size = self.size, self.size + ids.shape[0]
+            self.grow()
+            self.rows.add(hashes, np.arange(start, self.size))
+            self.ids[start:self.size] = ids
+            self.contents[start:self.size] = 0
+            self.synced[start:self.size] = True
+        return ids
+
+    def grow(self):
+        """Make room for the new rows, doubling the arrays when they fill."""
+        capacity = self.ids.shape[0]
+        if self.size <= capacity:
+            return
+        capacity = max(self.size, 2 * capacity)
+        self.ids = np.resize(self.ids, capacity)
+        self.contents = np.resize(self.contents, capacity)
+        self.synced = np.resize(self.synced, capacity)
+
+    def delete_missing(self):
+        """Delete the old records with keys that this run did not see."""
+        ids = self.ids[:self.old][~self.synced[:self.old]]
+        if ids.shape[0]:
+            db.delete_records(self.session, self.table, ids)
+        self.tally['deleted'] += ids.shape[0]
+
+        counts = ', '.join(f'{v:,} {k}' for k, v in self.tally.items())
+        log(f'{self.dataset_id} {self.table}: {counts}')
+
+
+def numeric_fields(cxn, table):
+    """Get the table's columns with numeric affinity."""
+    columns = cxn.execute(f'PRAGMA table_info({table})')
+    return {name for _, name, type_, *_ in columns
+            if any(t in type_.upper() for t in NUMERIC_TYPES)}
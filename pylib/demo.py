@@ -1,25 +1,18 @@
 """Some one-off reports."""
 
 from datetime import datetime
-import pandas as pd
-from . import db
+from . import extract
 
 
-def get_species(species):
-    """Output data for the given species to the a CSV file."""
-    species = ','.join([f"'{s}'" for s in species])
-
-    sql = """SELECT taxa.*, places.*, events.*, counts.*
-               FROM places
-               JOIN events USING (place_id)
-               JOIN counts USING (event_id)
-               JOIN taxa USING (taxon_id)
-              WHERE sci_name IN ({})""".format(species)
-    return pd.read_sql(sql, db.connect())
+def write_species(species, path):
+    """Output data for the given species to a CSV, Parquet, or Arrow file."""
+    return extract.extract(path, species=species)
 
 
 if __name__ == '__main__':
-    DF = get_species([
+    NOW = datetime.now()
+    REPORT_NAME = f'temp/species_{NOW.strftime("%Y-%m-%d")}.csv'
+    write_species([
         'Papilio canadensis',
         'Anthocharis midea',
         'Plebejus saepiolus',
@@ -36,8 +29,4 @@ if __name__ == '__main__':
         'Speyeria atlantis',
         'Erynnis icelus',
         'Thymelicus lineola',
-        'Ochlodes sylvanoides'])
-
-    NOW = datetime.now()
-    REPORT_NAME = f'temp/species_{NOW.strftime("%Y-%m-%d")}.csv'
-    DF.to_csv(REPORT_NAME, index=False)
+        'Ochlodes sylvanoides'], REPORT_NAME)
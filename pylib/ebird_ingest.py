@@ -1,63 +1,318 @@
-"""Ingest eBird data."""
-
+"""
+Ingest eBird data.
+
+The raw file is too big to handle at once so it is processed in chunks, in a
+pipeline with three stages:
+1) A reader that splits the decompressed file into blocks of raw lines.
+2) Workers that parse & filter the blocks and build the place, event, and
+    count records along with their JSON. With more than one worker these run
+    in separate processes.
+3) A writer, this process, that owns the database connection and the
+    to_place_id & to_event_id key maps. It drops records we've already seen,
+    assigns IDs, and inserts the rest. The workers hash the place & event
+    keys so the writer only deals with compact 64-bit keys.
+
+After each chunk the writer saves a checkpoint with the chunk's data. If the
+ingest dies it can be resumed from there: the key maps are rebuilt from the
+database and the reader skips ahead to the end of the last saved chunk.
+
+An incremental ingest keeps the old records and syncs them with the new
+release by their natural keys (see delta.py). It writes no checkpoints, if it
+dies it can just be run again.
+"""
+
+import gzip
+import threading
+from contextlib import closing
+from functools import partial
+from io import BytesIO
+from itertools import islice
+from multiprocessing import Pool
 from pathlib import Path
 
 import pandas as pd
 
-from . import db, util
+from . import dates, db, geohash, metrics, readers, util
+from .delta import Delta
+from .keymap import hash_keys
 from .util import log
 
 DATASET_ID = 'ebird'
 RAW_DIR = Path('data') / 'raw' / DATASET_ID
 RAW_CSV = 'ebd_relMay-2020.txt.gz'
-
-
-def ingest():
+CHUNK = 1_000_000
+LNG = (-95.0, -50.0)
+LAT = (20.0, 90.0)
+
+PLACE_JSON = """COUNTRY_CODE STATE_CODE COUNTY_CODE IBA_CODE BCR_CODE
+    USFWS_CODE ATLAS_BLOCK LOCALITY_ID LOCALITY_TYPE EFFORT_AREA_HA""".split()
+EVENT_JSON = """SAMPLING_EVENT_IDENTIFIER EFFORT_AREA_HA APPROVED REVIEWED
+    NUMBER_OBSERVERS ALL_SPECIES_REPORTED OBSERVATION_DATE GROUP_IDENTIFIER
+    DURATION_MINUTES PROTOCOL_TYPE PROTOCOL_CODE PROJECT_CODE
+    TRIP_COMMENTS""".split()
+COUNT_JSON = """SCIENTIFIC_NAME GLOBAL_UNIQUE_IDENTIFIER LAST_EDITED_DATE
+    TAXONOMIC_ORDER CATEGORY SUBSPECIES_SCIENTIFIC_NAME
+    BREEDING_BIRD_ATLAS_CODE BREEDING_BIRD_ATLAS_CATEGORY AGE_SEX
+    OBSERVER_ID HAS_MEDIA SPECIES_COMMENTS""".split()
+
+# The raw file has ~50 columns, these are the ones we use
+COLUMNS = set("""LONGITUDE LATITUDE EFFORT_DISTANCE_KM
+    TIME_OBSERVATIONS_STARTED OBSERVATION_COUNT""".split()
+              + PLACE_JSON + EVENT_JSON + COUNT_JSON)
+CATEGORIES = """COUNTRY_CODE STATE_CODE COUNTY_CODE IBA_CODE BCR_CODE
+    USFWS_CODE LOCALITY_TYPE APPROVED REVIEWED ALL_SPECIES_REPORTED
+    PROTOCOL_TYPE PROTOCOL_CODE PROJECT_CODE SCIENTIFIC_NAME CATEGORY
+    BREEDING_BIRD_ATLAS_CODE BREEDING_BIRD_ATLAS_CATEGORY HAS_MEDIA""".split()
+NUMBERS = 'LONGITUDE LATITUDE EFFORT_DISTANCE_KM'.split()
+
+NATURAL_KEYS = {
+    'places': ['lng', 'lat'],
+    'events': ['SAMPLING_EVENT_IDENTIFIER'],
+    'counts': ['GLOBAL_UNIQUE_IDENTIFIER']}
+
+
+def ingest(session):
     """Ingest eBird data."""
-    db.delete_dataset_records(DATASET_ID)
-
-    to_taxon_id = get_taxa()
-
-    db.insert_dataset({
+    checkpoint = None
+    if session.resume and not session.incremental:
+        checkpoint = db.get_checkpoint(session, DATASET_ID)
+        if not checkpoint:
+            log(f'No {DATASET_ID} checkpoint so starting over')
+
+    first, start = 1, None
+    if session.incremental:
+        log(f'Updating {DATASET_ID} records in place')
+        db.delete_checkpoint(session, DATASET_ID)
+        insert_dataset(session)
+    elif checkpoint:
+        log(f'Resuming {DATASET_ID} after chunk {checkpoint["chunk"]:,}')
+        first, start = checkpoint['chunk'] + 1, checkpoint['position']
+    else:
+        db.delete_dataset_records(session, DATASET_ID)
+        insert_dataset(session)
+        db.create_checkpoints(session)
+    session.commit()
+
+    to_place_id, to_event_id, to_count_id = get_deltas(
+        session, synced=bool(checkpoint))
+    to_taxon_id = get_taxa(session)
+
+    blocks = read_chunks(start=start)
+    chunks = transform_chunks(blocks, to_taxon_id, session.workers)
+
+    with closing(chunks):
+        for i, (records, (position, chunk)) in enumerate(chunks, first):
+            log(f'Processing {DATASET_ID} chunk {i * CHUNK:,}')
+
+            with metrics.stage('chunk', chunk=i):
+                metrics.add(records)
+
+                if chunk is not None:
+                    places, events, counts = chunk
+
+                    insert_places(session, places, to_place_id)
+                    insert_events(session, events, to_place_id, to_event_id)
+                    insert_counts(session, counts, to_event_id, to_count_id)
+
+                if not session.incremental:
+                    db.save_checkpoint(session, DATASET_ID, i, *position)
+                session.commit()
+
+    if session.incremental:
+        for delta in (to_count_id, to_event_id, to_place_id):
+            delta.delete_missing()
+        session.commit()
+
+
+def insert_dataset(session):
+    """Insert the dataset record."""
+    db.insert_dataset(session, {
         'dataset_id': DATASET_ID,
         'title': RAW_CSV,
         'version': 'relMay-2020',
         'url': 'https://ebird.org/home'})
 
-    chunk = 1_000_000
-    reader = pd.read_csv(
-        RAW_DIR / RAW_CSV,
-        delimiter='\t',
-        quoting=3,
-        chunksize=chunk,
-        dtype='unicode')
-
-    to_place_id = {}
-    to_event_id = {}
-
-    for i, raw_data in enumerate(reader, 1):
-        log(f'Processing {DATASET_ID} chunk {i * chunk:,}')
-
-        raw_data = filter_data(raw_data)
 
-        if raw_data.shape[0] == 0:
-            continue
-
-        to_place_id = insert_places(raw_data, to_place_id)
-        to_event_id = insert_events(raw_data, to_place_id, to_event_id)
-        insert_counts(raw_data, to_event_id, to_taxon_id)
-
-
-def get_taxa():
+@metrics.timed
+def get_taxa(session):
     """Build a dictionary of scientific names and taxon_ids."""
     sql = """SELECT taxon_id, sci_name
                FROM taxa
               WHERE target = 't'
                 AND "class"='aves'"""
-    taxa = pd.read_sql(sql, db.connect())
+    taxa = pd.read_sql(sql, session.cxn)
     return taxa.set_index('sci_name')['taxon_id'].to_dict()
 
 
+@metrics.timed
+def get_deltas(session, synced=False):
+    """
+    Get the deltas that map the place, event, & count keys to their IDs.
+
+    A full ingest only needs the places & events, to skip the ones it has
+    already inserted. On a resume all of the records in the database are
+    from this run. An incremental ingest syncs the counts too.
+    """
+    log(f'Reading {DATASET_ID} keys')
+
+    to_place_id, to_event_id = (
+        Delta(session, t, DATASET_ID, NATURAL_KEYS[t], synced=synced)
+        for t in ['places', 'events'])
+
+    to_count_id = None
+    if session.incremental:
+        to_count_id = Delta(
+            session, 'counts', DATASET_ID, NATURAL_KEYS['counts'],
+            repeats=False)
+
+    return to_place_id, to_event_id, to_count_id
+
+
+def read_chunks(path=RAW_DIR / RAW_CSV, chunk=CHUNK, start=None):
+    """
+    Split the raw file into blocks of lines.
+
+    Each block gets a copy of the header so it can be parsed on its own. The
+    file does not use quoting so a line is always a complete record.
+
+    Each block comes with the position where it ends, both in the
+    decompressed data and in the compressed file. The first one is what we
+    seek to when resuming. The compressed one is informational only because
+    gzip reads ahead and we can't restart a deflate stream at an arbitrary
+    byte anyway.
+    """
+    with gzip.open(path, 'rb') as raw_file:
+        header = raw_file.readline()
+        if start:
+            raw_file.seek(start)
+        while True:
+            lines = list(islice(raw_file, chunk))
+            if not lines:
+                break
+            position = raw_file.tell(), raw_file.fileobj.tell()
+            yield position, header + b''.join(lines)
+
+
+def transform_chunks(blocks, to_taxon_id, workers=1):
+    """
+    Turn positioned blocks of raw lines into places, events, & counts.
+
+    With more than one worker the blocks are handed to a process pool. The
+    results come back in file order so the IDs are the same as a serial run.
+    We limit the number of blocks in flight to bound the memory use. If the
+    caller stops early (closes this generator) we unblock the pool's feeder
+    thread so the pool can shut down.
+
+    Each result comes with the stages that the transform recorded, if we are
+    profiling, so that the caller can add them to its chunk.
+    """
+    transform = partial(
+        metrics.captured, transform_chunk, to_taxon_id=to_taxon_id)
+
+    if workers <= 1:
+        yield from map(transform, blocks)
+        return
+
+    in_flight = threading.Semaphore(workers + 1)
+    stopped = threading.Event()
+
+    def throttled():
+        for block in blocks:
+            in_flight.acquire()
+            if stopped.is_set():
+                break
+            yield block
+
+    with Pool(workers) as pool:
+        try:
+            for result in pool.imap(transform, throttled()):
+                in_flight.release()
+                yield result
+        finally:
+            stopped.set()
+            in_flight.release()
+
+
+def transform_chunk(positioned_block, to_taxon_id):
+    """
+    Parse, filter, & build the records for one block of raw lines.
+
+    The block's position is passed through untouched so the writer knows
+    where to resume from after it saves the records.
+    """
+    position, block = positioned_block
+
+    with metrics.stage('prefilter', rows_in=block.count(b'\n') - 1) as record:
+        block = prefilter(block, to_taxon_id)
+        record['rows_out'] = block.count(b'\n') - 1 if block else 0
+    if block is None:
+        return position, None
+
+    raw_data = readers.read_csv(
+        BytesIO(block),
+        columns=COLUMNS,
+        categories=CATEGORIES,
+        numbers=NUMBERS,
+        delimiter='\t',
+        quoting=3)
+
+    raw_data = filter_data(raw_data)
+
+    if raw_data.shape[0] == 0:
+        return position, None
+
+    places = build_places(raw_data)
+    events = build_events(raw_data)
+    counts = build_counts(raw_data, to_taxon_id)
+    return position, (places, events, counts)
+
+
+def prefilter(block, to_taxon_id):
+    """
+    Drop raw lines we will not use before parsing them into a dataframe.
+
+    Most lines are rejected on a few fields so we only split them as far as
+    we need and skip pandas altogether. We reject lines that are unapproved,
+    incomplete, or outside of the bounding box. Lines for non-target species
+    still hold the place & event for their checklist, so we keep the first
+    line of each checklist and drop the rest. These are the same rows that
+    filter_data() & build_places() & build_events() end up using.
+    """
+    header, *lines = block.splitlines(keepends=True)
+
+    columns = [util.normalize_name(c) for c in header.decode().split('\t')]
+    approved = columns.index('APPROVED')
+    complete = columns.index('ALL_SPECIES_REPORTED')
+    lng = columns.index('LONGITUDE')
+    lat = columns.index('LATITUDE')
+    sci_name = columns.index('SCIENTIFIC_NAME')
+    event = columns.index('SAMPLING_EVENT_IDENTIFIER')
+    width = max(approved, complete, lng, lat, sci_name, event) + 1
+
+    targets = {k.encode() for k in to_taxon_id}
+    seen = set()
+
+    keep = [header]
+    for line in lines:
+        fields = line.split(b'\t', width)
+        if len(fields) < width:
+            continue
+        if fields[approved] != b'1' or fields[complete] != b'1':
+            continue
+        try:
+            if not (LNG[0] <= float(fields[lng]) <= LNG[1]
+                    and LAT[0] <= float(fields[lat]) <= LAT[1]):
+                continue
+        except ValueError:
+            continue
+        if fields[sci_name] in targets or fields[event] not in seen:
+            seen.add(fields[event])
+            keep.append(line)
+
+    return b''.join(keep) if len(keep) > 1 else None
+
+
+@metrics.timed
 def filter_data(raw_data):
     """Limit the size & scope of the data."""
     raw_data = raw_data.rename(columns={
@@ -81,108 +336,98 @@ def filter_data(raw_data):
 
     raw_data = raw_data[has_date & is_approved & is_complete]
 
-    return util.filter_lng_lat(
-        raw_data, 'lng', 'lat', lng=(-95.0, -50.0), lat=(20.0, 90.0))
-
-
-def insert_places(raw_data, to_place_id):
-    """Insert places."""
-    log(f'Inserting {DATASET_ID} places')
-
-    raw_data['place_key'] = tuple(zip(raw_data.lng, raw_data.lat))
-
-    places = raw_data.drop_duplicates('place_key')
+    return util.filter_lng_lat(raw_data, 'lng', 'lat', lng=LNG, lat=LAT)
 
-    old_places = places.place_key.isin(to_place_id)
-    places = places[~old_places]
 
-    places['place_id'] = db.create_ids(places, 'places')
-    places['dataset_id'] = DATASET_ID
+@metrics.timed
+def build_places(raw_data):
+    """Build the place records for the chunk."""
+    places = raw_data.drop_duplicates(['lng', 'lat']).copy()
 
     is_na = places.radius.isna()
     places.radius = pd.to_numeric(places.radius, errors='coerce').fillna(0.0)
     places.radius *= 1000.0
     places.loc[is_na, 'radius'] = None
 
-    fields = """COUNTRY_CODE STATE_CODE COUNTY_CODE IBA_CODE BCR_CODE
-        USFWS_CODE ATLAS_BLOCK LOCALITY_ID LOCALITY_TYPE
-        EFFORT_AREA_HA""".split()
-    places['place_json'] = util.json_object(places, fields)
+    places['place_json'] = util.json_object(places, PLACE_JSON)
+    places['place_key'] = hash_keys(places.loc[:, ['lng', 'lat']])
+    places['geohash'] = geohash.encode(places.lng, places.lat)
 
-    places.loc[:, db.PLACE_FIELDS].to_sql(
-        'places', db.connect(), if_exists='append', index=False)
+    return places.loc[:, """lng lat radius place_json geohash
+        place_key""".split()]
 
-    places['place_key'] = tuple(zip(places.lng, places.lat))
-    new_place_ids = places.set_index('place_key').place_id.to_dict()
-    return {**to_place_id, **new_place_ids}
 
+@metrics.timed
+def build_events(raw_data):
+    """Build the event records for the chunk."""
+    events = raw_data.drop_duplicates('SAMPLING_EVENT_IDENTIFIER').copy()
 
-def insert_events(raw_data, to_place_id, to_event_id):
-    """Insert events."""
-    log(f'Inserting {DATASET_ID} events')
+    events['year'] = dates.year(events.date)
+    events['day'] = dates.day(events.date)
+    started = dates.parse_minutes(events.started)
+    duration = pd.to_numeric(events.DURATION_MINUTES, errors='coerce')
+    events['started'] = dates.to_hh_mm(started)
+    events['ended'] = dates.to_hh_mm(started + duration)
+
+    events['event_json'] = util.json_object(events, EVENT_JSON)
+    events['event_key'] = hash_keys(events.SAMPLING_EVENT_IDENTIFIER)
+    events['place_key'] = hash_keys(events.loc[:, ['lng', 'lat']])
 
-    events = raw_data.drop_duplicates('SAMPLING_EVENT_IDENTIFIER')
+    return events.loc[:, """event_key place_key year day started ended
+        event_json""".split()]
 
-    old_events = events.SAMPLING_EVENT_IDENTIFIER.isin(to_event_id)
-    events = events[~old_events]
 
-    events['event_id'] = db.create_ids(events, 'events')
-    events['place_key'] = tuple(zip(events.lng, events.lat))
-    events['place_id'] = events.place_key.map(to_place_id)
-    events['year'] = events.date.dt.strftime('%Y')
-    events['day'] = events.date.dt.strftime('%j')
-    events['started'] = pd.to_datetime(events['started'], format='%H:%M:%S')
-    events['delta'] = pd.to_numeric(events.DURATION_MINUTES, errors='coerce')
-    events.delta = pd.to_timedelta(events.delta, unit='m', errors='coerce')
-    events['ended'] = events.started + events.delta
-    convert_to_time(events, 'started')
-    convert_to_time(events, 'ended')
-    events['dataset_id'] = DATASET_ID
+@metrics.timed
+def build_counts(raw_data, to_taxon_id):
+    """Build the count records for the chunk."""
+    in_species = raw_data['SCIENTIFIC_NAME'].isin(to_taxon_id)
+    counts = raw_data[in_species].copy()
 
-    fields = """SAMPLING_EVENT_IDENTIFIER EFFORT_AREA_HA APPROVED REVIEWED
-        NUMBER_OBSERVERS ALL_SPECIES_REPORTED OBSERVATION_DATE GROUP_IDENTIFIER
-        DURATION_MINUTES PROTOCOL_TYPE PROTOCOL_CODE PROJECT_CODE
-        TRIP_COMMENTS""".split()
-    events['event_json'] = util.json_object(events, fields)
+    counts['taxon_id'] = counts.SCIENTIFIC_NAME.map(to_taxon_id).astype(int)
+    counts['count_json'] = util.json_object(counts, COUNT_JSON)
+    counts['event_key'] = hash_keys(counts.SAMPLING_EVENT_IDENTIFIER)
+    counts['count_key'] = hash_keys(counts.GLOBAL_UNIQUE_IDENTIFIER)
 
-    events.loc[:, db.EVENT_FIELDS].to_sql(
-        'events', db.connect(), if_exists='append', index=False)
+    return counts.loc[:, """event_key count_key taxon_id count
+        count_json""".split()]
 
-    new_event_ids = events.set_index(
-        'SAMPLING_EVENT_IDENTIFIER').event_id.to_dict()
-    return {**to_event_id, **new_event_ids}
 
+@metrics.timed
+def insert_places(session, places, to_place_id):
+    """Save the places we haven't seen yet in this run."""
+    log(f'Inserting {DATASET_ID} places')
+    to_place_id.save(places, places.place_key)
 
-def convert_to_time(df, column):
-    """Convert the time field from datetime format to HH:MM format."""
-    is_na = df[column].isna()
-    df[column] = df[column].dt.strftime('%H:%M')
-    df.loc[is_na, column] = None
+
+@metrics.timed
+def insert_events(session, events, to_place_id, to_event_id):
+    """Save the events we haven't seen yet in this run."""
+    log(f'Inserting {DATASET_ID} events')
+    events['place_id'] = to_place_id.get(events.place_key)
+    to_event_id.save(events, events.event_key, staged=True)
 
 
-def insert_counts(counts, to_event_id, to_taxon_id):
-    """Insert counts."""
+@metrics.timed
+def insert_counts(session, counts, to_event_id, to_count_id=None):
+    """Insert counts, or sync them if the ingest is incremental."""
     log(f'Inserting {DATASET_ID} counts')
 
-    in_species = counts['SCIENTIFIC_NAME'].isin(to_taxon_id)
-    counts = counts[in_species].copy()
     if counts.shape[0] == 0:
         return
 
-    counts['count_id'] = db.create_ids(counts, 'counts')
-    counts['event_id'] = counts.SAMPLING_EVENT_IDENTIFIER.map(to_event_id)
-    counts['taxon_id'] = counts.SCIENTIFIC_NAME.map(to_taxon_id)
-    counts['dataset_id'] = DATASET_ID
+    counts['event_id'] = to_event_id.get(counts.event_key)
+
+    if to_count_id:
+        to_count_id.save(counts, counts.count_key, staged=True)
+        return
 
-    fields = """SCIENTIFIC_NAME GLOBAL_UNIQUE_IDENTIFIER LAST_EDITED_DATE
-        TAXONOMIC_ORDER CATEGORY SUBSPECIES_SCIENTIFIC_NAME
-        BREEDING_BIRD_ATLAS_CODE BREEDING_BIRD_ATLAS_CATEGORY AGE_SEX
-        OBSERVER_ID HAS_MEDIA SPECIES_COMMENTS""".split()
-    counts['count_json'] = util.json_object(counts, fields)
+    counts['count_id'] = db.create_ids(session, counts, 'counts')
+    counts['dataset_id'] = DATASET_ID
 
-    counts.loc[:, db.COUNT_FIELDS].to_sql(
-        'counts', db.connect(), if_exists='append', index=False)
+    db.insert_records(
+        session, 'counts', counts.loc[:, db.COUNT_FIELDS], staged=True)
 
 
 if __name__ == '__main__':
-    ingest()
+    with db.IngestSession() as SESSION:
+        ingest(SESSION)
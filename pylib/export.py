@@ -0,0 +1,232 @@
+"""
+Export the SQLite3 database to CSV files.
+
+Big tables are cut into shards of a fixed number of rows using ranges of
+their row IDs, so each shard can be read with an index range scan and none of
+them needs an OFFSET. The shards are written in parallel by separate
+processes, each with its own connection, and optionally compressed. A
+manifest records the row count & checksum of every file written, and a psql
+script with a \\copy for every CSV file in it loads them into PostgreSQL.
+"""
+
+import csv
+import gzip
+import io
+import json
+import sqlite3
+from multiprocessing import Pool
+from os import makedirs
+from pathlib import Path
+
+from . import db
+from .util import log, sha256
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SHARD_ROWS = 10_000_000
+FETCH_ROWS = 10_000
+SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+MANIFEST = 'manifest.json'
+COPY_SCRIPT = 'copy.sql'
+DECOMPRESS = {'.gz': 'gzip -dc', '.zst': 'zstd -dc'}
+
+
+def export_csv(
+        exports, export_path, shard_rows=SHARD_ROWS, compress=None,
+        workers=1):
+    """Export tables or datasets to CSV shards and update the manifest."""
+    if compress == 'zstd' and not zstandard:
+        raise ImportError('Install the zstandard package for zstd output')
+
+    export_path = Path(export_path)
+    makedirs(export_path, exist_ok=True)
+
+    shards = []
+    for export in exports:
+        for table, dataset_id in export_tables(export):
+            log(f'Planning {table} {dataset_id if dataset_id else ""} export')
+            shards += plan_shards(
+                table, dataset_id, shard_rows, export_path, compress)
+
+    log(f'Exporting {len(shards):,} shards')
+    if workers <= 1:
+        entries = list(map(write_shard, shards))
+    else:
+        with Pool(workers) as pool:
+            entries = list(pool.imap_unordered(write_shard, shards))
+
+    update_manifest(export_path, entries)
+    write_copy_script(export_path)
+
+
+def export_tables(export):
+    """Get the (table, dataset_id) pairs for a table or a dataset."""
+    if export in db.TABLES:
+        return [(export, None)]
+    return [(table, export) for table in db.SPLIT_TABLES]
+
+
+def plan_shards(table, dataset_id, shard_rows, export_path, compress):
+    """Plan the CSV shards for a table, or a dataset's part of a table."""
+    ranges = shard_ranges(table, dataset_id, shard_rows)
+    if not ranges:
+        ranges = [(0, 0)]  # Still write an empty file
+
+    name = f'{table}_{dataset_id}' if dataset_id else table
+    suffix = '.csv' + SUFFIXES[compress]
+
+    shards = []
+    for i, (first, last) in enumerate(ranges, 1):
+        file_name = f'{name}_{i:03d}' if len(ranges) > 1 else name
+        shards.append({
+            'file': str(export_path / (file_name + suffix)),
+            'table': table,
+            'dataset_id': dataset_id,
+            'first_id': first,
+            'last_id': last,
+            'compress': compress})
+    return shards
+
+
+def shard_ranges(table, dataset_id=None, shard_rows=SHARD_ROWS):
+    """
+    Cut the table's rows into row ID ranges of shard_rows rows each.
+
+    We hop from one shard's last row ID to the next with an index range scan
+    so this is one pass over the index. The last range is open ended (None).
+    """
+    where = 'AND dataset_id = :dataset_id' if dataset_id else ''
+    sql = f"""SELECT rowid FROM {table}
+               WHERE rowid > :after {where}
+            ORDER BY rowid
+               LIMIT 1 OFFSET :skip"""
+    first_sql = f"""SELECT MIN(rowid) FROM {table}
+                     WHERE rowid > :after {where}"""
+
+    cxn = sqlite3.connect(db.DB_FILE)
+    params = {'dataset_id': dataset_id, 'after': 0, 'skip': shard_rows - 1}
+
+    ranges = []
+    while (first := cxn.execute(first_sql, params).fetchone()[0]) is not None:
+        last = cxn.execute(sql, params).fetchone()
+        last = last[0] if last else None
+        ranges.append((first, last))
+        if last is None:
+            break
+        params['after'] = last
+    cxn.close()
+
+    return ranges
+
+
+def write_shard(shard):
+    """Write one shard and return its manifest entry."""
+    where = ['rowid >= :first_id']
+    if shard['last_id'] is not None:
+        where.append('rowid <= :last_id')
+    if shard['dataset_id']:
+        where.append('dataset_id = :dataset_id')
+    sql = f"""SELECT * FROM {shard['table']}
+               WHERE {' AND '.join(where)}
+            ORDER BY rowid"""
+
+    cxn = sqlite3.connect(db.DB_FILE)
+    cursor = cxn.execute(sql, shard)
+
+    rows = 0
+    with open_shard(shard['file'], shard['compress']) as shard_file:
+        writer = csv.writer(shard_file, lineterminator='\n')
+        while batch := cursor.fetchmany(FETCH_ROWS):
+            writer.writerows(batch)
+            rows += len(batch)
+    cxn.close()
+
+    log(f'Wrote {rows:,} rows to {shard["file"]}')
+
+    path = Path(shard['file'])
+    return {
+        'file': path.name,
+        'table': shard['table'],
+        'dataset_id': shard['dataset_id'],
+        'first_id': shard['first_id'],
+        'last_id': shard['last_id'],
+        'rows': rows,
+        'bytes': path.stat().st_size,
+        'sha256': sha256(path)}
+
+
+def open_shard(path, compress):
+    """Open a shard file for writing CSV text."""
+    if compress == 'gzip':
+        return gzip.open(path, 'wt', newline='', compresslevel=6)
+    if compress == 'zstd':
+        raw = zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+        return io.TextIOWrapper(raw, newline='')
+    return open(path, 'w', newline='')
+
+
+def update_manifest(export_path, entries):
+    """
+    Add the entries to the manifest.
+
+    A re-exported table replaces all of its old entries, so that a table
+    exported again with fewer shards or another compression doesn't keep
+    the old files too. Those old files are deleted.
+    """
+    path = export_path / MANIFEST
+    old = []
+    if path.exists():
+        with open(path) as in_file:
+            old = json.load(in_file)['files']
+
+    exported = {manifest_group(e) for e in entries}
+    files = {e['file'] for e in entries}
+    for entry in old:
+        if manifest_group(entry) in exported and entry['file'] not in files:
+            stale = export_path / entry['file']
+            if stale.exists():
+                log(f'Removing old export {stale}')
+                stale.unlink()
+
+    kept = [e for e in old if manifest_group(e) not in exported]
+    files = sorted(kept + entries, key=lambda e: e['file'])
+
+    with open(path, 'w') as out_file:
+        json.dump({'files': files}, out_file, indent=2)
+    log(f'Updated {path}')
+
+
+def manifest_group(entry):
+    """Get the (format, table, dataset_id) that a manifest entry is part of."""
+    is_parquet = Path(entry['file']).suffix == '.parquet'
+    return ('parquet' if is_parquet else 'csv', entry['table'],
+            entry['dataset_id'])
+
+
+def write_copy_script(export_path):
+    """
+    Write a psql script that loads every CSV file in the manifest.
+
+    The tables are loaded in the order their foreign keys need and the
+    compressed files are decompressed on the fly.
+    """
+    with open(export_path / MANIFEST) as in_file:
+        entries = json.load(in_file)['files']
+    entries = [e for e in entries if manifest_group(e)[0] == 'csv']
+    entries.sort(key=lambda e: (db.TABLES.index(e['table']), e['file']))
+
+    lines = ['-- Load the CSV files listed in manifest.json, run it with:',
+             f'--   psql -d sightings -f {COPY_SCRIPT}']
+    for entry in entries:
+        path = str((export_path / entry['file']).resolve()).replace("'", "''")
+        program = DECOMPRESS.get(Path(path).suffix)
+        source = f"PROGRAM '{program} \"{path}\"'" if program else f"'{path}'"
+        lines.append(
+            f"\\copy {entry['table']} FROM {source} WITH (FORMAT csv);")
+
+    path = export_path / COPY_SCRIPT
+    path.write_text('\n'.join(lines) + '\n')
+    log(f'Wrote {path}')
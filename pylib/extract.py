@@ -0,0 +1,194 @@
+"""
+Write query results to CSV, Parquet, or Arrow IPC files a chunk at a time.
+
+A pull of a common bird can be tens of millions of rows, too many to hold in
+a data frame. Here the query.sightings() chunks are written out as they
+arrive, so memory use depends on the chunk size and not on the result size.
+The CSV file is appended to, and each chunk becomes a Parquet row group or an
+Arrow record batch. The Parquet & Arrow files have a fixed schema, so a chunk
+where a column happens to be empty still matches the others.
+
+The JSON columns can be expanded: pick the fields to pull out of each one and
+they replace the JSON column in the output, one text column per field.
+"""
+
+import gzip
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from . import query
+from .util import log
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa, pq = None, None
+
+FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.arrow': 'arrow',
+           '.feather': 'arrow'}
+COMPRESSION = 'zstd'
+
+INTEGERS = 'count_id event_id place_id taxon_id year day count'.split()
+FLOATS = 'lng lat radius'.split()
+BOOLEANS = ['target']
+JSON_COLUMNS = 'place_json event_json count_json'.split()
+
+
+def extract(
+        path, format_=None, expand_json=None, chunk_rows=query.CHUNK_ROWS,
+        cache=False, **filters):
+    """
+    Write the sightings that pass the query.sightings() filters to a file.
+
+    The format comes from the file suffix unless it is given: .csv (or
+    .csv.gz), .parquet, or .arrow/.feather for Arrow IPC. expand_json maps
+    JSON columns to the fields to pull out of them, like
+    {'event_json': ['GROUP_IDENTIFIER']}. Returns the number of rows written.
+
+    The output file already holds the results, so they are not also saved in
+    the query cache unless cache is True.
+    """
+    path = Path(path)
+    format_ = format_ or file_format(path)
+    if format_ != 'csv' and not pa:
+        raise ImportError(f'Install the pyarrow package for {format_} output')
+
+    expand_json = expand_json or {}
+    for column in expand_json:
+        if column not in JSON_COLUMNS:
+            raise ValueError(f'{column} is not a JSON column')
+
+    chunks = query.sightings(chunk_rows=chunk_rows, cache=cache, **filters)
+    columns = output_columns(expand_json)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(path.name + '.tmp')
+    if format_ == 'csv':
+        writer = CsvWriter(temp, columns, compress=path.suffix == '.gz')
+    else:
+        writer = ArrowWriter(temp, columns, parquet=format_ == 'parquet')
+
+    rows = 0
+    try:
+        with writer as out:
+            for chunk in chunks:
+                chunk = expand(chunk, expand_json)
+                out.write(chunk.loc[:, columns])
+                rows += chunk.shape[0]
+        os.replace(temp, path)  # So that a failure can't leave half a file
+    finally:
+        if temp.exists():
+            temp.unlink()
+
+    log(f'Wrote {rows:,} rows to {path}')
+    return rows
+
+
+def file_format(path):
+    """Get the output format from the file's suffix."""
+    suffixes = [s.lower() for s in path.suffixes]
+    if suffixes[-1:] == ['.gz']:
+        suffixes.pop()
+    format_ = FORMATS.get(suffixes[-1] if suffixes else '')
+    if not format_:
+        raise ValueError(f'Cannot tell the format of {path} from its suffix')
+    return format_
+
+
+def output_columns(expand_json):
+    """Get the output columns, with the expanded JSON fields in place."""
+    columns = []
+    for column in query.COLUMNS:
+        if column in expand_json:
+            columns += expand_json[column]
+        else:
+            columns.append(column)
+    return columns
+
+
+def expand(df, expand_json):
+    """Replace the JSON columns with the fields we want from them."""
+    for column, fields in expand_json.items():
+        records = [json.loads(s) if isinstance(s, str) else {}
+                   for s in df[column]]
+        values = pd.DataFrame.from_records(
+            records, columns=fields, index=df.index)
+        for field in fields:
+            df[field] = text(values[field])
+    return df
+
+
+def text(column):
+    """Convert a column to strings, leaving missing values as None."""
+    return column.astype(str).where(column.notna(), None)
+
+
+def arrow_schema(columns):
+    """Get the Arrow schema of the output columns."""
+    fields = []
+    for column in columns:
+        if column in INTEGERS:
+            fields.append((column, pa.int64()))
+        elif column in FLOATS:
+            fields.append((column, pa.float64()))
+        elif column in BOOLEANS:
+            fields.append((column, pa.bool_()))
+        else:
+            fields.append((column, pa.string()))
+    return pa.schema(fields)
+
+
+class CsvWriter:
+    """Append chunks to a CSV file, maybe gzipped."""
+
+    def __init__(self, path, columns, compress=False):
+        self.header = True
+        self.columns = columns
+        opener = gzip.open if compress else open
+        self.out_file = opener(path, 'wt', newline='')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.header:  # Still write the header for an empty result
+            self.write(pd.DataFrame(columns=self.columns))
+        self.out_file.close()
+
+    def write(self, df):
+        """Add the chunk to the file."""
+        df.to_csv(self.out_file, header=self.header, index=False)
+        self.header = False
+
+
+class ArrowWriter:
+    """Write chunks as Parquet row groups or Arrow IPC record batches."""
+
+    def __init__(self, path, columns, parquet=True):
+        self.schema = arrow_schema(columns)
+        if parquet:
+            self.writer = pq.ParquetWriter(
+                path, self.schema, compression=COMPRESSION)
+        else:
+            self.writer = pa.ipc.new_file(str(path), self.schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.writer.close()
+
+    def write(self, df):
+        """Add the chunk to the file."""
+        df = df.copy()
+        for column in self.schema.names:
+            if column in BOOLEANS:
+                df[column] = df[column] == 't'
+            elif self.schema.field(column).type == pa.string():
+                df[column] = text(df[column])
+        self.writer.write_table(pa.Table.from_pandas(
+            df, schema=self.schema, preserve_index=False))
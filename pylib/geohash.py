@@ -0,0 +1,118 @@
+"""
+Vectorized geohashes.
+
+A geohash halves the longitude & latitude ranges over and over, taking
+alternate bits from each, starting with the longitude, and spells the bits in
+a base 32 alphabet five at a time. We work out all of a coordinate's bits at
+once from the cell it falls in. A point on a cell edge goes in the lower cell,
+like PostGIS' ST_GeoHash() does.
+
+Geohashes that share a prefix are near each other, so the places' geohash
+index can bucket places by area with a prefix match (LIKE 'dr5r%') or a
+join on substr(geohash, 1, n). A bucket's neighbors cover the places just
+over its edges.
+"""
+
+import numpy as np
+
+GEOHASH_PRECISION = 7
+BASE32 = np.frombuffer(b'0123456789bcdefghjkmnpqrstuvwxyz', dtype=np.uint8)
+NEIGHBORS = 'n ne e se s sw w nw'.split()
+OFFSETS = [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0),
+           (-1, 1)]
+
+DECODE = np.full(256, -1, dtype=np.int64)
+DECODE[BASE32] = np.arange(32)
+
+
+def encode(lng, lat, precision=GEOHASH_PRECISION):
+    """Get the geohashes of the points. Missing points get None."""
+    lng = np.asarray(lng, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+
+    bits = 5 * precision
+    lng_bits, lat_bits = (bits + 1) // 2, bits // 2
+    lng_cells = cells(lng, -180.0, 360.0, lng_bits)
+    lat_cells = cells(lat, -90.0, 180.0, lat_bits)
+
+    code = np.zeros(lng.shape, dtype=np.uint64)
+    for i in range(bits):
+        if i % 2 == 0:
+            lng_bits -= 1
+            bit = lng_cells >> np.uint64(lng_bits)
+        else:
+            lat_bits -= 1
+            bit = lat_cells >> np.uint64(lat_bits)
+        code = (code << np.uint64(1)) | (bit & np.uint64(1))
+
+    chars = np.empty(lng.shape + (precision,), dtype=np.uint8)
+    for i in range(precision):
+        shift = np.uint64(5 * (precision - i - 1))
+        chars[..., i] = BASE32[(code >> shift) & np.uint64(31)]
+
+    hashes = chars.view(f'S{precision}')[..., 0].astype(str).astype(object)
+    hashes[np.isnan(lng) | np.isnan(lat)] = None
+    return hashes
+
+
+def cells(values, low, width, bits):
+    """Get the cell number, along one axis, that each value falls in."""
+    count = 2 ** bits
+    where = np.ceil((values - low) / width * count) - 1
+    where = np.nan_to_num(where)
+    return np.clip(where, 0, count - 1).astype(np.uint64)
+
+
+def bounds(hashes):
+    """Get the (west, east, south, north) edges of the geohash cells."""
+    shape = np.shape(hashes)
+    hashes = np.asarray(hashes, dtype=bytes).ravel()
+    width = hashes.dtype.itemsize
+    lengths = np.char.str_len(hashes)
+    chars = hashes.view(np.uint8).reshape(hashes.shape + (width, ))
+    codes = DECODE[chars]
+
+    if (codes[np.arange(width) < lengths[..., None]] < 0).any():
+        raise ValueError('Geohashes may only use the geohash base 32 digits')
+
+    edges = [np.full(hashes.shape, x) for x in (-180.0, 180.0, -90.0, 90.0)]
+    for i in range(5 * width):
+        low, high = (0, 1) if i % 2 == 0 else (2, 3)
+        bit = (codes[..., i // 5] >> (4 - i % 5)) & 1
+        used = i // 5 < lengths
+        mid = (edges[low] + edges[high]) / 2.0
+        edges[low] = np.where(used & (bit == 1), mid, edges[low])
+        edges[high] = np.where(used & (bit == 0), mid, edges[high])
+
+    return tuple(e.reshape(shape) for e in edges)
+
+
+def decode(hashes):
+    """Get the (lng, lat) of the centers of the geohash cells."""
+    west, east, south, north = bounds(hashes)
+    return (west + east) / 2.0, (south + north) / 2.0
+
+
+def neighbors(hashes):
+    """
+    Get the eight neighbors of each geohash.
+
+    They are in NEIGHBORS order along a new last axis. The neighbors wrap
+    around the antimeridian but there are none past the poles, those are None.
+    """
+    shape = np.shape(hashes)
+    hashes = np.asarray(hashes, dtype=object).ravel()
+    west, east, south, north = bounds(hashes.astype(bytes))
+    lng, lat = (west + east) / 2.0, (south + north) / 2.0
+    lengths = np.char.str_len(hashes.astype(str))
+
+    result = np.empty(hashes.shape + (len(OFFSETS), ), dtype=object)
+    for precision in np.unique(lengths):
+        same = lengths == precision
+        for i, (x, y) in enumerate(OFFSETS):
+            next_lng = lng[same] + x * (east - west)[same]
+            next_lng = (next_lng + 180.0) % 360.0 - 180.0
+            next_lat = lat[same] + y * (north - south)[same]
+            next_lat[np.abs(next_lat) > 90.0] = np.nan
+            result[same, i] = encode(next_lng, next_lat, precision)
+    return result.reshape(shape + (len(OFFSETS), ))
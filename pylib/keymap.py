@@ -0,0 +1,92 @@
+"""
+A compact map from record keys to database IDs.
+
+The eBird ingest has to remember the ID of every place & event it has seen
+so far. As Python dicts keyed by tuples & strings this costs well over 100
+bytes per key and every update copied the whole dict. Here a key is a 64-bit
+hash and the map is sorted arrays of hashes & IDs, 16 bytes per key, that
+are searched & updated a whole column at a time.
+
+The arrays are kept in sorted runs. Each batch of new keys becomes a run
+and a run is merged into the one before it when that one is no bigger, like
+a binary counter. So the runs double in size from the newest to the oldest,
+there are only ~log2(keys / batch) of them to search, and each key is copied
+~log2(keys / batch) times in all instead of the whole map being copied for
+every batch.
+
+We don't spill the map to a memory mapped file. At 16 bytes per key the
+~17M eBird events take ~270 MB, which fits in memory comfortably.
+
+With ~20M keys the odds of any two distinct keys having the same hash are
+around 1 in 100,000.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def hash_keys(keys):
+    """Hash a series, or the rows of a data frame, into 64-bit keys."""
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+class KeyMap:
+    """Map hashed keys (see hash_keys) to integer IDs."""
+
+    def __init__(self, hashes=(), ids=()):
+        self.runs = []  # Sorted (hashes, ids) array pairs, biggest first
+        self.add(hashes, ids)
+
+    def __len__(self):
+        return sum(hashes.shape[0] for hashes, _ in self.runs)
+
+    def lookup(self, hashes):
+        """Get the IDs of the hashes and flag the ones that are in the map."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        order = np.argsort(hashes)  # Sorted searches are cache friendly
+        hashes = hashes[order]
+
+        ids = np.zeros(hashes.shape, dtype=np.int64)
+        found = np.zeros(hashes.shape, dtype=bool)
+        for run_hashes, run_ids in self.runs:
+            where = np.searchsorted(run_hashes, hashes)
+            hit = where < run_hashes.shape[0]
+            hit[hit] = run_hashes[where[hit]] == hashes[hit]
+            ids[hit] = run_ids[where[hit]]
+            found |= hit
+
+        unsorted = np.empty_like(order)
+        unsorted[order] = np.arange(order.shape[0])
+        return ids[unsorted], found[unsorted]
+
+    def contains(self, hashes):
+        """Flag the hashes that are already in the map."""
+        return self.lookup(hashes)[1]
+
+    def get(self, hashes):
+        """Get the IDs for the hashes. They must all be in the map."""
+        ids, found = self.lookup(hashes)
+        if not found.all():
+            raise KeyError(f'{(~found).sum():,} keys are not in the map')
+        return ids
+
+    def add(self, hashes, ids):
+        """Add new hashes and their IDs to the map as a run."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        ids = np.asarray(ids, dtype=np.int64)
+        if hashes.shape[0] == 0:
+            return
+
+        order = np.argsort(hashes, kind='stable')
+        run = hashes[order], ids[order]
+
+        while self.runs and self.runs[-1][0].shape[0] <= run[0].shape[0]:
+            run = merge(self.runs.pop(), run)
+        self.runs.append(run)
+
+
+def merge(run, other):
+    """Merge two sorted (hashes, ids) runs."""
+    where = np.searchsorted(run[0], other[0])
+    return (np.insert(run[0], where, other[0]),
+            np.insert(run[1], where, other[1]))
@@ -10,13 +10,14 @@ observation. The data is broken into 5 files:
 4) The band table which contains information about the bird's condition. This
     corresponds to the counts table. A count of one is assumed.
 5) The breeding status for a species of birds at a station during a year.
+
+The bands, status, effort, and stations are joined once in memory and each
+record is written straight into its final table. There are no staging tables.
 """
 
-import os
 from pathlib import Path
 import pandas as pd
-from simpledbf import Dbf5
-from . import db
+from . import dates, db, dbf, geohash, metrics
 from .util import log, json_object
 
 
@@ -27,60 +28,74 @@ BAND = '1016B19'
 EFFORT = '1016E19'
 STATUS = '1016M19'
 STATIONS = 'STATIONS'
-
-
-def ingest():
+STAGING_TABLES = 'maps_stations maps_effort maps_status maps_bands'.split()
+EVENT_KEYS = ['STA', 'NET', 'DATE']
+RADII = {
+    '01S': 30.92,
+    '05S': 30.92 * 5,
+    '10S': 30.92 * 10,
+    '01M': 111.32 * 1000,
+    '10M': 111.32 * 1000 * 10,
+    'BLK': 111.32 * 1000 * 10}
+
+
+def ingest(session):
     """Ingest the data."""
-    convert_dbf_to_csv(LIST)
-    convert_dbf_to_csv(BAND)
-    convert_dbf_to_csv(STATUS)
-    convert_dbf_to_csv(EFFORT)
+    db.delete_dataset_records(session, DATASET_ID)
 
-    db.delete_dataset_records(DATASET_ID)
-
-    db.insert_dataset({
+    db.insert_dataset(session, {
         'dataset_id': DATASET_ID,
         'title': 'MAPS: Monitoring Avian Productivity and Survivorship',
         'version': '2019.0',
         'url': 'https://www.birdpop.org/pages/maps.php'})
 
-    insert_stations()
-    insert_status()
-    insert_effort()
-    insert_bands()
-
-    insert_taxa()
-    insert_places()
-    insert_events()
-    insert_counts()
+    # Older versions of this module left these behind
+    for table in STAGING_TABLES:
+        db.drop_table(session, table)
 
+    insert_taxa(session)
+    places = insert_places(session)
+    bands = get_bands(session)
+    events = insert_events(session, bands, places)
+    insert_counts(session, bands, events)
 
-def convert_dbf_to_csv(file_name):
-    """Convert DBF files to CSV files."""
-    csv_file = RAW_DIR / f'{file_name}.csv'
-    dbf_file = RAW_DIR / f'{file_name}.DBF'
-    if not os.path.exists(csv_file):
-        log(f'Converting {dbf_file} files to {csv_file}')
-        dbf = Dbf5(dbf_file)
-        df = dbf.to_dataframe()
-        df.to_csv(csv_file, index=False)
 
+@metrics.timed
+def insert_taxa(session):
+    """
+    Insert MAPS taxon data.
 
-def insert_taxa():
-    """Insert MAPS taxon data."""
+    Taxa that are already in the database with no SPEC code are matched to
+    the MAPS list by scientific name and given the code. Only the species
+    that are new by code and by name are inserted.
+    """
     log(f'Inserting {DATASET_ID} taxa')
 
-    df = pd.read_csv(RAW_DIR / f'{LIST}.csv')
+    df = dbf.read_dbf(RAW_DIR / f'{LIST}.DBF')
     df['SCINAME'] = df['SCINAME'].str.split().str.join(' ')
     df['GENUS'] = df['SCINAME'].str.split().str[0]
-    df.to_sql('maps_list', db.connect(), if_exists='replace', index=False)
+    db.replace_table(session, 'maps_list', df)
+
+    # Taxa already in the database, from Clements say, get the MAPS SPEC code
+    # so that the bands can be linked to them.
+    sql = """
+        UPDATE taxa
+           SET spec = (SELECT spec FROM maps_list
+                        WHERE maps_list.sciname = taxa.sci_name)
+         WHERE spec IS NULL
+           AND sci_name IN (SELECT sciname FROM maps_list);
+        """
+    session.cxn.execute(sql)
 
     # Look for taxa that are not already in the database. We are looking for
     # SPEC codes in the maps taxa table (maps_list) not in the database. Then
-    # we insert the missing ones.
+    # we insert the missing ones. Most taxa have no SPEC code, so leave out
+    # the NULLs, a NOT IN list with a NULL in it never matches.
     sql = """
         WITH new_taxa AS (SELECT * FROM maps_list
-                           WHERE spec NOT IN (SELECT spec FROM taxa))
+                           WHERE spec NOT IN (SELECT spec FROM taxa
+                                               WHERE spec IS NOT NULL)
+                             AND sciname NOT IN (SELECT sci_name FROM taxa))
         INSERT INTO taxa
             (class, genus, sci_name, common_name, spec)
         SELECT 'aves'     AS class,
@@ -90,191 +105,146 @@ def insert_taxa():
                spec
           FROM new_taxa;
         """
-    with db.connect() as cxn:
-        cxn.execute(sql)
-        cxn.commit()
+    session.cxn.execute(sql)
+    session.ids.refresh(session.cxn, 'taxa')
+
 
+@metrics.timed
+def insert_places(session):
+    """
+    Insert MAPS place data.
 
-def insert_stations():
-    """Build a table to hold the raw MAPS stations data."""
-    log(f'Inserting {DATASET_ID} stations')
+    This is a direct conversion of the MAPS stations into the database's
+    places table. We filter on valid station codes, latitudes, and
+    longitudes. We also convert some fields like to place_json and precision
+    to radius. Return the station code of each place for the events.
+    """
+    log(f'Inserting {DATASET_ID} places')
 
     df = pd.read_csv(RAW_DIR / f'{STATIONS}.csv', dtype='unicode')
-    df['place_id'] = db.create_ids(df, 'places')
+    df['place_id'] = db.create_ids(session, df, 'places')
     df['place_json'] = json_object(df, """STATION LOC STA STA2 NAME LHOLD
         HOLDCERT O NEARTOWN COUNTY STATE US REGION BLOCK LATITUDE LONGITUDE
         PRECISION SOURCE DATUM DECLAT DECLNG NAD83 ELEV STRATUM BCR HABITAT
         REG PASSED""".split())
-    df.to_sql('maps_stations', db.connect(), if_exists='replace', index=False)
-
-
-def insert_effort():
-    """Build a table to hold the raw MAPS effort data."""
-    log(f'Inserting {DATASET_ID} effort')
-    cxn = db.connect()
-
-    df = pd.read_csv(RAW_DIR / f'{EFFORT}.csv', dtype='unicode')
-    df.to_sql('maps_effort', cxn, if_exists='replace', index=False)
-
-    cxn.executescript("UPDATE maps_effort SET net = '?' WHERE net is NULL;")
-    cxn.commit()
-
-
-def insert_status():
-    """Build a table to hold the raw MAPS effort data."""
-    log(f'Inserting {DATASET_ID} status')
-    cxn = db.connect()
-
-    df = pd.read_csv(RAW_DIR / f'{STATUS}.csv', dtype='unicode')
-    df.to_sql('maps_status', cxn, if_exists='replace', index=False)
-
-    cxn.commit()
-
 
-def insert_bands():
-    """Build a table to hold the raw MAPS bands data."""
-    log(f'Inserting {DATASET_ID} bands')
-    cxn = db.connect()
+    df['dataset_id'] = DATASET_ID
+    df['lng'] = pd.to_numeric(df.DECLNG, errors='coerce')
+    df['lat'] = pd.to_numeric(df.DECLAT, errors='coerce')
+    df['radius'] = df.PRECISION.map(RADII)
 
-    df = pd.read_csv(RAW_DIR / f'{BAND}.csv', dtype='unicode')
-    df['count_id'] = db.create_ids(df, 'counts')
+    df = df.loc[(df.STA.str.len() > 3)
+                & df.lng.between(-180.0, 180.0)
+                & df.lat.between(-90.0, 90.0)].copy()
+    df['geohash'] = geohash.encode(df.lng, df.lat)
 
-    df.to_sql('maps_bands', cxn, if_exists='replace', index=False)
-    cxn.executescript("UPDATE maps_bands SET net = '?' WHERE net is NULL;")
+    db.insert_records(session, 'places', df.loc[:, db.PLACE_FIELDS])
+    return df.loc[:, ['STA', 'place_id']]
 
-    sql = """
-        ALTER TABLE maps_bands ADD COLUMN YS TEXT;
-        ALTER TABLE maps_bands ADD COLUMN year TEXT;
 
-        UPDATE maps_bands SET year = SUBSTR(date, 1, 4);
+@metrics.timed
+def get_bands(session):
+    """
+    Get the bands with their breeding status and count_json.
 
-        CREATE INDEX maps_bands_idx ON maps_bands (year, sta, spec);
-        CREATE INDEX maps_status_idx ON maps_status (yr, sta, spec);
+    The status is looked up with a hash join on the year, station, and
+    species. Only the columns the events & counts need are kept.
+    """
+    log(f'Joining {DATASET_ID} bands & status')
 
-        UPDATE maps_bands AS b
-           SET ys = (SELECT s.ys
-                       FROM maps_status AS s
-                      WHERE b.year = s.yr
-                        AND b.sta  = s.sta
-                        AND b.spec = s.spec);
-        """
-    with db.connect() as cxn:
-        cxn.executescript(sql)
-        cxn.commit()
+    df = dbf.read_dbf(RAW_DIR / f'{BAND}.DBF')
+    df['count_id'] = db.create_ids(session, df, 'counts')
+    df['NET'] = df.NET.fillna('?')
+    df['year'] = df.DATE.str[:4]
 
-    df = pd.read_sql('SELECT * FROM maps_bands;', cxn)
+    # Like an SQL join, missing keys never match & the first status wins
+    keys = ['year', 'STA', 'SPEC']
+    status = dbf.read_dbf(RAW_DIR / f'{STATUS}.DBF')
+    status = status.rename(columns={'YR': 'year'})
+    status = status.dropna(subset=keys).drop_duplicates(keys)
+    df = df.merge(status.loc[:, keys + ['YS']], how='left', on=keys)
 
     df['count_json'] = json_object(df, """LOC BI BS PG C OBAND BAND SSN NUMB
         OSP SPEC OSP6 SPEC6 OA OHA AGE HA HA OWRP OWRP WRP OS OHS SEX HS SK CP
         BP F BM FM FW JP WNG WEIGHT STATUS DATE TIME STA STATION NET ANET DISP
         NOTE PPC SSC PPF SSF TT RR HD UPP UNP BPL NF FP SW COLOR SC CC BC MC
         WC JC OV1 V1 VM V94 V95 V96 V97 OVYR VYR N B A YS""".split())
-    df.to_sql('maps_bands', cxn, if_exists='replace', index=False)
 
+    return df.loc[:, EVENT_KEYS + ['STATION', 'SPEC', 'count_id',
+                                   'count_json']]
 
-def insert_places():
-    """
-    Insert MAPS place data.
 
-    This is a direct conversion of the MAPS place data (maps_stations) into
-    the database's places table. We filter on valid data codes, latitudes,
-    and longitudes. We also convert some fields like to place_json and
-    precision to radius.
-    """
-    log(f'Inserting {DATASET_ID} places')
+@metrics.timed
+def get_effort():
+    """Get the effort for each station, net, and date."""
+    df = dbf.read_dbf(RAW_DIR / f'{EFFORT}.DBF')
+    df['NET'] = df.NET.fillna('?')
+    df = df.dropna(subset=['STA', 'DATE'])
+    for column, time in (('started', 'START'), ('ended', 'END')):
+        mins = dates.hmm_to_minutes(df[time]).fillna(0)  # Missing is midnight
+        df[column] = dates.to_hh_mm(mins)
+    groups = df.groupby(EVENT_KEYS)
+    return pd.concat([
+        groups.started.min(),
+        groups.ended.max(),
+        group_max(df, EVENT_KEYS, 'LENGTH')], axis='columns').reset_index()
 
-    sql = """
-        INSERT INTO places
-            (place_id, dataset_id, lng, lat, radius, place_json)
-        SELECT place_id,
-               ?                    AS dataset_id,
-               CAST(declng AS REAL) AS lng,
-               CAST(declat AS REAL) AS lat,
-               CAST(CASE precision
-                    WHEN '01S' THEN 30.92
-                    WHEN '05S' THEN 30.92 * 5
-                    WHEN '10S' THEN 30.92 * 10
-                    WHEN '01M' THEN 111.32 * 1000
-                    WHEN '10M' THEN 111.32 * 1000 * 10
-                    WHEN 'BLK' THEN 111.32 * 1000 * 10
-                    ELSE null
-                    END AS REAL) AS radius,
-               place_json
-          FROM maps_stations
-         WHERE LENGTH(sta) > 3
-           AND lng BETWEEN -180.0 AND 180.0
-           AND lat BETWEEN  -90.0 AND  90.0;
-        """
-    with db.connect() as cxn:
-        cxn.execute(sql, (DATASET_ID, ))
-        cxn.commit()
+
+def group_max(df, keys, column):
+    """Get the largest non-empty value of a text column in each group."""
+    return df.sort_values(column).groupby(keys)[column].last()
 
 
-def insert_events():
-    """Insert events."""
+@metrics.timed
+def insert_events(session, bands, places):
+    """
+    Insert events.
+
+    The bands are grouped by station, net, and date to make the events. Bands
+    at stations without a place are skipped. Return the events' keys for the
+    counts.
+    """
     log(f'Inserting {DATASET_ID} events')
 
-    cxn = db.connect()
+    place_ids = places.groupby('STA').place_id.max()
 
-    # Group the events by STA, NET, and DATE
-    sql = """
-        SELECT
-            MAX(place_id)                           AS place_id,
-            CAST(STRFTIME('%Y', b.date) AS INTEGER) AS year,
-            CAST(STRFTIME('%j', b.date) AS INTEGER) AS day,
-            MIN(PRINTF('%s:%s', SUBSTR(COALESCE(e.start, '000'), 1, 2),
-                SUBSTR(COALESCE(e.start, '000') || '00', 3, 2)))  AS started,
-            MAX(PRINTF('%s:%s', SUBSTR(COALESCE(e.end, '000'), 1, 2),
-                SUBSTR(COALESCE(e.end, '000')   || '00', 3, 2)))  AS ended,
-            MAX(b.sta)                              AS STA,
-            MAX(COALESCE(b.net, '?'))               AS NET,
-            MAX(b.date)                             AS DATE,
-            MAX(b.station)                          AS STATION,
-            MAX(e.length)                           AS LENGTH
-        FROM maps_bands  AS b
-   LEFT JOIN maps_effort AS e
-          ON b.sta = e.sta AND b.net = e.net AND b.date = e.date
-        JOIN maps_stations AS s ON b.sta = s.sta
-        JOIN places USING (place_id)
-    GROUP BY b.sta, b.net, b.date;
-        """
-    df = pd.read_sql(sql, cxn)
-    df['event_id'] = db.create_ids(df, 'events')
+    df = bands.loc[bands.STA.isin(place_ids.index)]
+    df = group_max(df, EVENT_KEYS, 'STATION').reset_index()
+    df = df.merge(get_effort(), how='left', on=EVENT_KEYS)
+    df[['started', 'ended']] = df[['started', 'ended']].fillna('00:00')
+
+    df['place_id'] = df.STA.map(place_ids)
+    date = pd.to_datetime(df.DATE, errors='coerce')
+    df['year'] = dates.year(date)
+    df['day'] = dates.day(date)
+
+    df['event_id'] = db.create_ids(session, df, 'events')
     df['dataset_id'] = DATASET_ID
     df['event_json'] = json_object(df, 'STA NET DATE STATION LENGTH'.split())
-    df.loc[:, db.EVENT_FIELDS].to_sql(
-        'events', cxn, if_exists='append', index=False)
+    db.insert_records(session, 'events', df.loc[:, db.EVENT_FIELDS])
+
+    return df.loc[:, EVENT_KEYS + ['event_id']]
 
 
-def insert_counts():
+@metrics.timed
+def insert_counts(session, bands, events):
     """
     Insert counts.
 
-    Because we had to group the maps_effort records to make event records we
-    have to try to link to the events records directly.
+    Each band is one count. They are linked to their events by the keys the
+    events were grouped on and to their taxa by species code.
     """
     log(f'Inserting {DATASET_ID} counts')
 
-    sql = """
-        INSERT INTO counts
-            (count_id, event_id, dataset_id, taxon_id, count, count_json)
-        SELECT count_id,
-               event_id,
-               ?          AS dataset_id,
-               taxon_id,
-               1          AS count,
-               count_json
-          FROM maps_bands
-          JOIN events
-                ON sta  = JSON_EXTRACT(event_json, '$.STA')
-               AND net  = JSON_EXTRACT(event_json, '$.NET')
-               AND date = JSON_EXTRACT(event_json, '$.DATE')
-          JOIN taxa USING (spec);
-        """
-    with db.connect() as cxn:
-        cxn.execute(sql, (DATASET_ID, ))
-        cxn.commit()
+    sql = 'SELECT taxon_id, spec AS SPEC FROM taxa WHERE spec IS NOT NULL'
+    taxa = pd.read_sql(sql, session.cxn)
+
+    df = bands.merge(events, on=EVENT_KEYS).merge(taxa, on='SPEC')
+    df['dataset_id'] = DATASET_ID
+    df['count'] = 1
+    db.insert_records(session, 'counts', df.loc[:, db.COUNT_FIELDS])
 
 
 if __name__ == '__main__':
-    ingest()
+    with db.IngestSession() as SESSION:
+        ingest(SESSION)
@@ -0,0 +1,243 @@
+"""
+Time the stages of an ingest.
+
+A stage is any block of work we want to see in the profile: a dataset, an
+eBird chunk, a read_csv() or json_object() call, an insert into a table. Wrap
+it in stage() or decorate the function with timed(). Stages nest, so a stage
+is named by its path, like "chunk/build_counts/json_object", under the dataset
+that is running it. The outermost stage is the dataset itself, its record has
+an empty stage name and holds the dataset's totals.
+
+For each stage run we record:
+- wall & CPU seconds, the CPU time is only for the process that ran it,
+- the rows going in & coming out, when the stage knows them,
+- the rows it wrote to the database, including those of its sub-stages,
+- rows per second, from the rows out or else from the rows written,
+- the process' peak RSS so far.
+
+Nothing is recorded until start() is called, so the stages cost next to
+nothing in a normal run. Worker processes send their stages back with the
+results of captured() and the parent adds them under its running stage.
+"""
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FIELDS = """dataset stage chunk wall_s cpu_s rows_in rows_out rows_written
+    rows_per_s peak_rss_mb""".split()
+SUMS = 'wall_s cpu_s rows_in rows_out rows_written'.split()
+
+ENABLED = False
+RECORDS = []  # The finished stages
+RUNNING = []  # The open stages, outermost first
+
+
+def start():
+    """Start recording stages and forget any old ones."""
+    global ENABLED
+    ENABLED = True
+    RECORDS.clear()
+    RUNNING.clear()
+
+
+def stop():
+    """Stop recording stages."""
+    global ENABLED
+    ENABLED = False
+
+
+@contextmanager
+def stage(name, rows_in=None, chunk=None):
+    """
+    Time a block of work.
+
+    This yields the stage's record, set its rows_out when they are known.
+    The chunk number is passed down to the sub-stages.
+    """
+    if not ENABLED:
+        yield {}
+        return
+
+    parent = RUNNING[-1] if RUNNING else None
+    record = {
+        'dataset': parent['dataset'] if parent else name,
+        'stage': f'{parent["stage"]}/{name}' if parent else '',
+        'chunk': chunk if chunk is not None else (
+            parent['chunk'] if parent else None),
+        'rows_in': rows_in,
+        'rows_out': None,
+        'rows_written': 0}
+    record['stage'] = record['stage'].lstrip('/')
+
+    RUNNING.append(record)
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record['wall_s'] = time.perf_counter() - wall
+        record['cpu_s'] = time.process_time() - cpu
+        RUNNING.pop()
+        finish(record)
+
+
+def finish(record):
+    """Work out the stage's throughput & memory and save it."""
+    rows = record['rows_out']
+    if rows is None:
+        rows = record['rows_written']
+    wall = record['wall_s']
+    record['rows_per_s'] = rows / wall if rows and wall else None
+    record['peak_rss_mb'] = peak_rss_mb()
+    RECORDS.append(record)
+
+
+def timed(func):
+    """
+    Run the function as a stage named after it.
+
+    The rows of its first data frame argument are the rows in and, if it
+    returns a data frame, those rows are the rows out.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return func(*args, **kwargs)
+        frames = [a for a in args if isinstance(a, pd.DataFrame)]
+        rows_in = frames[0].shape[0] if frames else None
+        with stage(func.__name__, rows_in=rows_in) as record:
+            result = func(*args, **kwargs)
+            if isinstance(result, pd.DataFrame):
+                record['rows_out'] = result.shape[0]
+        return result
+    return wrapper
+
+
+def written(rows):
+    """Credit rows written to the database to every running stage."""
+    for record in RUNNING:
+        record['rows_written'] += rows
+
+
+def captured(func, *args, **kwargs):
+    """
+    Call the function in a worker process and return what it recorded.
+
+    This returns (records, result). Pass the records to add() in the parent.
+    """
+    if not ENABLED:
+        return [], func(*args, **kwargs)
+
+    outer = RUNNING[:]
+    RUNNING.clear()
+    first = len(RECORDS)
+    try:
+        with stage(''):
+            result = func(*args, **kwargs)
+    finally:
+        records = RECORDS[first:]
+        del RECORDS[first:]
+        RUNNING[:] = outer
+
+    for record in records:
+        record['stage'] = f'{func.__name__}/{record["stage"]}'.strip('/')
+    return records, result
+
+
+def add(records):
+    """Add stages recorded by a worker under the running stage."""
+    if not ENABLED or not RUNNING:
+        return
+    parent = RUNNING[-1]
+    for record in records:
+        record['dataset'] = parent['dataset']
+        record['stage'] = f'{parent["stage"]}/{record["stage"]}'.strip('/')
+        if record['chunk'] is None:
+            record['chunk'] = parent['chunk']
+        RECORDS.append(record)
+
+
+def peak_rss_mb():
+    """Get the process' peak resident set size in MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def summary():
+    """Total the stages by dataset & stage."""
+    records = frame()
+    if records.empty:
+        return records
+
+    groups = records.groupby(['dataset', 'stage'], sort=False)
+    totals = groups[SUMS].sum(min_count=1)
+    totals.insert(0, 'calls', groups.size())
+    totals['peak_rss_mb'] = groups.peak_rss_mb.max()
+
+    rows = totals.rows_out.fillna(totals.rows_written)
+    totals['rows_per_s'] = (rows / totals.wall_s).where(rows > 0)
+    return totals.reset_index()
+
+
+def summary_lines():
+    """Describe the totals for each dataset, one line each."""
+    totals = summary()
+    if totals.empty:
+        return []
+
+    lines = []
+    for row in totals[totals.stage == ''].itertuples():
+        rate = f'{row.rows_per_s:,.0f}' if pd.notna(row.rows_per_s) else '-'
+        rss = f'{row.peak_rss_mb:,.0f}' if pd.notna(row.peak_rss_mb) else '-'
+        lines.append(
+            f'{row.dataset}: {row.wall_s:,.1f} s wall, {row.cpu_s:,.1f} s CPU,'
+            f' {row.rows_written:,.0f} rows written ({rate} rows/s),'
+            f' peak RSS {rss} MB')
+    return lines
+
+
+def write_report(path):
+    """
+    Write the profile to a JSON or CSV file, by its suffix.
+
+    The JSON file has the totals by stage and every stage run. The CSV file
+    has every stage run, one per line.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    records = frame()
+
+    if path.suffix.lower() == '.csv':
+        records.to_csv(path, index=False)
+    else:
+        report = {
+            'summary': to_dicts(summary()),
+            'stages': to_dicts(records)}
+        with open(path, 'w') as out_file:
+            json.dump(report, out_file, indent=2)
+
+
+def frame():
+    """Get the stage records as a data frame."""
+    records = pd.DataFrame(RECORDS, columns=FIELDS)
+    records['chunk'] = records['chunk'].astype('Int64')
+    numbers = FIELDS[FIELDS.index('wall_s'):]
+    records[numbers] = records[numbers].astype(float)
+    return records
+
+
+def to_dicts(df):
+    """Convert a data frame to a list of JSON-ready records."""
+    return json.loads(df.to_json(orient='records'))
@@ -0,0 +1,114 @@
+"""
+Copy the SQLite3 database straight into the PostgreSQL database.
+
+Rows are streamed from SQLite3 into psql's COPY FROM STDIN, so there are no
+CSV files on disk. The tables are cut into the same row ID shards as the CSV
+export and several shards, from any of the tables, are copied at once, each by
+its own process & psql session. The PostgreSQL tables are created bare, their
+keys, constraints, & indexes are built after the load. We fill in the places'
+geopoints on the way in, their geohashes were made by the ingest.
+
+Each shard commits on its own. A migrate always starts from scratch, the
+PostgreSQL tables are dropped & created again, and if any shard fails the
+tables are emptied so that a half loaded database is never left behind. Run
+the whole migrate again after fixing the problem.
+"""
+
+import csv
+import sqlite3
+import subprocess
+from multiprocessing import Pool
+
+from . import db, export
+from .util import log
+
+SHARD_ROWS = 5_000_000
+FETCH_ROWS = 10_000
+NULL = r'\N'  # So that empty strings are not loaded as NULLs
+
+
+def migrate(shard_rows=SHARD_ROWS, workers=1):
+    """Copy all of the SQLite3 tables into a new PostgreSQL database."""
+    db.create_postgres(defer_indexes=True)
+
+    shards = []
+    for table in db.TABLES:
+        ranges = export.shard_ranges(table, shard_rows=shard_rows)
+        shards += [(table, first, last) for first, last in ranges]
+
+    log(f'Copying {len(shards):,} shards')
+    try:
+        if workers <= 1:
+            counts = list(map(copy_shard, shards))
+        else:
+            with Pool(workers) as pool:
+                counts = list(pool.imap_unordered(copy_shard, shards))
+    except BaseException:
+        log('The copy failed, emptying the PostgreSQL tables')
+        empty_tables()
+        raise
+    log(f'Copied {sum(counts):,} rows')
+
+    db.create_postgres_indexes()
+
+
+def copy_shard(shard):
+    """Stream one shard of a table into PostgreSQL and return its row count."""
+    table, first, last = shard
+
+    cxn = sqlite3.connect(db.DB_FILE)
+    columns = [r[1] for r in cxn.execute(f'PRAGMA table_info({table})')]
+
+    fields = ', '.join(f'IFNULL("{c}", :null)' for c in columns)
+    where = 'rowid >= :first' + (' AND rowid <= :last' if last else '')
+    sql = f'SELECT {fields} FROM {table} WHERE {where} ORDER BY rowid'
+    params = {'null': NULL, 'first': first, 'last': last}
+    cursor = cxn.execute(sql, params)
+
+    quoted = ', '.join(f'"{c}"' for c in columns)
+    copy = (f"\\copy {table} ({quoted}) FROM pstdin "
+            f"WITH (FORMAT csv, NULL '{NULL}')")
+    cmd = db.PSQL.split() + ['-v', 'ON_ERROR_STOP=1', '-q', '-c', copy]
+
+    rows = 0
+    with subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, encoding='utf-8') as psql:
+        writer = csv.writer(psql.stdin, lineterminator='\n')
+        try:
+            while batch := cursor.fetchmany(FETCH_ROWS):
+                if table == 'places':
+                    batch = add_geopoint(batch, columns)
+                writer.writerows(batch)
+                rows += len(batch)
+        except BaseException:
+            psql.kill()  # Do not let psql commit a partial shard
+            raise
+        psql.stdin.close()
+    cxn.close()
+
+    if psql.returncode:
+        raise subprocess.CalledProcessError(psql.returncode, cmd)
+
+    log(f'Copied {rows:,} {table} rows starting at row ID {first}')
+    return rows
+
+
+def empty_tables():
+    """Remove the rows of every table so there is no partial copy."""
+    sql = f'TRUNCATE {", ".join(db.TABLES)}'
+    subprocess.run(
+        db.PSQL.split() + ['-v', 'ON_ERROR_STOP=1', '-q', '-c', sql],
+        check=True)
+
+
+def add_geopoint(batch, columns):
+    """Fill in the places' geopoint column, the geohash comes from SQLite3."""
+    lng_at, lat_at = columns.index('lng'), columns.index('lat')
+    point_at = columns.index('geopoint')
+
+    rows = []
+    for row in batch:
+        row = list(row)
+        row[point_at] = f'SRID=4326;POINT({row[lng_at]} {row[lat_at]})'
+        rows.append(row)
+    return rows
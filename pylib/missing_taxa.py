@@ -2,13 +2,13 @@
 
 from pathlib import Path
 import pandas as pd
-from . import db
+from . import db, dbf
 
 
 OUTPUT_CSV = Path('output') / 'missing_taxa.csv'
 TARGET_CSV = Path('data') / 'raw' / 'taxonomy' / 'target_birds.csv'
 BBS_CSV = Path('data') / 'raw' / 'bbs' / 'breed_bird_survey_species.csv'
-MAPS_CSV = Path('data') / 'raw' / 'maps' / 'LIST17.csv'
+MAPS_DBF = Path('data') / 'raw' / 'taxonomy' / 'IBP_LIST17_species.dbf'
 COLUMNS = 'dataset sci_name common_name key'.split()
 
 
@@ -16,41 +16,42 @@ def missing_birds():
     """Find scientific names that are not in Clements taxonomy."""
     taxa = pd.DataFrame(columns=COLUMNS)
     taxa.to_csv(OUTPUT_CSV, index=False)
-    missing_targets()
-    missing_bbs()
-    missing_maps()
+    with db.IngestSession() as session:
+        missing_targets(session)
+        missing_bbs(session)
+        missing_maps(session)
 
 
-def missing_targets():
+def missing_targets(session):
     """Find target birds missing from Clements taxonomy."""
     taxa = pd.read_csv(TARGET_CSV)
     taxa['dataset'] = 'target birds'
     taxa['key'] = ''
-    taxa = db.drop_duplicate_taxa(taxa)
+    taxa = db.drop_duplicate_taxa(session, taxa)
     taxa.loc[:, COLUMNS].to_csv(
         OUTPUT_CSV, mode='a', index=False, header=False)
 
 
-def missing_bbs():
+def missing_bbs(session):
     """Find bbs birds missing from Clements taxonomy."""
     taxa = pd.read_csv(BBS_CSV)
     taxa['sci_name'] = taxa.genus + ' ' + taxa.species
     taxa['common_name'] = taxa.english_common_name
     taxa['dataset'] = 'bbs'
     taxa['key'] = taxa.aou.apply(lambda x: f'aou = {x}')
-    taxa = db.drop_duplicate_taxa(taxa)
+    taxa = db.drop_duplicate_taxa(session, taxa)
     taxa.loc[:, COLUMNS].to_csv(
         OUTPUT_CSV, mode='a', index=False, header=False)
 
 
-def missing_maps():
+def missing_maps(session):
     """Find maps birds missing from Clements taxonomy."""
-    taxa = pd.read_csv(MAPS_CSV)
+    taxa = dbf.read_dbf(MAPS_DBF)
     taxa['sci_name'] = taxa.SCINAME
     taxa['common_name'] = taxa.COMMONNAME
     taxa['dataset'] = 'maps'
     taxa['key'] = taxa.SPEC.apply(lambda x: f'SPEC = {x}')
-    taxa = db.drop_duplicate_taxa(taxa)
+    taxa = db.drop_duplicate_taxa(session, taxa)
     taxa.loc[:, COLUMNS].to_csv(
         OUTPUT_CSV, mode='a', index=False, header=False)
 
@@ -2,7 +2,10 @@
 
 from pathlib import Path
 import pandas as pd
+from . import dates
 from . import db
+from . import geohash
+from . import metrics
 from . import util
 from .util import log
 
@@ -12,24 +15,25 @@ RAW_DIR = Path('data') / 'raw' / DATASET_ID
 DATA_CSV = RAW_DIR / 'NABA_JULY4_V2.csv'
 
 
-def ingest():
+def ingest(session):
     """Ingest the data."""
     raw_data = get_raw_data()
 
-    db.delete_dataset_records(DATASET_ID)
+    db.delete_dataset_records(session, DATASET_ID)
 
-    db.insert_dataset({
+    db.insert_dataset(session, {
         'dataset_id': DATASET_ID,
         'title': 'NABA',
         'version': '2018-07-04',
         'url': ''})
 
-    to_taxon_id = insert_taxa(raw_data)
-    to_place_id = insert_places(raw_data)
-    to_event_id = insert_events(raw_data, to_place_id)
-    insert_counts(raw_data, to_event_id, to_taxon_id)
+    to_taxon_id = insert_taxa(session, raw_data)
+    to_place_id = insert_places(session, raw_data)
+    to_event_id = insert_events(session, raw_data, to_place_id)
+    insert_counts(session, raw_data, to_event_id, to_taxon_id)
 
 
+@metrics.timed
 def get_raw_data():
     """Read raw data."""
     log(f'Getting {DATASET_ID} raw data')
@@ -61,12 +65,11 @@ def get_raw_data():
     return raw_data
 
 
-def insert_taxa(raw_data):
+@metrics.timed
+def insert_taxa(session, raw_data):
     """Insert taxa."""
     log(f'Inserting {DATASET_ID} taxa')
 
-    cxn = db.connect()
-
     has_code = raw_data.SPECIES_CODE.notna()
     raw_taxa = raw_data.loc[has_code, :]
 
@@ -86,25 +89,26 @@ def insert_taxa(raw_data):
     fields = 'SPECIES_CODE Gen_Tribe_Fam Species'.split()
     taxa['taxon_json'] = util.json_object(taxa, fields)
 
-    taxa = db.drop_duplicate_taxa(taxa)
-    taxa['taxon_id'] = db.create_ids(taxa, 'taxa')
+    taxa = db.drop_duplicate_taxa(session, taxa)
+    taxa['taxon_id'] = db.create_ids(session, taxa, 'taxa')
     taxa.taxon_id = taxa.taxon_id.astype(int)
-    taxa.loc[:, db.TAXON_FIELDS].to_sql(
-        'taxa', cxn, if_exists='append', index=False)
+    db.insert_records(session, 'taxa', taxa.loc[:, db.TAXON_FIELDS])
 
     raw_taxa = raw_taxa.set_index('sci_name')
     sql = """SELECT * FROM taxa"""
-    taxa = pd.read_sql(sql, db.connect()).set_index('sci_name')
+    taxa = pd.read_sql(sql, session.cxn).set_index('sci_name')
     taxa = taxa.merge(raw_taxa, how='inner', left_index=True, right_index=True)
-    db.update_taxa_json(taxa, fields)
+    db.update_taxa_json(session, taxa, fields)
 
     sql = """SELECT sci_name, taxon_id
                FROM taxa
               WHERE "class" = 'lepidoptera'"""
-    return pd.read_sql(sql, cxn).set_index('sci_name').taxon_id.to_dict()
+    return pd.read_sql(sql, session.cxn).set_index(
+        'sci_name').taxon_id.to_dict()
 
 
-def insert_places(raw_data):
+@metrics.timed
+def insert_places(session, raw_data):
     """Insert places."""
     log(f'Inserting {DATASET_ID} places')
 
@@ -112,35 +116,36 @@ def insert_places(raw_data):
 
     places = pd.DataFrame()
 
-    raw_places['place_id'] = db.create_ids(raw_places, 'places')
+    raw_places['place_id'] = db.create_ids(session, raw_places, 'places')
     places['place_id'] = raw_places['place_id']
 
     places['lng'] = pd.to_numeric(raw_places['LONGITUDE'], errors='coerce')
     places['lat'] = pd.to_numeric(raw_places['LATITUDE'], errors='coerce')
+    places['geohash'] = geohash.encode(places.lng, places.lat)
     places['radius'] = None
     places['dataset_id'] = DATASET_ID
 
     places['place_json'] = util.json_object(raw_places, ['SITE_ID'])
 
-    places.to_sql('places', db.connect(), if_exists='append', index=False)
+    db.insert_records(session, 'places', places)
 
     return raw_places.reset_index().set_index(
         ['LONGITUDE', 'LATITUDE'], verify_integrity=True).place_id.to_dict()
 
 
-def insert_events(raw_data, to_place_id):
+@metrics.timed
+def insert_events(session, raw_data, to_place_id):
     """Insert events."""
     log(f'Inserting {DATASET_ID} events')
 
     raw_events = raw_data.drop_duplicates(['iYear', 'Month', 'Day']).copy()
 
-    raw_events['date'] = raw_events.apply(
-        lambda x: f'{x.iYear}-{x.Month}-{x.Day}', axis=1)
-    raw_events['date'] = pd.to_datetime(raw_events['date'])
+    raw_events['date'] = dates.from_parts(
+        raw_events.iYear, raw_events.Month, raw_events.Day)
 
     events = pd.DataFrame()
 
-    raw_events['event_id'] = db.create_ids(raw_events, 'events')
+    raw_events['event_id'] = db.create_ids(session, raw_events, 'events')
     events['event_id'] = raw_events.event_id
 
     raw_events['place_key'] = tuple(zip(
@@ -148,8 +153,8 @@ def insert_events(raw_data, to_place_id):
     raw_events['place_id'] = raw_events.place_key.map(to_place_id)
     events['place_id'] = raw_events.place_id
 
-    events['year'] = raw_events['date'].dt.strftime('%Y')
-    events['day'] = raw_events['date'].dt.strftime('%j')
+    events['year'] = dates.year(raw_events['date'])
+    events['day'] = dates.day(raw_events['date'])
 
     events['started'] = None
     events['ended'] = None
@@ -158,20 +163,21 @@ def insert_events(raw_data, to_place_id):
     events['event_json'] = util.json_object(raw_events, fields)
     events['dataset_id'] = raw_events.dataset_id
 
-    events.to_sql('events', db.connect(), if_exists='append', index=False)
+    db.insert_records(session, 'events', events)
 
     return raw_events.reset_index().set_index(
         ['iYear', 'Month', 'Day'], verify_integrity=True).event_id.to_dict()
 
 
-def insert_counts(raw_data, to_event_id, to_taxon_id):
+@metrics.timed
+def insert_counts(session, raw_data, to_event_id, to_taxon_id):
     """Insert counts."""
     log(f'Inserting {DATASET_ID} counts')
 
     raw_data['key'] = tuple(zip(raw_data.iYear, raw_data.Month, raw_data.Day))
 
     counts = pd.DataFrame()
-    counts['count_id'] = db.create_ids(raw_data, 'counts')
+    counts['count_id'] = db.create_ids(session, raw_data, 'counts')
     counts['event_id'] = raw_data.key.map(to_event_id)
     counts['taxon_id'] = raw_data.sci_name.map(to_taxon_id)
     counts['count'] = raw_data.SumOfBFLY_COUNT.fillna(0)
@@ -182,8 +188,9 @@ def insert_counts(raw_data, to_event_id, to_taxon_id):
     has_taxon_id = counts.taxon_id.notna()
     counts = counts.loc[has_event_id & has_taxon_id, :]
 
-    counts.to_sql('counts', db.connect(), if_exists='append', index=False)
+    db.insert_records(session, 'counts', counts)
 
 
 if __name__ == '__main__':
-    ingest()
+    with db.IngestSession() as SESSION:
+        ingest(SESSION)
@@ -8,8 +8,13 @@ sampled data so the dates of events are approximate. All data is in one file.
 from pathlib import Path
 from datetime import datetime
 import pandas as pd
+from . import dates
 from . import db
+from . import geohash
+from . import metrics
+from . import readers
 from . import util
+from .delta import Delta, key_columns, key_hashes
 from .util import log
 
 
@@ -26,27 +31,44 @@ COUNT_FIELDS = "SPECIES_CODE taxon_id count_type""".split()
 NUMBERS = """CLUTCH_SIZE_HOST_ATLEAST EGGS_HOST_UNH_ATLEAST
     YOUNG_HOST_TOTAL_ATLEAST YOUNG_HOST_FLEDGED_ATLEAST
     YOUNG_HOST_DEAD_ATLEAST ATTEMPT_ID""".split()
+PLACE_FIELDS = """LOC_ID SUBNATIONAL1_CODE ELEVATION_M HEIGHT_M
+    REL_TO_SUBSTRATE SUBSTRATE_CODE""".split()
+COLUMNS = set(['LONGITUDE', 'LATITUDE'] + PLACE_FIELDS + EVENT_FIELDS[:-2]
+              + COUNT_FIELDS[:-2] + NUMBERS)
 
+NATURAL_KEYS = {
+    'places': ['LOC_ID'],
+    'events': ['ATTEMPT_ID', 'event_type'],
+    'counts': ['events.ATTEMPT_ID', 'events.event_type', 'count_type']}
 
-def ingest():
+
+def ingest(session):
     """Ingest the data."""
 
-    db.delete_dataset_records(DATASET_ID)
+    if not session.incremental:
+        db.delete_dataset_records(session, DATASET_ID)
 
-    to_taxon_id = get_taxa()
+    to_taxon_id = get_taxa(session)
     raw_data = get_raw_data(to_taxon_id)
 
-    db.insert_dataset({
+    db.insert_dataset(session, {
         'dataset_id': DATASET_ID,
         'title': 'Nestwatch',
         'version': '2020-10-14',
         'url': ''})
 
-    insert_places(raw_data)
-    insert_events_and_counts(raw_data)
+    deltas = {table: Delta(session, table, DATASET_ID, keys, repeats=False)
+              for table, keys in NATURAL_KEYS.items()}
+
+    insert_places(session, raw_data, deltas['places'])
+    insert_events_and_counts(session, raw_data, deltas)
+
+    for table in ['counts', 'events', 'places']:
+        deltas[table].delete_missing()
 
 
-def get_taxa():
+@metrics.timed
+def get_taxa(session):
     """
     Get all taxa with a species_code.
 
@@ -55,22 +77,25 @@ def get_taxa():
     """
     log(f'Selecting {DATASET_ID} taxa')
 
-    sql = """
-        SELECT taxon_id,
-         JSON_EXTRACT(taxon_json, '$.eBird_species_code_2018') AS species_code
+    species_code = db.json_field('taxa', 'eBird_species_code_2018')
+    sql = f"""
+        SELECT taxon_id, {species_code} AS species_code
          FROM taxa
         WHERE class = 'aves'
           AND species_code IS NOT NULL
           """
-    taxa = pd.read_sql(sql, db.connect())
+    taxa = pd.read_sql(sql, session.cxn)
     return taxa.set_index('species_code').taxon_id.to_dict()
 
 
+@metrics.timed
 def get_raw_data(to_taxon_id):
     """Read raw data."""
     log(f'Getting {DATASET_ID} raw data')
 
-    raw_data = pd.read_csv(DATA_CSV, dtype='unicode').fillna('')
+    raw_data = readers.read_csv(
+        DATA_CSV, columns=COLUMNS, numbers=['LONGITUDE', 'LATITUDE'])
+    raw_data = raw_data.fillna('')
 
     raw_data['dataset_id'] = DATASET_ID
     raw_data['taxon_id'] = raw_data['SPECIES_CODE'].map(to_taxon_id)
@@ -101,26 +126,26 @@ def get_raw_data(to_taxon_id):
     return raw_data
 
 
-def insert_places(raw_data):
-    """Insert places."""
+@metrics.timed
+def insert_places(session, raw_data, delta):
+    """Insert or update places."""
     log(f'Inserting {DATASET_ID} places')
 
-    place_id = db.next_id('places')
-    raw_data['place_id'] = pd.factorize(raw_data['LOC_ID'])[0] + place_id
-
     places = raw_data.drop_duplicates('LOC_ID').copy()
     places['radius'] = None
+    places['geohash'] = geohash.encode(places.lng, places.lat)
 
-    fields = """LOC_ID SUBNATIONAL1_CODE ELEVATION_M HEIGHT_M
-        REL_TO_SUBSTRATE SUBSTRATE_CODE""".split()
-    places['place_json'] = util.json_object(places, fields)
+    places['place_json'] = util.json_object(places, PLACE_FIELDS)
 
-    places.loc[:, db.PLACE_FIELDS].to_sql(
-        'places', db.connect(), if_exists='append', index=False)
+    place_ids = delta.save(
+        places, key_hashes(places.loc[:, NATURAL_KEYS['places']]))
+    to_place_id = pd.Series(place_ids, index=places['LOC_ID'])
+    raw_data['place_id'] = raw_data['LOC_ID'].map(to_place_id)
 
 
-def insert_events_and_counts(raw_data):
-    """Insert events and counts."""
+@metrics.timed
+def insert_events_and_counts(session, raw_data, deltas):
+    """Insert or update events and counts."""
     log(f'Inserting {DATASET_ID} events and counts')
 
     aggs = {x: pd.Series.max for x in NUMBERS + DATES}
@@ -132,48 +157,47 @@ def insert_events_and_counts(raw_data):
     raw_data['started'] = None
     raw_data['ended'] = None
 
-    df = add_event_records(raw_data, 'FIRST_LAY_DT', 'lay_date')
-    add_count_records(df, 'CLUTCH_SIZE_HOST_ATLEAST')
+    events, counts = deltas['events'], deltas['counts']
+
+    df = add_event_records(events, raw_data, 'FIRST_LAY_DT', 'lay_date')
+    add_count_records(counts, df, 'CLUTCH_SIZE_HOST_ATLEAST')
 
-    df = add_event_records(raw_data, 'HATCH_DT', 'hatch_date')
-    add_count_records(df, 'EGGS_HOST_UNH_ATLEAST')
-    add_count_records(df, 'YOUNG_HOST_TOTAL_ATLEAST')
+    df = add_event_records(events, raw_data, 'HATCH_DT', 'hatch_date')
+    add_count_records(counts, df, 'EGGS_HOST_UNH_ATLEAST')
+    add_count_records(counts, df, 'YOUNG_HOST_TOTAL_ATLEAST')
 
-    df = add_event_records(raw_data, 'FLEDGE_DT', 'fledge_date')
-    add_count_records(df, 'YOUNG_HOST_FLEDGED_ATLEAST')
-    add_count_records(df, 'YOUNG_HOST_DEAD_ATLEAST')
+    df = add_event_records(events, raw_data, 'FLEDGE_DT', 'fledge_date')
+    add_count_records(counts, df, 'YOUNG_HOST_FLEDGED_ATLEAST')
+    add_count_records(counts, df, 'YOUNG_HOST_DEAD_ATLEAST')
 
 
-def add_event_records(df, event_type, event_date):
+@metrics.timed
+def add_event_records(delta, df, event_type, event_date):
     """Add event records for the event type."""
     log(f'Adding {DATASET_ID} event records for {event_type}')
     this_year = datetime.now().year
     df = df.loc[df[event_date].notnull(), :].copy()
-    df['event_id'] = db.create_ids(df, 'events')
-    df['dataset_id'] = DATASET_ID
-    df['year'] = df[event_date].dt.strftime('%Y').astype(int)
-    df['year'] = df['year'].apply(lambda x: x - 100 if x > this_year else x)
-    df['day'] = df[event_date].dt.strftime('%j').astype(int)
+    df['year'] = dates.year(df[event_date])
+    df['year'] = df['year'].where(df['year'] <= this_year, df['year'] - 100)
+    df['day'] = dates.day(df[event_date])
     df['event_type'] = event_type
     df['event_json'] = util.json_object(df, EVENT_FIELDS)
-    df.loc[:, db.EVENT_FIELDS].to_sql(
-        'events', db.connect(), if_exists='append', index=False)
+    df['event_id'] = delta.save(
+        df, key_hashes(df.loc[:, NATURAL_KEYS['events']]))
     return df
 
 
-def add_count_records(df, count_type):
+@metrics.timed
+def add_count_records(delta, df, count_type):
     """Add count records for the count type."""
     log(f'Adding {DATASET_ID} count records for {count_type}')
     has_count = pd.to_numeric(df[count_type], errors='coerce').notna()
     df = df.loc[has_count, :].copy()
     df[count_type] = df[count_type].astype(int)
-    df['count_id'] = db.create_ids(df, 'counts')
-    df['dataset_id'] = DATASET_ID
     df['count'] = df[count_type]
     df['count_type'] = count_type
     df['count_json'] = util.json_object(df, COUNT_FIELDS)
-    df.loc[df['count'].notna(), db.COUNT_FIELDS].to_sql(
-        'counts', db.connect(), if_exists='append', index=False)
+    delta.save(df, key_hashes(df.loc[:, key_columns(NATURAL_KEYS['counts'])]))
 
 
 def first_string(group):
@@ -0,0 +1,240 @@
+"""
+Export the SQLite3 database to a denormalized Parquet dataset.
+
+Analysts mostly pull slices of the places, events, counts, & taxa join by
+year, day, and bounding box. Here that join is written once as a counts table
+partitioned by dataset & year (Hive style: dataset_id=ebird/year=2014/) and
+sorted by day & geohash, so each row group covers a narrow range of days and
+a small area. Readers that push their filters down to the row group
+statistics, like pyarrow.dataset or R's arrow::open_dataset(), only read the
+parts they need.
+
+The JSON blobs are either kept as string columns or split out into their own
+datasets, partitioned the same way and keyed by their IDs, which keeps the
+counts files small.
+"""
+
+import sqlite3
+from multiprocessing import Pool
+from pathlib import Path
+
+import pandas as pd
+
+from . import db, export
+from .util import log, sha256
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa, pq = None, None
+
+CHUNK_ROWS = 1_000_000
+ROW_GROUP_ROWS = 1_000_000
+COMPRESSION = 'zstd'
+COUNTS = 'counts'
+JSON_MODES = ('string', 'split')
+JSON_KEYS = {
+    'place_json': 'place_id',
+    'event_json': 'event_id',
+    'count_json': 'count_id'}
+
+INTEGERS = 'count_id event_id place_id taxon_id day count'.split()
+FLOATS = 'lng lat radius'.split()
+STRINGS = """started ended geohash sci_name group class order family genus
+    common_name category""".split()
+
+SELECT = """
+    SELECT count_id, event_id, place_id, taxon_id,
+           lng, lat, radius, geohash, year, day, started, ended, count,
+           sci_name, "group", "class", "order", family, genus, common_name,
+           category, target, place_json, event_json, count_json
+      FROM counts
+      JOIN events USING (event_id)
+      JOIN places USING (place_id)
+      JOIN taxa   USING (taxon_id)
+     WHERE events.dataset_id = :dataset_id
+       AND year = :year
+  ORDER BY day"""
+
+
+def schemas(json):
+    """Get the Arrow schema of each of a partition's files."""
+    fields = [(c, pa.int64()) for c in INTEGERS]
+    fields += [(c, pa.float64()) for c in FLOATS]
+    fields += [(c, pa.string()) for c in STRINGS]
+    fields += [('target', pa.bool_())]
+
+    if json == 'string':
+        fields += [(c, pa.string()) for c in JSON_KEYS]
+        return {COUNTS: pa.schema(fields)}
+
+    schemas_ = {COUNTS: pa.schema(fields)}
+    for column, key in JSON_KEYS.items():
+        schemas_[column] = pa.schema(
+            [(key, pa.int64()), (column, pa.string())])
+    return schemas_
+
+
+def export_parquet(dataset_ids, export_path, json='string', workers=1):
+    """Export the datasets' counts to Parquet partitions."""
+    if not pa:
+        raise ImportError('Install the pyarrow package for Parquet output')
+
+    export_path = Path(export_path)
+
+    partitions = []
+    for dataset_id in dataset_ids:
+        log(f'Planning {dataset_id} Parquet export')
+        partitions += [(dataset_id, y, export_path, json)
+                       for y in partition_years(dataset_id)]
+
+    log(f'Exporting {len(partitions):,} partitions')
+    if workers <= 1:
+        entries = list(map(write_partition, partitions))
+    else:
+        with Pool(workers) as pool:
+            entries = list(pool.imap_unordered(write_partition, partitions))
+
+    entries = [e for partition in entries for e in partition]
+    export.update_manifest(export_path, entries)
+
+
+def partition_years(dataset_id):
+    """Get the years with events in the dataset."""
+    sql = 'SELECT DISTINCT year FROM events WHERE dataset_id = ? ORDER BY year'
+    cxn = sqlite3.connect(db.DB_FILE)
+    years = [r[0] for r in cxn.execute(sql, (dataset_id, ))]
+    cxn.close()
+    return years
+
+
+def write_partition(partition):
+    """
+    Write one dataset & year partition and return its manifest entries.
+
+    The rows come out of SQLite sorted by day. We hold back the last day of
+    each chunk, it may continue in the next one, and sort the finished days by
+    geohash before they are written.
+    """
+    dataset_id, year, export_path, json = partition
+
+    writers = PartitionWriters(export_path, dataset_id, year, json)
+
+    cxn = sqlite3.connect(db.DB_FILE)
+    params = {'dataset_id': dataset_id, 'year': year}
+    chunks = pd.read_sql(SELECT, cxn, params=params, chunksize=CHUNK_ROWS)
+
+    held = pd.DataFrame()
+    for chunk in chunks:
+        if chunk.shape[0] == 0:
+            continue
+        chunk = pd.concat([held, chunk], ignore_index=True)
+        last_day = chunk.day.iloc[-1]
+        held = chunk.loc[chunk.day == last_day]
+        write_rows(writers, chunk.loc[chunk.day != last_day], json)
+    write_rows(writers, held, json)
+
+    cxn.close()
+
+    entries = writers.close()
+    rows = entries[0]['rows'] if entries else 0
+    log(f'Wrote {rows:,} rows to {writers.subdir}')
+    return entries
+
+
+def write_rows(writers, df, json):
+    """Sort the finished days and add them to the partition's files."""
+    if df.shape[0] == 0:
+        return
+
+    df = df.copy()
+    df['target'] = df.target == 't'
+    df = df.sort_values(['day', 'geohash', 'event_id', 'count_id'])
+    df = df.drop(columns=['year'])  # It is in the partition's path
+
+    if json == 'split':
+        for column, key in JSON_KEYS.items():
+            blobs = df.loc[:, [key, column]].drop_duplicates(key)
+            writers.write_new(column, blobs, key)
+        df = df.drop(columns=list(JSON_KEYS))
+
+    writers.write(COUNTS, df)
+
+
+class PartitionWriters:
+    """Buffer rows into full row groups for each of a partition's files."""
+
+    def __init__(self, export_path, dataset_id, year, json):
+        self.export_path = export_path
+        self.dataset_id = dataset_id
+        self.year = year
+        self.subdir = Path(f'dataset_id={dataset_id}') / f'year={year}'
+        self.writers = {}
+        self.buffers = {}
+        self.rows = {}
+        self.keys = {}
+        self.schemas = schemas(json)
+
+    def path(self, name):
+        """Get the path of one of the partition's files."""
+        return self.export_path / name / self.subdir / 'part-0.parquet'
+
+    def write(self, name, df):
+        """Add rows to a file, writing out each row group as it fills."""
+        self.buffers.setdefault(name, []).append(df)
+        self.rows[name] = self.rows.get(name, 0) + df.shape[0]
+        if sum(b.shape[0] for b in self.buffers[name]) >= ROW_GROUP_ROWS:
+            self.flush(name)
+
+    def write_new(self, name, df, key):
+        """
+        Add the rows with keys that aren't in the file yet.
+
+        A place or event can turn up on many days, so its JSON would be
+        written once for every block of days it is in without this.
+        """
+        keys = self.keys.setdefault(name, set())
+        df = df.loc[~df[key].isin(keys)]
+        keys.update(df[key].tolist())
+        if df.shape[0]:
+            self.write(name, df)
+
+    def flush(self, name, final=False):
+        """Write the full row groups, or everything if it is the last flush."""
+        if not self.buffers.get(name):
+            return
+
+        df = pd.concat(self.buffers[name], ignore_index=True)
+        keep = 0 if final else df.shape[0] % ROW_GROUP_ROWS
+        self.buffers[name] = [df.iloc[df.shape[0] - keep:]] if keep else []
+        df = df.iloc[:df.shape[0] - keep]
+
+        schema = self.schemas[name]
+        table = pa.Table.from_pandas(
+            df.loc[:, schema.names], schema=schema, preserve_index=False)
+
+        if name not in self.writers:
+            path = self.path(name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.writers[name] = pq.ParquetWriter(
+                path, schema, compression=COMPRESSION)
+
+        self.writers[name].write_table(table, row_group_size=ROW_GROUP_ROWS)
+
+    def close(self):
+        """Finish all of the files and get their manifest entries."""
+        entries = []
+        for name in sorted(self.buffers, key=lambda n: n != COUNTS):
+            self.flush(name, final=True)
+            self.writers[name].close()
+            path = self.path(name)
+            entries.append({
+                'file': str(path.relative_to(self.export_path)),
+                'table': name,
+                'dataset_id': self.dataset_id,
+                'year': self.year,
+                'rows': self.rows[name],
+                'bytes': path.stat().st_size,
+                'sha256': sha256(path)})
+        return entries
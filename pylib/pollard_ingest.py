@@ -2,7 +2,10 @@
 
 from pathlib import Path
 import pandas as pd
+from . import dates
 from . import db
+from . import geohash
+from . import metrics
 from . import util
 from .util import log
 
@@ -13,24 +16,25 @@ PLACE_CSV = RAW_DIR / 'Pollard_locations.csv'
 DATA_CSV = RAW_DIR / 'pollardbase_example_201802.csv'
 
 
-def ingest():
+def ingest(session):
     """Ingest the data."""
     raw_data = get_raw_data()
 
-    db.delete_dataset_records(DATASET_ID)
+    db.delete_dataset_records(session, DATASET_ID)
 
-    db.insert_dataset({
+    db.insert_dataset(session, {
         'dataset_id': DATASET_ID,
         'title': 'Pollard lepidoptera observations',
         'version': '2018-02',
         'url': ''})
 
-    to_taxon_id = insert_taxa(raw_data)
-    to_place_id = insert_places(raw_data)
-    insert_events(raw_data, to_place_id)
-    insert_counts(raw_data, to_taxon_id)
+    to_taxon_id = insert_taxa(session, raw_data)
+    to_place_id = insert_places(session, raw_data)
+    insert_events(session, raw_data, to_place_id)
+    insert_counts(session, raw_data, to_taxon_id)
 
 
+@metrics.timed
 def get_raw_data():
     """Read raw data."""
     log(f'Getting {DATASET_ID} raw data')
@@ -51,12 +55,11 @@ def get_raw_data():
     return raw_data
 
 
-def insert_taxa(raw_data):
+@metrics.timed
+def insert_taxa(session, raw_data):
     """Insert taxa."""
     log(f'Inserting {DATASET_ID} taxa')
 
-    cxn = db.connect()
-
     firsts = raw_data['sci_name'].duplicated(keep='first')
     taxa = raw_data.loc[~firsts, ['sci_name', 'Species']]
     taxa.rename(columns={'Species': 'common_name'}, inplace=True)
@@ -68,20 +71,22 @@ def insert_taxa(raw_data):
     taxa['family'] = None
     taxa['target'] = None
 
-    taxa = db.drop_duplicate_taxa(taxa)
-    taxa['taxon_id'] = db.create_ids(taxa, 'taxa')
+    taxa = db.drop_duplicate_taxa(session, taxa)
+    taxa['taxon_id'] = db.create_ids(session, taxa, 'taxa')
     taxa['taxon_id'] = taxa['taxon_id'].astype(int)
     taxa['taxon_json'] = '{}'
 
-    taxa.to_sql('taxa', cxn, if_exists='append', index=False)
+    db.insert_records(session, 'taxa', taxa)
 
     sql = """SELECT sci_name, taxon_id
                FROM taxa
               WHERE "class" = 'lepidoptera'"""
-    return pd.read_sql(sql, cxn).set_index('sci_name').taxon_id.to_dict()
+    return pd.read_sql(sql, session.cxn).set_index(
+        'sci_name').taxon_id.to_dict()
 
 
-def insert_places(raw_data):
+@metrics.timed
+def insert_places(session, raw_data):
     """Insert places."""
     log(f'Inserting {DATASET_ID} places')
 
@@ -94,12 +99,13 @@ def insert_places(raw_data):
         raw_places, place_df, how='left', on=['Site', 'Route'])
 
     places = pd.DataFrame()
-    raw_places['place_id'] = db.create_ids(raw_places, 'places')
+    raw_places['place_id'] = db.create_ids(session, raw_places, 'places')
     places['place_id'] = raw_places['place_id']
     places['dataset_id'] = DATASET_ID
     places['lng'] = pd.to_numeric(raw_places['long'], errors='coerce')
     places['lat'] = pd.to_numeric(raw_places['lat'], errors='coerce')
     places['radius'] = None
+    places['geohash'] = geohash.encode(places.lng, places.lat)
 
     fields = ['Site', 'Route', 'County', 'State', 'Land_Owner', 'transect_id',
               'Route_Poin', 'Route_Po_1', 'Route_Po_2', 'CLIMDIV_ID', 'CD_sub',
@@ -107,26 +113,27 @@ def insert_places(raw_data):
     places['place_json'] = util.json_object(raw_places, fields)
 
     places = places[places.lat.notna() & places.lng.notna()]
-    places.to_sql('places', db.connect(), if_exists='append', index=False)
+    db.insert_records(session, 'places', places)
     return raw_places.set_index(['Site', 'Route']).place_id.to_dict()
 
 
-def insert_events(raw_data, to_place_id):
+@metrics.timed
+def insert_events(session, raw_data, to_place_id):
     """Insert events."""
     log(f'Inserting {DATASET_ID} events')
 
     events = pd.DataFrame()
 
-    raw_data['event_id'] = db.create_ids(raw_data, 'events')
+    raw_data['event_id'] = db.create_ids(session, raw_data, 'events')
     events['event_id'] = raw_data['event_id']
     raw_data['place_key'] = tuple(zip(raw_data.Site, raw_data.Route))
     raw_data['place_id'] = raw_data['place_key'].map(to_place_id)
     events['place_id'] = raw_data['place_id']
-    events['year'] = raw_data['started'].dt.strftime('%Y')
-    events['day'] = raw_data['started'].dt.strftime('%j')
-    events['started'] = raw_data['started'].dt.strftime('%H:%M')
-    events['ended'] = pd.to_datetime(
-        raw_data['End_time'], errors='coerce').dt.strftime('%H:%M')
+    events['year'] = dates.year(raw_data['started'])
+    events['day'] = dates.day(raw_data['started'])
+    events['started'] = dates.to_hh_mm(dates.minutes(raw_data['started']))
+    events['ended'] = dates.to_hh_mm(dates.minutes(pd.to_datetime(
+        raw_data['End_time'], errors='coerce')))
     events['dataset_id'] = raw_data['dataset_id']
 
     fields = """
@@ -138,15 +145,16 @@ def insert_events(raw_data, to_place_id):
     has_place_id = events['place_id'].notna()
     events = events.loc[has_place_id, :]
 
-    events.to_sql('events', db.connect(), if_exists='append', index=False)
+    db.insert_records(session, 'events', events)
 
 
-def insert_counts(raw_data, to_taxon_id):
+@metrics.timed
+def insert_counts(session, raw_data, to_taxon_id):
     """Insert counts."""
     log(f'Inserting {DATASET_ID} counts')
 
     counts = pd.DataFrame()
-    counts['count_id'] = db.create_ids(raw_data, 'counts')
+    counts['count_id'] = db.create_ids(session, raw_data, 'counts')
     counts['event_id'] = raw_data['event_id'].astype(int)
     counts['taxon_id'] = raw_data['sci_name'].map(to_taxon_id)
     counts['count'] = raw_data['Total'].fillna(0)
@@ -163,8 +171,9 @@ def insert_counts(raw_data, to_taxon_id):
     has_taxon_id = counts['taxon_id'].notna()
     counts = counts.loc[has_event_id & has_taxon_id, :]
 
-    counts.to_sql('counts', db.connect(), if_exists='append', index=False)
+    db.insert_records(session, 'counts', counts)
 
 
 if __name__ == '__main__':
-    ingest()
+    with db.IngestSession() as SESSION:
+        ingest(SESSION)
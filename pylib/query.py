@@ -0,0 +1,249 @@
+"""
+Query the sightings: the counts joined to their events, places, & taxa.
+
+sightings() builds the join from the filters we use most: species, taxon
+class, the target flag, datasets, year & day ranges, and a bounding box. The
+values are always passed as parameters. Each filter is written so that it can
+use an index: the taxon filters become a taxon_id list from the taxa table
+that is looked up in the counts' taxon_id index, and in SQLite3 the bounding
+box goes through the places R*Tree (see spatial.py). The results are read a
+chunk at a time from the cursor, a server-side cursor in PostgreSQL, so only
+one chunk is held in memory. See extract.py for writing them to files.
+
+Results are cached on disk as Feather files, keyed by the database (its file
+or PostgreSQL server & name), the SQL, its parameters, and the version &
+extraction time of every dataset in the database. Pulling the same sightings
+again reads the cached files instead of running the join, and re-ingesting
+any dataset makes a new cache entry. The cache needs pyarrow, without it we
+always run the query, as we do for an in-memory SQLite3 database. Delete the
+query_cache directory to clear it.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import uuid
+
+import pandas as pd
+
+from . import db, spatial
+
+try:
+    from pyarrow import feather
+except ImportError:
+    feather = None
+
+CACHE_DIR = db.PROCESSED / 'query_cache'
+CACHE_VERSION = 2  # Bump this when the cached results change
+CHUNK_ROWS = 100_000
+DIALECTS = ('sqlite', 'postgres')
+
+SELECT = """
+    SELECT count_id, event_id, place_id, taxon_id, counts.dataset_id,
+           lng, lat, radius, geohash, year, day, started, ended, count,
+           sci_name, "group", "class", "order", family, genus, common_name,
+           category, target, place_json, event_json, count_json
+      FROM counts
+      JOIN events USING (event_id)
+      JOIN places USING (place_id)
+      JOIN taxa   USING (taxon_id)"""
+COLUMNS = """count_id event_id place_id taxon_id dataset_id lng lat radius
+    geohash year day started ended count sci_name group class order family
+    genus common_name category target place_json event_json
+    count_json""".split()  # What SELECT returns
+
+
+def sightings(
+        species=None, taxon_class=None, target=None, dataset_id=None,
+        years=None, days=None, bbox=None, cxn=None, dialect='sqlite',
+        chunk_rows=CHUNK_ROWS, cache=True):
+    """
+    Get the sightings that pass all of the filters, a data frame at a time.
+
+    The species and dataset_id filters take a name or a list of them. The
+    years & days take one value or a (first, last) range and the bbox is
+    (west, south, east, north). Filters left as None are not applied.
+
+    This uses the SQLite3 database unless you pass a connection. Pass
+    dialect='postgres' with a PostgreSQL connection.
+    """
+    own_cxn = cxn is None
+    cxn = db.connect() if own_cxn else cxn
+    try:
+        sql, params = plan(
+            species=species, taxon_class=taxon_class, target=target,
+            dataset_id=dataset_id, years=years, days=days, bbox=bbox,
+            dialect=dialect, rtree=dialect == 'sqlite' and db.table_exists(
+                cxn, 'places_rtree'))
+
+        name = database(cxn, dialect)
+        if not (cache and feather and name):
+            yield from fetch(cxn, sql, params, chunk_rows, dialect)
+            return
+
+        cached = CACHE_DIR / cache_key(cxn, sql, params, name)
+        if not cached.exists():
+            chunks = fetch(cxn, sql, params, chunk_rows, dialect)
+            yield from cache_results(chunks, cached)
+            return
+
+        for path in sorted(cached.glob('*.feather')):
+            table = feather.read_table(path)  # It may have bigger chunks
+            for start in range(0, max(table.num_rows, 1), chunk_rows):
+                yield table.slice(start, chunk_rows).to_pandas()
+    finally:
+        if own_cxn:
+            cxn.close()
+
+
+def plan(
+        species=None, taxon_class=None, target=None, dataset_id=None,
+        years=None, days=None, bbox=None, dialect='sqlite', rtree=True):
+    """
+    Build the SQL & parameters for the sightings() filters.
+
+    The bbox goes through the places R*Tree in SQLite3 unless rtree is False,
+    for a database made before it was added.
+    """
+    if dialect not in DIALECTS:
+        raise ValueError(f'Unknown SQL dialect: {dialect}')
+
+    where, params = [], {}
+
+    taxa = []
+    if species is not None:
+        taxa.append(f'sci_name IN ({in_list(params, "species", species)})')
+    if taxon_class is not None:
+        taxa.append('"class" = :taxon_class')
+        params['taxon_class'] = taxon_class
+    if target is not None:
+        taxa.append(
+            "target = 't'" if target else "(target IS NULL OR target <> 't')")
+    if taxa:
+        where.append(f"""counts.taxon_id IN (
+        SELECT taxon_id
+          FROM taxa
+         WHERE {' AND '.join(taxa)})""")
+
+    if dataset_id is not None:
+        ids = in_list(params, 'dataset_id', dataset_id)
+        where.append(f'counts.dataset_id IN ({ids})')
+
+    for field, value in (('year', years), ('day', days)):
+        if value is not None:
+            params[f'first_{field}'], params[f'last_{field}'] = value_range(
+                value)
+            where.append(
+                f'events.{field} BETWEEN :first_{field} AND :last_{field}')
+
+    if bbox is not None:
+        west, south, east, north = bbox
+        params.update(spatial.bbox_params((west, east), (south, north)))
+        use_rtree = rtree and dialect == 'sqlite'
+        where.append(spatial.IN_BBOX if use_rtree else spatial.IN_LNG_LAT)
+
+    sql = SELECT
+    if where:
+        sql += '\n     WHERE ' + '\n       AND '.join(where)
+
+    if dialect == 'postgres':
+        sql = re.sub(r':(\w+)', r'%(\1)s', sql)  # psycopg2's parameter style
+
+    return sql, params
+
+
+def in_list(params, name, values):
+    """Add a parameter for each value and get the placeholders for IN (...)."""
+    values = [values] if isinstance(values, str) else list(values)
+    if not values:
+        raise ValueError(f'The {name} filter is empty')
+    names = [f'{name}_{i}' for i in range(len(values))]
+    params.update(zip(names, values))
+    return ', '.join(f':{n}' for n in names)
+
+
+def value_range(value):
+    """Get a (first, last) range from a single value or a range."""
+    if isinstance(value, (list, tuple)):
+        return tuple(sorted(value))
+    return value, value
+
+
+def fetch(cxn, sql, params, chunk_rows=CHUNK_ROWS, dialect='sqlite'):
+    """
+    Run the query and get its rows a data frame at a time.
+
+    PostgreSQL gets a named (server-side) cursor, otherwise psycopg2 would
+    pull every row into memory before handing us the first one. Like
+    pd.read_sql() an empty result still gives one empty data frame.
+    """
+    if dialect == 'postgres':
+        cursor = cxn.cursor(name=f'sightings_{uuid.uuid4().hex}')
+        cursor.itersize = chunk_rows
+    else:
+        cursor = cxn.cursor()
+
+    try:
+        cursor.execute(sql, params)
+        first = True
+        while (rows := cursor.fetchmany(chunk_rows)) or first:
+            first = False
+            columns = [c[0] for c in cursor.description]
+            yield pd.DataFrame.from_records(
+                rows, columns=columns, coerce_float=True)
+    finally:
+        cursor.close()
+
+
+def cache_key(cxn, sql, params, name):
+    """Hash the database, query, & dataset versions into a cache entry name."""
+    versions = pd.read_sql(
+        'SELECT dataset_id, version, extracted FROM datasets '
+        'ORDER BY dataset_id', cxn)
+    key = json.dumps({
+        'cache_version': CACHE_VERSION,
+        'database': name,
+        'sql': sql,
+        'params': params,
+        'datasets': versions.astype(str).values.tolist()},
+        sort_keys=True, default=str)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def database(cxn, dialect='sqlite'):
+    """
+    Identify the database behind the connection.
+
+    That is the SQLite3 file, or PostgreSQL's host, port, & database name
+    (without the password). An in-memory SQLite3 database has no name.
+    """
+    if dialect == 'postgres':
+        dsn = cxn.get_dsn_parameters()
+        return [dsn.get(k) for k in ('host', 'port', 'dbname')]
+    path = cxn.execute('PRAGMA database_list').fetchone()[2]
+    return os.path.realpath(path) if path else None
+
+
+def cache_results(chunks, cached):
+    """
+    Save each chunk of the query's results as we pass it on.
+
+    The chunks go into a temporary directory that only gets the cache entry's
+    name once every chunk is written, so a query that is stopped early or
+    fails doesn't leave a partial result in the cache.
+    """
+    temp = cached.with_suffix('.tmp')
+    shutil.rmtree(temp, ignore_errors=True)
+    temp.mkdir(parents=True)
+    try:
+        for i, chunk in enumerate(chunks):
+            feather.write_feather(
+                chunk.reset_index(drop=True), temp / f'{i:06d}.feather')
+            yield chunk
+        if cached.exists():
+            return
+        os.replace(temp, cached)
+    finally:
+        shutil.rmtree(temp, ignore_errors=True)
@@ -0,0 +1,59 @@
+"""
+Read raw CSV files with only the columns we use.
+
+The raw files are wide and most of their columns never make it into the
+database. Each dataset declares the columns it needs (its projection), which
+of them are low-cardinality codes that can be categorical, and which are
+numbers. Everything else we read is a string like before.
+
+Columns are named by their normalized names (see util.normalize_name) so a
+dataset does not have to care about stray spaces or punctuation in the raw
+header.
+"""
+
+import pandas as pd
+
+from . import metrics, util
+
+
+def read_csv(source, columns=None, categories=(), numbers=(), **kwargs):
+    """
+    Read a CSV file with a column projection and compact dtypes.
+
+    If columns is None we read every column. Any keyword arguments are passed
+    on to pandas.read_csv(), so chunksize gives a reader as usual.
+    """
+    header = read_header(source, **kwargs)
+
+    categories = set(categories)
+    numbers = set(numbers)
+
+    usecols, dtype = [], {}
+    for raw in header:
+        name = util.normalize_name(raw)
+        if columns is not None and name not in columns:
+            continue
+        usecols.append(raw)
+        if name in categories:
+            dtype[raw] = 'category'
+        elif name in numbers:
+            dtype[raw] = float
+        else:
+            dtype[raw] = str
+
+    with metrics.stage('read_csv') as record:
+        df = pd.read_csv(
+            source, usecols=usecols, dtype=dtype, float_precision='high',
+            **kwargs)
+        if isinstance(df, pd.DataFrame):
+            record['rows_out'] = df.shape[0]
+    return df
+
+
+def read_header(source, **kwargs):
+    """Get the raw column names of a CSV file."""
+    kwargs.pop('chunksize', None)
+    header = pd.read_csv(source, nrows=0, **kwargs).columns
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return header
@@ -0,0 +1,93 @@
+"""
+Find places by bounding box or by distance from a point.
+
+The places_rtree R*Tree (see create_indexes_sqlite.sql) indexes longitude &
+latitude together, unlike the separate lng & lat indexes where SQLite can use
+only one of them. The R*Tree stores 32-bit floats rounded outward so we use
+it to find the candidates and then apply the exact test to those.
+
+IN_BBOX is an SQL condition on places that can be added to any query, like:
+
+    SELECT *
+      FROM places
+      JOIN events USING (place_id)
+     WHERE {spatial.IN_BBOX}
+       AND year = 2014
+
+with the parameters from bbox_params(). A database made before the R*Tree was
+added doesn't have it until the indexes are built again (ingest with
+--defer-indexes does that). in_bbox() falls back to IN_LNG_LAT, the plain
+longitude & latitude test, for those.
+"""
+
+import numpy as np
+import pandas as pd
+
+from . import db
+
+EARTH_RADIUS = 6_371_008.8  # Mean radius in meters
+
+IN_LNG_LAT = """places.lng BETWEEN :west  AND :east
+       AND places.lat BETWEEN :south AND :north"""
+IN_BBOX = """places.place_id IN (
+        SELECT place_id
+          FROM places_rtree
+         WHERE max_lng >= :west  AND min_lng <= :east
+           AND max_lat >= :south AND min_lat <= :north)
+       AND """ + IN_LNG_LAT
+
+
+def in_bbox(cxn):
+    """Get IN_BBOX, or IN_LNG_LAT if the database has no places_rtree."""
+    return IN_BBOX if db.table_exists(cxn, 'places_rtree') else IN_LNG_LAT
+
+
+def bbox_params(lng, lat):
+    """Get the IN_BBOX parameters for (west, east) & (south, north) ranges."""
+    west, east = sorted(lng)
+    south, north = sorted(lat)
+    return {'west': west, 'east': east, 'south': south, 'north': north}
+
+
+def places_in_bbox(cxn, lng, lat):
+    """Get the places inside the bounding box."""
+    sql = f'SELECT * FROM places WHERE {in_bbox(cxn)}'
+    return pd.read_sql(sql, cxn, params=bbox_params(lng, lat))
+
+
+def places_near(cxn, lng, lat, radius):
+    """
+    Get the places within radius meters of a point, nearest first.
+
+    We search the box around the circle and then keep the places whose great
+    circle distance, in the distance column, is inside the radius. The box is
+    clipped at the poles and the antimeridian.
+    """
+    lng_range, lat_range = circle_bbox(lng, lat, radius)
+    places = places_in_bbox(cxn, lng_range, lat_range)
+
+    places['distance'] = haversine(lng, lat, places.lng, places.lat)
+    places = places.loc[places.distance <= radius]
+    return places.sort_values('distance').reset_index(drop=True)
+
+
+def circle_bbox(lng, lat, radius):
+    """Get the (west, east) & (south, north) ranges around a circle."""
+    arc = np.degrees(radius / EARTH_RADIUS)
+    south, north = max(lat - arc, -90.0), min(lat + arc, 90.0)
+
+    if south == -90.0 or north == 90.0:
+        return (-180.0, 180.0), (south, north)
+
+    arc /= np.cos(np.radians(max(abs(south), abs(north))))
+    return (max(lng - arc, -180.0), min(lng + arc, 180.0)), (south, north)
+
+
+def haversine(lng1, lat1, lng2, lat2):
+    """Get the great circle distances in meters between points."""
+    lng1, lat1, lng2, lat2 = (
+        np.radians(np.asarray(x, dtype=float))
+        for x in (lng1, lat1, lng2, lat2))
+    a = (np.sin((lat2 - lat1) / 2.0) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2.0) ** 2)
+    return 2.0 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
@@ -1,9 +1,14 @@
 """Utilities & constants."""
 
+import hashlib
 import re
 import json
+from json.encoder import encode_basestring_ascii
 from datetime import datetime
+from itertools import repeat
+import numpy as np
 import pandas as pd
+from . import metrics
 
 
 def log(msg):
@@ -13,25 +18,94 @@ def log(msg):
     print(msg)
 
 
+def sha256(path):
+    """Get the checksum of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as in_file:
+        while block := in_file.read(2**20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
 def normalize_columns_names(df):
     """Remove problem characters from dataframe columns."""
-    df.rename(columns=lambda x: re.sub(r'\W', '_', x), inplace=True)
-    df.rename(columns=lambda x: re.sub(r'__', '_', x), inplace=True)
-    df.rename(columns=lambda x: re.sub(r'^_|_$', '', x), inplace=True)
+    df.rename(columns=normalize_name, inplace=True)
+
 
+def normalize_name(name):
+    """Remove problem characters from a column name."""
+    name = re.sub(r'\W', '_', name)
+    name = re.sub(r'__', '_', name)
+    return re.sub(r'^_|_$', '', name)
 
+
+@metrics.timed
 def json_object(df, fields):
-    """Build an array of json objects from the dataframe fields."""
-    df = df.fillna('')
-    json_array = []
-    for row in df.itertuples():
-        obj = {}
-        for field in fields:
-            value = getattr(row, field)
-            if value != '':
-                obj[field] = value
-        json_array.append(json.dumps(obj))
-    return json_array
+    """
+    Build an array of json objects from the dataframe fields.
+
+    We work a column at a time instead of a row at a time. Each distinct value
+    in a column is encoded once as a "field": value pair and the pairs are
+    then picked out for every row with one array lookup. Empty values are
+    skipped. The result is the same as calling json.dumps() on a dict of each
+    row's non-empty fields.
+    """
+    is_first = np.ones(df.shape[0], dtype=bool)
+    pieces = []
+
+    for field in dict.fromkeys(fields):
+        codes, pairs, is_empty = json_pairs(df[field], field)
+
+        # Row 0 is used after the first pair in an object & row 1 before it
+        separated = np.where(is_empty, '', ', ' + pairs)
+        pairs = np.stack([separated, pairs])
+
+        pieces.append(pairs[is_first.view(np.int8), codes].tolist())
+        is_first &= is_empty[codes]
+
+    return list(map(''.join, zip(repeat('{'), *pieces, repeat('}'))))
+
+
+def json_pairs(column, field):
+    """
+    Encode the distinct values in a column as "field": value strings.
+
+    Missing values get a code of -1 which picks the empty pair that we put at
+    the end of the pairs.
+    """
+    if column.dtype.kind == 'f':
+        # Factorizing merges -0.0 & 0.0 but json doesn't, so use the bits
+        values = column.to_numpy(dtype=np.float64)
+        codes, bits = pd.factorize(values.view(np.int64))
+        uniques = np.asarray(bits).view(np.float64).astype(object)
+        codes[np.isnan(values)] = -1
+    else:
+        codes, uniques = pd.factorize(column)
+        uniques = np.asarray(uniques, dtype=object)
+
+    if all(type(v) is str for v in uniques):
+        encoded = list(map(encode_basestring_ascii, uniques))
+    elif column.dtype == object:
+        # Factorizing merges values like 1, 1.0, & True but json doesn't
+        uniques = column.to_numpy(dtype=object)
+        codes = np.arange(uniques.shape[0])
+        codes[column.isna().to_numpy()] = -1
+        encoded = list(map(json_value, uniques))
+    else:
+        encoded = list(map(json_value, uniques))
+
+    is_empty = np.append(uniques == '', True)
+    pairs = json.dumps(field) + ': ' + np.array(encoded + [''], dtype=object)
+    pairs[is_empty] = ''
+
+    return codes, pairs, is_empty
+
+
+def json_value(value):
+    """Encode one value the same way json.dumps() does."""
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    return json.dumps(value)
 
 
 def update_json(row, fields):
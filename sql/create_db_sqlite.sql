@@ -24,15 +24,6 @@ CREATE TABLE taxa (
   revised_id  INTEGER,
   taxon_json  TEXT
 );
-CREATE INDEX taxa_sci_name ON taxa (sci_name);
-CREATE INDEX taxa_group  ON taxa ("group");
-CREATE INDEX taxa_class  ON taxa ("class");
-CREATE INDEX taxa_order  ON taxa ("order");
-CREATE INDEX taxa_family ON taxa (family);
-CREATE INDEX taxa_genus  ON taxa (genus);
-CREATE INDEX taxa_target ON taxa (target);
-CREATE INDEX taxa_category   ON taxa (category);
-CREATE INDEX taxa_revised_id ON taxa (revised_id);
 
 
 DROP TABLE IF EXISTS places;
@@ -46,10 +37,6 @@ CREATE TABLE places (
   geohash    VARCHAR(8),
   geopoint   TEXT
 );
-CREATE INDEX places_dataset_id ON places (dataset_id);
-CREATE INDEX places_lng        ON places (lng);
-CREATE INDEX places_lat        ON places (lat);
-CREATE INDEX places_geohash    ON places (geohash);
 
 
 DROP TABLE IF EXISTS events;
@@ -63,10 +50,6 @@ CREATE TABLE events (
   ended        TEXT,
   event_json   TEXT
 );
-CREATE INDEX events_place_id   ON events (place_id);
-CREATE INDEX events_dataset_id ON events (dataset_id);
-CREATE INDEX events_year       ON events (year);
-CREATE INDEX events_day        ON events (day);
 
 
 DROP TABLE IF EXISTS counts;
@@ -78,6 +61,3 @@ CREATE TABLE counts (
   count      INTEGER NOT NULL,
   count_json TEXT
 );
-CREATE INDEX counts_event_id   ON counts (event_id);
-CREATE INDEX counts_taxon_id   ON counts (taxon_id);
-CREATE INDEX counts_dataset_id ON counts (dataset_id);
@@ -0,0 +1,55 @@
+-- Keys, constraints & secondary indexes for the PostgreSQL database.
+--
+-- These are kept apart from the table definitions so that a bulk load can
+-- fill the tables first and then build them all once at the end. Primary
+-- keys come first because the foreign keys need them.
+--
+-- The expression indexes on hot JSON fields are built from db.HOT_JSON after
+-- this script, so that the ingest code and the indexes share one list.
+
+ALTER TABLE datasets ADD CONSTRAINT datasets_pkey PRIMARY KEY (dataset_id);
+ALTER TABLE taxa     ADD CONSTRAINT taxa_pkey     PRIMARY KEY (taxon_id);
+ALTER TABLE places   ADD CONSTRAINT places_pkey   PRIMARY KEY (place_id);
+ALTER TABLE events   ADD CONSTRAINT events_pkey   PRIMARY KEY (event_id);
+ALTER TABLE counts   ADD CONSTRAINT counts_pkey   PRIMARY KEY (count_id);
+
+ALTER TABLE taxa ADD CONSTRAINT taxa_sci_name_key UNIQUE (sci_name);
+
+ALTER TABLE places ADD CONSTRAINT places_dataset_id_fkey
+  FOREIGN KEY (dataset_id) REFERENCES datasets (dataset_id);
+ALTER TABLE events ADD CONSTRAINT events_place_id_fkey
+  FOREIGN KEY (place_id)   REFERENCES places (place_id);
+ALTER TABLE events ADD CONSTRAINT events_dataset_id_fkey
+  FOREIGN KEY (dataset_id) REFERENCES datasets (dataset_id);
+ALTER TABLE counts ADD CONSTRAINT counts_event_id_fkey
+  FOREIGN KEY (event_id)   REFERENCES events (event_id);
+ALTER TABLE counts ADD CONSTRAINT counts_dataset_id_fkey
+  FOREIGN KEY (dataset_id) REFERENCES datasets (dataset_id);
+ALTER TABLE counts ADD CONSTRAINT counts_taxon_id_fkey
+  FOREIGN KEY (taxon_id)   REFERENCES taxa (taxon_id);
+
+CREATE INDEX taxa_sci_name ON taxa (sci_name);
+CREATE INDEX taxa_class  ON taxa ("class");
+CREATE INDEX taxa_order  ON taxa ("order");
+CREATE INDEX taxa_group  ON taxa ("group");
+CREATE INDEX taxa_family ON taxa (family);
+CREATE INDEX taxa_genus  ON taxa (genus);
+CREATE INDEX taxa_target ON taxa (target);
+CREATE INDEX taxa_category   ON taxa (category);
+CREATE INDEX taxa_revised_id ON taxa (revised_id);
+
+CREATE INDEX places_dataset_id ON places (dataset_id);
+CREATE INDEX places_lng        ON places (lng);
+CREATE INDEX places_lat        ON places (lat);
+CREATE INDEX places_geohash    ON places (geohash);
+
+CREATE INDEX events_place_id   ON events (place_id);
+CREATE INDEX events_dataset_id ON events (dataset_id);
+CREATE INDEX events_year       ON events (year);
+CREATE INDEX events_day        ON events (day);
+
+CREATE INDEX counts_event_id   ON counts (event_id);
+CREATE INDEX counts_taxon_id   ON counts (taxon_id);
+CREATE INDEX counts_dataset_id ON counts (dataset_id);
+
+ANALYZE;
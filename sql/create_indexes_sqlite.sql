@@ -0,0 +1,57 @@
+-- Secondary indexes for the SQLite3 database, and the places R*Tree.
+--
+-- These are kept apart from the table definitions so that a bulk load can
+-- create the tables without them and build them all once at the end.
+--
+-- The expression indexes on hot JSON fields are built from db.HOT_JSON, along
+-- with these, so that the ingest code and the indexes share one list.
+
+CREATE INDEX IF NOT EXISTS taxa_sci_name ON taxa (sci_name);
+CREATE INDEX IF NOT EXISTS taxa_group  ON taxa ("group");
+CREATE INDEX IF NOT EXISTS taxa_class  ON taxa ("class");
+CREATE INDEX IF NOT EXISTS taxa_order  ON taxa ("order");
+CREATE INDEX IF NOT EXISTS taxa_family ON taxa (family);
+CREATE INDEX IF NOT EXISTS taxa_genus  ON taxa (genus);
+CREATE INDEX IF NOT EXISTS taxa_target ON taxa (target);
+CREATE INDEX IF NOT EXISTS taxa_category   ON taxa (category);
+CREATE INDEX IF NOT EXISTS taxa_revised_id ON taxa (revised_id);
+
+CREATE INDEX IF NOT EXISTS places_dataset_id ON places (dataset_id);
+CREATE INDEX IF NOT EXISTS places_lng        ON places (lng);
+CREATE INDEX IF NOT EXISTS places_lat        ON places (lat);
+CREATE INDEX IF NOT EXISTS places_geohash    ON places (geohash);
+
+CREATE INDEX IF NOT EXISTS events_place_id   ON events (place_id);
+CREATE INDEX IF NOT EXISTS events_dataset_id ON events (dataset_id);
+CREATE INDEX IF NOT EXISTS events_year       ON events (year);
+CREATE INDEX IF NOT EXISTS events_day        ON events (day);
+
+CREATE INDEX IF NOT EXISTS counts_event_id   ON counts (event_id);
+CREATE INDEX IF NOT EXISTS counts_taxon_id   ON counts (taxon_id);
+CREATE INDEX IF NOT EXISTS counts_dataset_id ON counts (dataset_id);
+
+-- An R*Tree over the place coordinates, so a bounding box query is one index
+-- lookup instead of a scan of the lng or lat index (see pylib/spatial.py).
+-- The triggers keep it in step with the places table.
+CREATE VIRTUAL TABLE IF NOT EXISTS places_rtree USING rtree(
+  place_id, min_lng, max_lng, min_lat, max_lat
+);
+
+CREATE TRIGGER IF NOT EXISTS places_rtree_insert AFTER INSERT ON places
+BEGIN
+  INSERT INTO places_rtree
+       VALUES (NEW.place_id, NEW.lng, NEW.lng, NEW.lat, NEW.lat);
+END;
+
+CREATE TRIGGER IF NOT EXISTS places_rtree_update
+ AFTER UPDATE OF place_id, lng, lat ON places
+BEGIN
+  DELETE FROM places_rtree WHERE place_id = OLD.place_id;
+  INSERT INTO places_rtree
+       VALUES (NEW.place_id, NEW.lng, NEW.lng, NEW.lat, NEW.lat);
+END;
+
+CREATE TRIGGER IF NOT EXISTS places_rtree_delete AFTER DELETE ON places
+BEGIN
+  DELETE FROM places_rtree WHERE place_id = OLD.place_id;
+END;
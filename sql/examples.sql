@@ -50,3 +50,23 @@ SELECT event_json ->> 'SAMPLING_EVENT_IDENTIFIER' AS sample_id
    AND event_json -> 'SAMPLING_EVENT_IDENTIFIER' IS NOT NULL)
 SELECT COUNT(*) AS n
   FROM checklists;
+
+
+-- A weekly phenology curve from the summary tables (etl.py aggregate): the
+-- share of checklists in each week that reported the species.
+WITH detections AS (
+SELECT year, week, cell, dataset_id, events
+  FROM weekly_counts
+ WHERE taxon_id = (SELECT taxon_id
+                     FROM taxa
+                    WHERE sci_name = 'Setophaga petechia')
+   AND year BETWEEN 2010 AND 2014
+   AND dataset_id = 'ebird')
+SELECT year, week,
+       SUM(COALESCE(events, 0)) * 1.0 / SUM(checklists) AS detection_rate
+  FROM weekly_effort
+  LEFT JOIN detections USING (year, week, cell, dataset_id)
+ WHERE year BETWEEN 2010 AND 2014
+   AND dataset_id = 'ebird'
+ GROUP BY year, week
+ ORDER BY year, week;
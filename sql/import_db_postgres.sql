@@ -1,20 +1,23 @@
--- split --additional-suffix=.csv --numeric-suffixes=1 --lines=10000000 counts_ebird.csv counts_ebird_
--- split --additional-suffix=.csv --numeric-suffixes=1 --lines=5000000 events_ebird.csv events_ebird_
+-- There is no need to split the big CSV files by hand any more. Export them
+-- in shards, e.g.:
+--   ./etl.py export all <source dir> --shard-rows 10000000 --workers 8
+-- Each shard (counts_ebird_001.csv, ...) is a complete CSV file and
+-- <source dir>/manifest.json lists the row count & sha256 of every file.
+-- Load them all with copy.sql below, not one \copy per table.
+--
+-- Or skip the CSV files altogether and stream the SQLite3 tables into a new
+-- PostgreSQL database, geohashes & all:
+--   ./etl.py migrate --workers 8
 
 psql "sslmode=disable dbname=sightings user=<username> hostaddr=35.221.16.125"
 psql "sslmode=disable dbname=sightings user=<username> hostaddr=localhost"
 
-\copy datasets FROM '<source dir>/datasets.csv' WITH (FORMAT csv);
-
-\copy taxa FROM '<source dir>/taxa.csv' WITH (FORMAT csv);
-
-\copy places FROM '<source dir>/places.csv' WITH (FORMAT csv);
-
-\copy events FROM '<source dir>/events.csv' WITH (FORMAT csv);
-
-\copy counts FROM '<source dir>/counts.csv' WITH (FORMAT csv);
+-- etl.py export writes <source dir>/copy.sql with a \copy for every CSV
+-- file in manifest.json, every shard of every table, in foreign key order.
+-- Compressed shards are decompressed on the fly with gzip or zstd.
+\i <source dir>/copy.sql
 
+-- The geohashes come from SQLite3, only the geopoints need to be built.
 UPDATE places
-   SET geopoint = ST_SetSRID(ST_MakePoint(lng, lat), 4326),
-       geohash  = ST_GeoHash(ST_MakePoint(lng, lat), 7);
+   SET geopoint = ST_SetSRID(ST_MakePoint(lng, lat), 4326);
 COMMIT;
@@ -0,0 +1,40 @@
+"""Test the date & time conversions."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pylib import dates
+
+
+def test_hmm_to_minutes():
+    """Good hMM times become minutes, the rest are missing."""
+    times = pd.Series(['930', 2400, 'x', 1260, None, 59.9, '0000', -5])
+    mins = dates.hmm_to_minutes(times)
+    expect = [570, np.nan, np.nan, np.nan, np.nan, 59, 0, np.nan]
+    np.testing.assert_array_equal(mins.to_numpy(), expect)
+
+
+def test_to_hh_mm():
+    """Partial minutes are dropped and times wrap around midnight."""
+    mins = pd.Series([0, 59.9, 570, 1440, 1500, np.nan], index=list('abcdef'))
+    times = dates.to_hh_mm(mins)
+    assert times.tolist() == [
+        '00:00', '00:59', '09:30', '00:00', '01:00', None]
+    assert times.index.tolist() == list('abcdef')
+
+
+def test_from_parts():
+    """Build dates from columns, leap days included."""
+    built = dates.from_parts(
+        pd.Series([2016, 2015]), pd.Series([2, 12]), pd.Series([29, 31]))
+    assert dates.day(built).tolist() == [60, 365]
+    assert dates.year(built).tolist() == [2016, 2015]
+
+
+@pytest.mark.parametrize('month, day', [(2, 30), (13, 1), (1, 0)])
+def test_from_parts_bad_values(month, day):
+    """Impossible dates fail, the same as pd.to_datetime() did before."""
+    with pytest.raises(ValueError):
+        dates.from_parts(
+            pd.Series([2015]), pd.Series([month]), pd.Series([day]))
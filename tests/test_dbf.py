@@ -0,0 +1,69 @@
+"""Test the DBF reader against the old simpledbf -> CSV round trip."""
+
+import struct
+
+import pandas as pd
+import pytest
+
+from pylib import dbf
+
+FIELDS = [
+    ('NAME', 'C', 12, 0), ('INTS', 'N', 4, 0), ('BLANKS', 'N', 4, 0),
+    ('MIXED', 'N', 6, 1), ('EMPTY', 'N', 3, 0), ('FLOATS', 'F', 8, 2),
+    ('DATE', 'D', 8, 0), ('FLAG', 'L', 1, 0)]
+ROWS = [
+    ('Avis una', 5, 18, 2.5, None, 1.25, '20150601', 'T'),
+    ('Coulicou à', -3, None, 7, None, 3, None, 'N'),
+    ('NA', 0, 7, None, None, None, None, '?'),
+    ('  ', 12, 1, 0, None, -0.5, '20160229', None)]
+
+
+def write_dbf(path, fields, rows):
+    """Write a dBASE III file. The fields are (name, type, size, decimals)."""
+    header_size = 32 + 32 * len(fields) + 1
+    record_size = 1 + sum(f[2] for f in fields)
+    with open(path, 'wb') as out_file:
+        out_file.write(struct.pack(
+            '<BBBBIHH20x', 3, 120, 1, 1, len(rows), header_size,
+            record_size))
+        for name, type_, size, decimals in fields:
+            out_file.write(struct.pack(
+                '<11sc4xBB14x', name.encode(), type_.encode(), size,
+                decimals))
+        out_file.write(b'\r')
+        for row in rows:
+            out_file.write(b' ')
+            for (_, type_, size, _), value in zip(fields, row):
+                value = '' if value is None else str(value)
+                value = value.rjust(size) if type_ in 'NF' else value.ljust(
+                    size)
+                out_file.write(value.encode('utf-8')[:size].ljust(size))
+        out_file.write(b'\x1a')
+
+
+def test_read_dbf_matches_the_old_csv_path(tmp_path):
+    """Every cell is the same text as the simpledbf CSV round trip gave."""
+    simpledbf = pytest.importorskip('simpledbf')
+    path = tmp_path / 'TEST.DBF'
+    write_dbf(path, FIELDS, ROWS)
+
+    csv_path = tmp_path / 'TEST.csv'
+    simpledbf.Dbf5(str(path), codec='utf-8').to_dataframe().to_csv(
+        csv_path, index=False)
+    old = pd.read_csv(csv_path, dtype='unicode')
+    old = old.astype(object).where(old.notna(), None)
+
+    new = dbf.read_dbf(path, cache=False)
+
+    assert new.to_dict('records') == old.to_dict('records')
+    assert new.INTS.tolist() == ['5', '-3', '0', '12']
+    assert new.BLANKS.tolist() == ['18.0', None, '7.0', '1.0']
+
+
+def test_read_dbf_in_chunks(tmp_path):
+    """The float columns are found over the whole file, not per chunk."""
+    path = tmp_path / 'TEST.DBF'
+    write_dbf(path, FIELDS, ROWS)
+    chunks = list(dbf.chunks(path, chunk_rows=1))
+    whole = dbf.read_dbf(path, cache=False)
+    assert pd.concat(chunks, ignore_index=True).equals(whole)
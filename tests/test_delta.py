@@ -0,0 +1,114 @@
+"""Test syncing a dataset's records by their natural keys."""
+
+import json
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from pylib import db
+from pylib.delta import Delta, key_columns, key_hashes
+
+KEYS = ['GUID']
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Make an empty database."""
+    path = tmp_path / 'sightings.db'
+    cxn = sqlite3.connect(path)
+    cxn.executescript((db.SCRIPT_PATH / 'create_db_sqlite.sql').read_text())
+    cxn.close()
+    return path
+
+
+def release(*records):
+    """Build the counts for (GUID, count) pairs, keyed like the raw data."""
+    df = pd.DataFrame({
+        'event_id': 1, 'taxon_id': 1,
+        'count': [c for _, c in records],
+        'count_json': [json.dumps({'GUID': g}) for g, _ in records]})
+    return df, key_hashes(pd.DataFrame({'GUID': [g for g, _ in records]}))
+
+
+def sync(path, *chunks):
+    """Sync the counts with a release, in chunks, like an ingest does."""
+    with db.IngestSession(path) as session:
+        delta = Delta(session, 'counts', 'test', KEYS)
+        ids = [delta.save(*release(*chunk)) for chunk in chunks]
+        delta.delete_missing()
+    return delta.tally, ids
+
+
+def saved(path):
+    """Get the counts in the database by their natural key."""
+    cxn = sqlite3.connect(path)
+    sql = """SELECT json_extract(count_json, '$.GUID'), count_id, count
+               FROM counts ORDER BY 1"""
+    rows = {r[0]: r[1:] for r in cxn.execute(sql)}
+    cxn.close()
+    return rows
+
+
+def test_sync_inserts_updates_and_deletes(db_path):
+    """Only what changed is written and the kept records keep their IDs."""
+    tally, _ = sync(db_path, [('a', 1), ('b', 2)], [('c', 3)])
+    assert tally == {'inserted': 3, 'updated': 0, 'deleted': 0}
+    before = saved(db_path)
+
+    tally, _ = sync(db_path, [('a', 1), ('c', 30)], [('d', 4)])
+    assert tally == {'inserted': 1, 'updated': 1, 'deleted': 1}
+
+    after = saved(db_path)
+    assert sorted(after) == ['a', 'c', 'd']
+    assert after['a'] == before['a']
+    assert after['c'] == (before['c'][0], 30)
+    assert after['d'][0] > max(i for i, _ in before.values())
+
+
+def test_sync_same_release_is_a_no_op(db_path):
+    """Syncing the release we already have writes nothing."""
+    records = [('a', 1), ('b', 2), ('c', 3)]
+    sync(db_path, records)
+    before = saved(db_path)
+    tally, _ = sync(db_path, records[:2], records[2:])
+    assert tally == {'inserted': 0, 'updated': 0, 'deleted': 0}
+    assert saved(db_path) == before
+
+
+def test_first_record_with_a_key_wins(db_path):
+    """A key seen again in a later chunk is skipped and gets the same ID."""
+    tally, ids = sync(db_path, [('a', 1)], [('a', 2), ('b', 3)])
+    assert tally['inserted'] == 2
+    assert ids[1][0] == ids[0][0]
+    assert saved(db_path)['a'][1] == 1
+
+
+def test_keys_from_the_parent_json(db_path):
+    """Counts can be keyed by fields in their event's JSON."""
+    cxn = sqlite3.connect(db_path)
+    cxn.executemany(
+        "INSERT INTO events (event_id, place_id, dataset_id, year, day, "
+        "event_json) VALUES (?, 1, 'test', 2014, 1, ?)",
+        [(7, json.dumps({'ATTEMPT': 'a1'})),
+         (8, json.dumps({'ATTEMPT': 'a2'}))])
+    cxn.commit()
+    cxn.close()
+
+    keys = ['events.ATTEMPT', 'TYPE']
+
+    def sync_types(counts):
+        df = pd.DataFrame({
+            'event_id': [7, 8], 'taxon_id': 1, 'count': counts,
+            'count_json': [json.dumps({'TYPE': 'eggs'})] * 2,
+            'ATTEMPT': ['a1', 'a2'], 'TYPE': 'eggs'})
+        with db.IngestSession(db_path) as session:
+            delta = Delta(session, 'counts', 'test', keys)
+            ids = delta.save(df, key_hashes(df.loc[:, key_columns(keys)]))
+            delta.delete_missing()
+        return delta.tally, ids.tolist()
+
+    _, ids = sync_types([1, 2])
+    tally, same_ids = sync_types([1, 5])
+    assert tally == {'inserted': 0, 'updated': 1, 'deleted': 0}
+    assert same_ids == ids
@@ -0,0 +1,83 @@
+"""Test the eBird raw line prefilter."""
+
+from io import BytesIO
+
+import pandas as pd
+
+from pylib import ebird_ingest, readers
+
+TO_TAXON_ID = {'Avis una': 1, 'Avis duo': 2}
+HEADER = sorted(c.replace('_', ' ') for c in ebird_ingest.COLUMNS)
+
+
+def line(**fields):
+    """Build a raw line, with good values for the fields not given."""
+    values = {
+        'APPROVED': '1', 'ALL SPECIES REPORTED': '1', 'LONGITUDE': '-80.5',
+        'LATITUDE': '40.25', 'SCIENTIFIC NAME': 'Avis una',
+        'SAMPLING EVENT IDENTIFIER': 'S1', 'OBSERVATION DATE': '2014-05-01',
+        'TIME OBSERVATIONS STARTED': '07:30:00', 'DURATION MINUTES': '60',
+        'OBSERVATION COUNT': '2', 'GLOBAL UNIQUE IDENTIFIER': 'G1',
+        'EFFORT DISTANCE KM': '1.5'}
+    values.update({k.replace('_', ' '): v for k, v in fields.items()})
+    return '\t'.join(values.get(c, '') for c in HEADER)
+
+
+def block(*lines):
+    """Build a raw block from its lines."""
+    return '\n'.join(['\t'.join(HEADER), *lines, '']).encode()
+
+
+LINES = [
+    line(GLOBAL_UNIQUE_IDENTIFIER='G1'),
+    line(GLOBAL_UNIQUE_IDENTIFIER='G2', APPROVED='0'),
+    line(GLOBAL_UNIQUE_IDENTIFIER='G3', ALL_SPECIES_REPORTED='0'),
+    line(GLOBAL_UNIQUE_IDENTIFIER='G4', LONGITUDE='10.0'),
+    line(GLOBAL_UNIQUE_IDENTIFIER='G6', SCIENTIFIC_NAME='Avis alia'),
+    line(GLOBAL_UNIQUE_IDENTIFIER='G7', SAMPLING_EVENT_IDENTIFIER='S2',
+         SCIENTIFIC_NAME='Avis alia', LONGITUDE='-81.0'),
+    line(GLOBAL_UNIQUE_IDENTIFIER='G8', SAMPLING_EVENT_IDENTIFIER='S2',
+         SCIENTIFIC_NAME='Avis alia', LONGITUDE='-81.0'),
+    line(GLOBAL_UNIQUE_IDENTIFIER='G9', SAMPLING_EVENT_IDENTIFIER='S2',
+         SCIENTIFIC_NAME='Avis duo', LONGITUDE='-81.0', OBSERVATION_COUNT='X'),
+    'short\tline']
+BLOCK = block(*LINES)
+
+
+def test_prefilter_drops_unused_lines():
+    """Keep the good target lines & the first line of each checklist."""
+    junk = line(GLOBAL_UNIQUE_IDENTIFIER='G5', LATITUDE='x')
+    kept = ebird_ingest.prefilter(block(junk, *LINES), TO_TAXON_ID)
+    ids = pd.read_csv(BytesIO(kept), sep='\t', dtype=str)
+    assert ids['GLOBAL UNIQUE IDENTIFIER'].tolist() == ['G1', 'G7', 'G9']
+
+
+def test_prefilter_keeps_nothing():
+    """A block without a usable line becomes None."""
+    assert ebird_ingest.prefilter(
+        block(line(APPROVED='0')), TO_TAXON_ID) is None
+
+
+def test_prefilter_gives_the_same_records():
+    """The records built from a prefiltered block are the same as without.
+
+    Without the prefilter a junk number would fail the read, so there are
+    none here. The counts may be ints instead of floats, SQLite3 stores them
+    the same way.
+    """
+    raw_data = readers.read_csv(
+        BytesIO(BLOCK), columns=ebird_ingest.COLUMNS,
+        categories=ebird_ingest.CATEGORIES, numbers=ebird_ingest.NUMBERS,
+        delimiter='\t', quoting=3)
+    raw_data = ebird_ingest.filter_data(raw_data)
+    expect = (ebird_ingest.build_places(raw_data),
+              ebird_ingest.build_events(raw_data),
+              ebird_ingest.build_counts(raw_data, TO_TAXON_ID))
+
+    _, found = ebird_ingest.transform_chunk((0, BLOCK), TO_TAXON_ID)
+
+    assert found[2].shape[0] == 2
+    for want, got in zip(expect, found):
+        pd.testing.assert_frame_equal(
+            got.reset_index(drop=True), want.reset_index(drop=True),
+            check_dtype=False)
@@ -0,0 +1,31 @@
+"""Test the CSV export manifest."""
+
+import json
+
+from pylib import export
+
+
+def entry(file_name, table='counts', dataset_id='ebird'):
+    """Build a manifest entry."""
+    return {'file': file_name, 'table': table, 'dataset_id': dataset_id}
+
+
+def test_reexport_replaces_old_shards(tmp_path):
+    """A table exported again drops its old entries & files."""
+    old = [entry('counts_ebird_001.csv'), entry('counts_ebird_002.csv'),
+           entry('taxa.csv', 'taxa', None),
+           entry('counts/dataset_id=ebird/year=2014/part-0.parquet')]
+    for name in ('counts_ebird_001.csv', 'counts_ebird_002.csv', 'taxa.csv'):
+        (tmp_path / name).write_text('')
+    export.update_manifest(tmp_path, old)
+
+    export.update_manifest(tmp_path, [entry('counts_ebird.csv.gz')])
+
+    with open(tmp_path / export.MANIFEST) as in_file:
+        files = [e['file'] for e in json.load(in_file)['files']]
+    assert files == [
+        'counts/dataset_id=ebird/year=2014/part-0.parquet',
+        'counts_ebird.csv.gz', 'taxa.csv']
+    assert not (tmp_path / 'counts_ebird_001.csv').exists()
+    assert not (tmp_path / 'counts_ebird_002.csv').exists()
+    assert (tmp_path / 'taxa.csv').exists()
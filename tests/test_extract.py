@@ -0,0 +1,44 @@
+"""Test writing query results to files."""
+
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from pylib import db, extract, query
+
+
+@pytest.fixture
+def cxn(tmp_path, monkeypatch):
+    """Make a database with one sighting & an empty query cache."""
+    monkeypatch.setattr(query, 'CACHE_DIR', tmp_path / 'query_cache')
+    cxn = sqlite3.connect(tmp_path / 'sightings.db')
+    cxn.executescript((db.SCRIPT_PATH / 'create_db_sqlite.sql').read_text())
+    cxn.executescript("""
+        INSERT INTO datasets (dataset_id, title, version)
+             VALUES ('ebird', 'eBird', '1');
+        INSERT INTO taxa (taxon_id, sci_name) VALUES (1, 'Avis una');
+        INSERT INTO places (place_id, dataset_id, lng, lat)
+             VALUES (1, 'ebird', -100.5, 40.25);
+        INSERT INTO events (event_id, place_id, dataset_id, year, day)
+             VALUES (1, 1, 'ebird', 2014, 100);
+        INSERT INTO counts (count_id, event_id, dataset_id, taxon_id, count)
+             VALUES (1, 1, 'ebird', 1, 3);
+        """)
+    yield cxn
+    cxn.close()
+
+
+def test_extract_skips_the_query_cache(tmp_path, cxn):
+    """The file is the copy, so an extract doesn't fill the query cache."""
+    path = tmp_path / 'out.csv'
+    assert extract.extract(path, species='Avis una', cxn=cxn) == 1
+    assert pd.read_csv(path).count_id.tolist() == [1]
+    assert not query.CACHE_DIR.exists()
+
+
+def test_extract_with_the_query_cache(tmp_path, cxn):
+    """Asking for the cache saves the results there too."""
+    pytest.importorskip('pyarrow.feather')
+    extract.extract(tmp_path / 'out.csv', cxn=cxn, cache=True)
+    assert list(query.CACHE_DIR.rglob('*.feather'))
@@ -0,0 +1,65 @@
+"""Test the vectorized geohashes."""
+
+import numpy as np
+import pytest
+
+from pylib import geohash
+
+
+def test_encode_known_hashes():
+    """Match geohashes from the reference implementation."""
+    hashes = geohash.encode([-5.6, 10.40744], [42.6, 57.64911], 11)
+    assert [h[:5] for h in hashes] == ['ezs42', 'u4pru']
+    assert hashes[1] == 'u4pruydqqvj'
+
+
+def test_missing_points_have_no_hash():
+    """A missing longitude or latitude gives None."""
+    hashes = geohash.encode([1.0, np.nan, 1.0], [np.nan, 1.0, 2.0])
+    assert hashes.tolist()[:2] == [None, None]
+    assert hashes[2] is not None
+
+
+def test_cell_edges_go_in_the_lower_cell():
+    """A point on an edge goes west & south, like PostGIS' ST_GeoHash()."""
+    assert geohash.encode([0.0, 1e-9], [0.0, 1e-9], 1).tolist() == ['7', 's']
+    corners = geohash.encode([-180.0, 180.0], [-90.0, 90.0], 1).tolist()
+    assert corners == ['0', 'z']
+
+
+@pytest.mark.parametrize('precision', [1, 5, 7, 9])
+def test_round_trip(precision):
+    """A point is inside the bounds of its cell and decodes to the center."""
+    rand = np.random.default_rng(42)
+    lng = rand.uniform(-180.0, 180.0, 1000)
+    lat = rand.uniform(-90.0, 90.0, 1000)
+    hashes = geohash.encode(lng, lat, precision)
+
+    west, east, south, north = geohash.bounds(hashes)
+    assert ((west < lng) & (lng <= east)).all()
+    assert ((south < lat) & (lat <= north)).all()
+
+    center_lng, center_lat = geohash.decode(hashes)
+    assert (geohash.encode(center_lng, center_lat, precision) == hashes).all()
+
+
+def test_bad_digits():
+    """Only the base 32 digits are allowed."""
+    with pytest.raises(ValueError):
+        geohash.bounds(['ezsa2'])
+
+
+def test_neighbors_across_cell_borders():
+    """The neighbors cross into the next cells up the hierarchy."""
+    found = geohash.neighbors(['ezs42'])[0].tolist()
+    assert dict(zip(geohash.NEIGHBORS, found)) == {
+        'n': 'ezs48', 'ne': 'ezs49', 'e': 'ezs43', 'se': 'ezs41',
+        's': 'ezs40', 'sw': 'ezefp', 'w': 'ezefr', 'nw': 'ezefx'}
+
+
+def test_neighbors_wrap_and_stop_at_the_poles():
+    """The neighbors wrap around the antimeridian but not over the poles."""
+    found = dict(zip(geohash.NEIGHBORS, geohash.neighbors(['b'])[0]))
+    assert found['w'] == 'z'  # b is the north west corner
+    assert found['e'] == 'c'
+    assert found['n'] is None and found['ne'] is None and found['nw'] is None
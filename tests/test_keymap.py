@@ -0,0 +1,34 @@
+"""Test the compact key maps."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pylib.keymap import KeyMap, hash_keys
+
+
+def test_batches_match_one_map():
+    """Keys added a batch at a time are found like keys added at once."""
+    rng = np.random.default_rng(1)
+    hashes = rng.choice(2 ** 62, size=10_000, replace=False).astype(np.uint64)
+    ids = np.arange(hashes.shape[0])
+
+    key_map = KeyMap()
+    for start in range(0, hashes.shape[0], 700):
+        key_map.add(hashes[start:start + 700], ids[start:start + 700])
+
+    assert len(key_map) == hashes.shape[0]
+    assert len(key_map.runs) <= 6
+    assert (key_map.get(hashes[::-1]) == ids[::-1]).all()
+
+    missing = np.array([1, 2, 3], dtype=np.uint64)
+    assert not key_map.contains(missing).any()
+    with pytest.raises(KeyError):
+        key_map.get(missing)
+
+
+def test_hash_keys_is_stable():
+    """The same keys always hash the same way."""
+    keys = pd.Series(['S1', 'S2', 'S1'])
+    hashes = hash_keys(keys)
+    assert hashes[0] == hashes[2] != hashes[1]
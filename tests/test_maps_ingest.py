@@ -0,0 +1,53 @@
+"""Test matching the MAPS species list to the taxa already loaded."""
+
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from pylib import db, maps_ingest
+
+MAPS_LIST = pd.DataFrame({
+    'SPEC': ['AMRO', 'WIWA'],
+    'SCINAME': ['Turdus  migratorius', 'Cardellina pusilla'],
+    'COMMONNAME': ['American Robin', "Wilson's Warbler"]})
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Make a database with Clements-like taxa, which have no SPEC code."""
+    monkeypatch.setattr(maps_ingest.dbf, 'read_dbf', lambda _: MAPS_LIST)
+    path = tmp_path / 'sightings.db'
+    cxn = sqlite3.connect(path)
+    cxn.executescript((db.SCRIPT_PATH / 'create_db_sqlite.sql').read_text())
+    cxn.executemany(
+        'INSERT INTO taxa (taxon_id, sci_name, class) VALUES (?, ?, ?)',
+        [(1, 'Turdus migratorius', 'aves'), (2, 'Sialia sialis', 'aves')])
+    cxn.commit()
+    cxn.close()
+    return path
+
+
+def insert_taxa(path):
+    """Run the MAPS taxa step and get the taxa back."""
+    with db.IngestSession(path) as session:
+        maps_ingest.insert_taxa(session)
+    cxn = sqlite3.connect(path)
+    sql = 'SELECT taxon_id, sci_name, spec FROM taxa ORDER BY taxon_id'
+    rows = cxn.execute(sql).fetchall()
+    cxn.close()
+    return rows
+
+
+def test_insert_taxa_after_clements(db_path):
+    """Known taxa get their code by name and only new species are added."""
+    assert insert_taxa(db_path) == [
+        (1, 'Turdus migratorius', 'AMRO'),
+        (2, 'Sialia sialis', None),
+        (3, 'Cardellina pusilla', 'WIWA')]
+
+
+def test_insert_taxa_twice(db_path):
+    """A second MAPS ingest leaves the taxa alone."""
+    first = insert_taxa(db_path)
+    assert insert_taxa(db_path) == first
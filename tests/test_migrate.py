@@ -0,0 +1,79 @@
+"""Test copying the SQLite3 database into PostgreSQL."""
+
+import sqlite3
+import sys
+import textwrap
+
+import pytest
+
+from pylib import db, migrate
+
+# A stand in for psql: each \copy appends its rows to <table>.csv, as if the
+# shard were committed, and TRUNCATE removes them all.
+FAKE_PSQL = """
+    import os, re, sys
+    from pathlib import Path
+    out = Path(sys.argv[1])
+    sql = sys.argv[-1]
+    if match := re.match(r'\\\\copy (\\w+)', sql):
+        rows = sys.stdin.read()
+        if match[1] == os.environ.get('FAIL_TABLE'):
+            sys.exit(1)
+        with open(out / f'{match[1]}.csv', 'a') as out_file:
+            out_file.write(rows)
+    elif sql.startswith('TRUNCATE'):
+        for path in out.glob('*.csv'):
+            path.unlink()
+    """
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """Make a small SQLite3 database and point psql at the fake."""
+    path = tmp_path / 'sightings.sqlite.db'
+    cxn = sqlite3.connect(path)
+    cxn.executescript((db.SCRIPT_PATH / 'create_db_sqlite.sql').read_text())
+    cxn.execute("INSERT INTO datasets (dataset_id, title, version) "
+                "VALUES ('ebird', 'eBird', '1')")
+    cxn.executemany(
+        "INSERT INTO taxa (taxon_id, sci_name) VALUES (?, ?)",
+        [(i, f'Avis {i}') for i in range(1, 6)])
+    cxn.executemany(
+        "INSERT INTO places (place_id, dataset_id, lng, lat) "
+        "VALUES (?, 'ebird', -100.5, 40.25)", [(i, ) for i in range(1, 8)])
+    cxn.commit()
+    cxn.close()
+
+    out = tmp_path / 'postgres'
+    out.mkdir()
+    fake = tmp_path / 'psql.py'
+    fake.write_text(textwrap.dedent(FAKE_PSQL))
+    monkeypatch.setattr(db, 'DB_FILE', str(path))
+    monkeypatch.setattr(db, 'PSQL', f'{sys.executable} {fake} {out}')
+    monkeypatch.setattr(db, 'create_postgres', lambda **_: None)
+    monkeypatch.setattr(db, 'create_postgres_indexes', lambda: None)
+    return out
+
+
+def loaded(out):
+    """Get the row count of each table copied into the fake PostgreSQL."""
+    return {p.stem: len(p.read_text().splitlines())
+            for p in sorted(out.glob('*.csv'))}
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_migrate_copies_every_shard(sqlite_db, workers):
+    """Every row gets copied once, whatever the shard size."""
+    migrate.migrate(shard_rows=3, workers=workers)
+    assert loaded(sqlite_db) == {'datasets': 1, 'places': 7, 'taxa': 5}
+    point = 'SRID=4326;POINT(-100.5 40.25)'
+    assert point in (sqlite_db / 'places.csv').read_text()
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_failed_migrate_leaves_no_rows(sqlite_db, monkeypatch, workers):
+    """A shard that fails empties the tables the other shards filled."""
+    monkeypatch.setenv('FAIL_TABLE', 'places')
+    with pytest.raises(Exception):
+        migrate.migrate(shard_rows=3, workers=workers)
+    assert loaded(sqlite_db) == {}
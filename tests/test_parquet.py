@@ -0,0 +1,36 @@
+"""Test the Parquet export."""
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from pylib import parquet
+
+
+def counts(day, count_id, event_id, place_id):
+    """Build one day of joined counts like parquet.SELECT returns."""
+    return pd.DataFrame({
+        'count_id': [count_id], 'event_id': [event_id],
+        'place_id': [place_id], 'taxon_id': [1],
+        'lng': [-72.5], 'lat': [40.5], 'radius': [None],
+        'geohash': ['dr7qk8m'], 'year': [2014], 'day': [day],
+        'started': [None], 'ended': [None], 'count': [1],
+        'sci_name': ['Anas rubripes'], 'group': [None], 'class': ['aves'],
+        'order': [None], 'family': [None], 'genus': [None],
+        'common_name': [None], 'category': [None], 'target': ['t'],
+        'place_json': ['{"a": "1"}'], 'event_json': [f'{{"e": "{day}"}}'],
+        'count_json': ['{}']})
+
+
+def test_split_json_once_per_partition(tmp_path):
+    """A place in two blocks of days gets one place_json row."""
+    writers = parquet.PartitionWriters(tmp_path, 'ebird', 2014, 'split')
+    parquet.write_rows(writers, counts(1, 1, 1, 1), 'split')
+    parquet.write_rows(writers, counts(2, 2, 2, 1), 'split')
+    writers.close()
+
+    places = pq.read_table(writers.path('place_json')).to_pandas()
+    events = pq.read_table(writers.path('event_json')).to_pandas()
+    rows = pq.read_table(writers.path(parquet.COUNTS)).to_pandas()
+    assert places.place_id.tolist() == [1]
+    assert events.event_id.tolist() == [1, 2]
+    assert rows.count_id.tolist() == [1, 2]
@@ -0,0 +1,64 @@
+"""Test the sightings query & its cache."""
+
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from pylib import db, query, spatial
+
+SQL, PARAMS = query.plan(species='Cardinalis cardinalis')
+
+
+def connect(path):
+    """Make a database with a datasets table."""
+    cxn = sqlite3.connect(path)
+    cxn.execute(
+        'CREATE TABLE IF NOT EXISTS datasets '
+        '(dataset_id TEXT, version TEXT, extracted TEXT)')
+    cxn.execute("INSERT INTO datasets VALUES ('ebird', '1', '2020-01-01')")
+    return cxn
+
+
+def test_cache_key_has_the_database(tmp_path):
+    """The same query against another database is another cache entry."""
+    keys = []
+    for path in (tmp_path / 'one.db', tmp_path / 'two.db'):
+        cxn = connect(path)
+        keys.append(query.cache_key(
+            cxn, SQL, PARAMS, query.database(cxn)))
+        cxn.close()
+    assert keys[0] != keys[1]
+
+
+def test_in_memory_database_has_no_name():
+    """We can't tell in-memory databases apart, so they aren't cached."""
+    assert query.database(connect(':memory:')) is None
+
+
+def sightings_db(path, rtree):
+    """Make a database with one sighting, with or without the R*Tree."""
+    cxn = sqlite3.connect(path)
+    cxn.executescript((db.SCRIPT_PATH / 'create_db_sqlite.sql').read_text())
+    if rtree:
+        cxn.executescript((db.SCRIPT_PATH / db.INDEX_SCRIPT).read_text())
+    cxn.executescript("""
+        INSERT INTO taxa (taxon_id, sci_name) VALUES (1, 'Avis una');
+        INSERT INTO places (place_id, dataset_id, lng, lat)
+             VALUES (1, 'ebird', -100.5, 40.25), (2, 'ebird', 10.0, 50.0);
+        INSERT INTO events (event_id, place_id, dataset_id, year, day)
+             VALUES (1, 1, 'ebird', 2014, 100), (2, 2, 'ebird', 2014, 100);
+        INSERT INTO counts (count_id, event_id, dataset_id, taxon_id, count)
+             VALUES (1, 1, 'ebird', 1, 3), (2, 2, 'ebird', 1, 4);
+        """)
+    return cxn
+
+
+@pytest.mark.parametrize('rtree', [True, False])
+def test_bbox_with_or_without_rtree(tmp_path, rtree):
+    """Databases made before the places R*Tree can still filter by bbox."""
+    cxn = sightings_db(tmp_path / 'sightings.db', rtree)
+    chunks = query.sightings(bbox=(-101, 40, -100, 41), cxn=cxn, cache=False)
+    assert pd.concat(chunks).count_id.tolist() == [1]
+    places = spatial.places_in_bbox(cxn, (-101, -100), (40, 41))
+    assert places.place_id.tolist() == [1]
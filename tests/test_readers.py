@@ -0,0 +1,46 @@
+"""Test reading raw CSV files with a column projection."""
+
+from io import BytesIO
+
+import pandas as pd
+
+from pylib import readers
+
+CSV = b"""Name, Code ,Lng,Skip me
+Avis una,A,-80.5,x
+Avis duo,B,,y
+Avis una,A,0.1234567890123456789,z
+"""
+
+
+def test_read_csv_projection_and_dtypes():
+    """Only the wanted columns are read, with compact dtypes."""
+    df = readers.read_csv(
+        BytesIO(CSV), columns={'Name', 'Code', 'Lng'}, categories=['Code'],
+        numbers=['Lng'])
+    assert df.columns.tolist() == ['Name', ' Code ', 'Lng']
+    assert df.Name.tolist() == ['Avis una', 'Avis duo', 'Avis una']
+    assert df[' Code '].dtype == 'category'
+    assert df.Lng.dtype == float
+    assert df.Lng.isna().tolist() == [False, True, False]
+
+
+def test_read_csv_every_column_as_strings():
+    """With no projection every column is read, as strings."""
+    df = readers.read_csv(BytesIO(CSV))
+    assert df.shape == (3, 4)
+    assert df.Lng.tolist()[0] == '-80.5'
+
+
+def test_read_csv_matches_plain_read():
+    """The numbers are parsed like a plain pandas.read_csv() would."""
+    df = readers.read_csv(BytesIO(CSV), columns={'Lng'}, numbers=['Lng'])
+    plain = pd.read_csv(BytesIO(CSV), float_precision='high')
+    pd.testing.assert_series_equal(df.Lng, plain.Lng)
+
+
+def test_read_csv_in_chunks():
+    """A chunksize gives a reader with the same projection."""
+    chunks = list(readers.read_csv(
+        BytesIO(CSV), columns={'Name'}, chunksize=2))
+    assert [c.shape for c in chunks] == [(2, 1), (1, 1)]
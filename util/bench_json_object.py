@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""Benchmark util.json_object against the original row-at-a-time version."""
+
+import argparse
+import json
+import textwrap
+from timeit import default_timer
+
+import numpy as np
+import pandas as pd
+
+from pylib import util
+from pylib.util import log
+
+COUNT_FIELDS = """SCIENTIFIC_NAME GLOBAL_UNIQUE_IDENTIFIER LAST_EDITED_DATE
+    TAXONOMIC_ORDER CATEGORY SUBSPECIES_SCIENTIFIC_NAME
+    BREEDING_BIRD_ATLAS_CODE BREEDING_BIRD_ATLAS_CATEGORY AGE_SEX
+    OBSERVER_ID HAS_MEDIA SPECIES_COMMENTS""".split()
+
+
+def main(args):
+    """Time both versions on the same frame and check they agree."""
+    log(f'Building a {args.rows:,} row frame')
+    df = ebird_counts(args.rows, args.seed)
+
+    log('Running the row-at-a-time version')
+    start = default_timer()
+    expect = json_object_rows(df, COUNT_FIELDS)
+    rows_secs = default_timer() - start
+
+    log('Running the columnar version')
+    start = default_timer()
+    actual = util.json_object(df, COUNT_FIELDS)
+    cols_secs = default_timer() - start
+
+    log(f'Row-at-a-time {rows_secs:8.2f} s')
+    log(f'Columnar      {cols_secs:8.2f} s')
+    log(f'Speed up      {rows_secs / cols_secs:8.1f} x')
+
+    if actual != expect:
+        raise ValueError('The columnar output is not identical')
+    log('Outputs are identical')
+
+
+def json_object_rows(df, fields):
+    """Build json objects one row at a time (the original version)."""
+    df = df.fillna('')
+    json_array = []
+    for row in df.itertuples():
+        obj = {}
+        for field in fields:
+            value = getattr(row, field)
+            if value != '':
+                obj[field] = value
+        json_array.append(json.dumps(obj))
+    return json_array
+
+
+def ebird_counts(rows, seed):
+    """Build a frame shaped like the eBird count fields."""
+    rng = np.random.default_rng(seed)
+
+    def pick(values, size=rows, empty=0.0):
+        column = rng.choice(np.array(values, dtype=object), size)
+        column[rng.random(size) < empty] = np.nan
+        return column
+
+    species = [f'Genus species{i}' for i in range(120)]
+    observers = [f'obsr{i}' for i in range(50_000)]
+    comments = ['Heard only', 'Flyover', 'Singing "loudly"', 'Café feeder']
+
+    return pd.DataFrame({
+        'SCIENTIFIC_NAME': pick(species),
+        'GLOBAL_UNIQUE_IDENTIFIER': [
+            f'URN:CornellLabOfOrnithology:EBIRD:OBS{i}' for i in range(rows)],
+        'LAST_EDITED_DATE': pick(
+            [f'2019-{m:02d}-{d:02d} 10:11:12'
+             for m in range(1, 13) for d in range(1, 29)]),
+        'TAXONOMIC_ORDER': pick([str(i) for i in range(10_000, 30_000)]),
+        'CATEGORY': pick(['species', 'issf', 'slash', 'spuh']),
+        'SUBSPECIES_SCIENTIFIC_NAME': pick(species, empty=0.9),
+        'BREEDING_BIRD_ATLAS_CODE': pick(['S', 'P', 'NY'], empty=0.95),
+        'BREEDING_BIRD_ATLAS_CATEGORY': pick(['C2', 'C3', 'C4'], empty=0.95),
+        'AGE_SEX': pick(['Male, Adult (1)'], empty=0.99),
+        'OBSERVER_ID': pick(observers),
+        'HAS_MEDIA': pick(['0', '1']),
+        'SPECIES_COMMENTS': pick(comments, empty=0.9),
+    })
+
+
+def parse_args():
+    """Process command-line arguments."""
+    description = """Compare the columnar json_object() with the original
+        row-at-a-time version on a frame of synthetic eBird counts."""
+    arg_parser = argparse.ArgumentParser(
+        description=textwrap.dedent(description),
+        fromfile_prefix_chars='@')
+
+    arg_parser.add_argument(
+        '--rows', type=int, default=1_000_000,
+        help="""How many rows to put in the frame. (default: %(default)s)""")
+
+    arg_parser.add_argument(
+        '--seed', type=int, default=42,
+        help="""Random number seed. (default: %(default)s)""")
+
+    return arg_parser.parse_args()
+
+
+if __name__ == '__main__':
+    ARGS = parse_args()
+    main(ARGS)
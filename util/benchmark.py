@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the ETL on synthetic data.
+
+We write synthetic raw data (see synthetic.py) to a work directory, then
+time etl.py create and, for each dataset, etl.py ingest & export there. Each
+step runs in its own process, like it does for real. The timings & record
+counts are compared with a saved baseline: a step that got slower than the
+tolerance allows, or a dataset whose record count changed, is reported and
+the script exits with an error. So does a dataset that loaded no counts,
+the synthetic data no longer fits its ingest. Save a baseline on your own
+machine first, timings from different machines don't compare.
+
+Run this from the repository root.
+"""
+
+import argparse
+import json
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import textwrap
+from argparse import Namespace
+from pathlib import Path
+from timeit import default_timer
+
+import synthetic
+from pylib import db
+from pylib.util import log
+
+ETL = Path('etl.py').resolve()
+SQL = Path('sql').resolve()
+BASELINE = Path('data') / 'interim' / 'benchmark_baseline.json'
+
+DATASETS = """clements bbs maps nestwatch pollard naba bbl
+    ebird""".split()  # In etl.py's ingest order, clements goes first
+TOLERANCE = 0.25
+MIN_SECONDS = 0.5  # Ignore slow downs smaller than this, they are noise
+
+
+def main(args):
+    """Run the benchmark and compare it with the baseline."""
+    work = Path(args.work_dir or tempfile.mkdtemp(prefix='sightings_bench_'))
+    try:
+        results = run(args, work)
+    finally:
+        if args.work_dir or args.keep:
+            log(f'The work directory is {work}')
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+    report(results)
+
+    if args.save:
+        save(args, results)
+        return
+
+    baseline = load(args)
+    if baseline and compare(args, results, baseline):
+        sys.exit(1)
+
+
+def run(args, work):
+    """Write the data and time each step."""
+    synthetic.main(Namespace(root=work, scale=args.scale, seed=args.seed))
+    (work / db.PROCESSED).mkdir(parents=True, exist_ok=True)
+    if not (work / 'sql').exists():
+        (work / 'sql').symlink_to(SQL)
+
+    results = {'create': {'seconds': etl(work, 'create')}}
+
+    for dataset in args.datasets:
+        ingest = ['ingest', dataset]
+        if args.profile:
+            ingest += ['--profile', str(work / f'profile_{dataset}.json')]
+
+        result = {'seconds': etl(work, *ingest)}
+        result['records'] = count_records(work, dataset)
+        if dataset != 'clements' and not count_rows(work, 'counts', dataset):
+            raise RuntimeError(f'etl.py ingest {dataset} loaded no counts')
+        if dataset != 'clements':
+            result['export_seconds'] = etl(
+                work, 'export', dataset, str(work / 'export'))
+        results[dataset] = result
+
+    return results
+
+
+def etl(work, *args):
+    """Run an etl.py command in the work directory and time it."""
+    log(f'Running etl.py {" ".join(args)}')
+    start = default_timer()
+    done = subprocess.run(
+        [sys.executable, str(ETL), *args], cwd=work, capture_output=True,
+        text=True)
+    seconds = default_timer() - start
+
+    if done.returncode:
+        print(done.stdout[-5000:], done.stderr[-5000:])
+        raise RuntimeError(f'etl.py {" ".join(args)} failed')
+
+    return seconds
+
+
+def count_records(work, dataset):
+    """Count the dataset's records in the work database."""
+    if dataset == 'clements':
+        return count_rows(work, 'taxa')
+    return sum(count_rows(work, t, dataset) for t in db.SPLIT_TABLES)
+
+
+def count_rows(work, table, dataset=None):
+    """Count a table's rows in the work database, maybe for one dataset."""
+    cxn = sqlite3.connect(work / db.PROCESSED / Path(db.DB_FILE).name)
+    sql, params = f'SELECT COUNT(*) FROM {table}', ()
+    if dataset:
+        sql, params = sql + ' WHERE dataset_id = ?', (dataset, )
+    rows = cxn.execute(sql, params).fetchone()[0]
+    cxn.close()
+    return rows
+
+
+def report(results):
+    """Log the timings."""
+    log(f'{"step":<12} {"seconds":>9} {"records":>10} {"records/s":>10} '
+        f'{"export s":>9}')
+    for step, result in results.items():
+        records = result.get('records')
+        rate = records / result['seconds'] if records else None
+        log(f'{step:<12} {result["seconds"]:9.2f} {fmt(records, ",d"):>10} '
+            f'{fmt(rate, ",.0f"):>10} '
+            f'{fmt(result.get("export_seconds"), ".2f"):>9}')
+
+
+def fmt(value, spec):
+    """Format an optional value."""
+    return '-' if value is None else format(value, spec)
+
+
+def save(args, results):
+    """Save the results as the new baseline."""
+    path = Path(args.baseline)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as out_file:
+        json.dump({
+            'scale': args.scale,
+            'seed': args.seed,
+            'results': results}, out_file, indent=2)
+    log(f'Saved the baseline to {path}')
+
+
+def load(args):
+    """Get the baseline if there is one for this scale & seed."""
+    path = Path(args.baseline)
+    if not path.exists():
+        log(f'No baseline in {path}, save one with --save')
+        return None
+
+    with open(path) as in_file:
+        baseline = json.load(in_file)
+
+    if (baseline['scale'], baseline['seed']) != (args.scale, args.seed):
+        log(f'The baseline is for scale {baseline["scale"]} & seed '
+            f'{baseline["seed"]} so there is nothing to compare')
+        return None
+
+    return baseline['results']
+
+
+def compare(args, results, baseline):
+    """Log the steps that regressed. Return True if any did."""
+    problems = []
+    for step, result in results.items():
+        old = baseline.get(step)
+        if not old:
+            continue
+
+        if result.get('records') != old.get('records'):
+            problems.append(
+                f'{step} has {fmt(result.get("records"), ",d")} records, '
+                f'it had {fmt(old.get("records"), ",d")}')
+
+        for key in ('seconds', 'export_seconds'):
+            new_secs, old_secs = result.get(key), old.get(key)
+            if new_secs is None or old_secs is None:
+                continue
+            if (new_secs > old_secs * (1.0 + args.tolerance)
+                    and new_secs - old_secs > MIN_SECONDS):
+                what = 'export' if key == 'export_seconds' else step
+                problems.append(
+                    f'{what} took {new_secs:.2f} s, it took {old_secs:.2f} s '
+                    f'({new_secs / old_secs - 1.0:+.0%})')
+
+    for problem in problems:
+        log(f'REGRESSION: {problem}')
+    if not problems:
+        log('No regressions')
+    return bool(problems)
+
+
+def parse_args():
+    """Process command-line arguments."""
+    description = """Time etl.py create, ingest, & export for each dataset
+        on synthetic data and compare the timings & record counts with a
+        saved baseline."""
+    arg_parser = argparse.ArgumentParser(
+        description=textwrap.dedent(description),
+        fromfile_prefix_chars='@')
+
+    arg_parser.add_argument(
+        '--scale', type=float, default=1.0,
+        help="""Scale the synthetic data by this. (default: %(default)s)""")
+
+    arg_parser.add_argument(
+        '--seed', type=int, default=42,
+        help="""Random number seed for the data. (default: %(default)s)""")
+
+    arg_parser.add_argument(
+        '--datasets', nargs='+', choices=DATASETS, default=DATASETS,
+        help="""Benchmark these datasets. The other datasets need clements
+            so keep it in the list. (default: all of them)""")
+
+    arg_parser.add_argument(
+        '--baseline', default=BASELINE,
+        help="""The baseline file. (default: %(default)s)""")
+
+    arg_parser.add_argument(
+        '--save', action='store_true',
+        help="""Save this run as the baseline instead of comparing it.""")
+
+    arg_parser.add_argument(
+        '--tolerance', type=float, default=TOLERANCE,
+        help="""Report a step as a regression if it is this much slower than
+            the baseline, as a fraction. (default: %(default)s)""")
+
+    arg_parser.add_argument(
+        '--work-dir',
+        help="""Put the data & database in this directory and keep them.
+            By default we use a temporary directory.""")
+
+    arg_parser.add_argument(
+        '--keep', action='store_true',
+        help="""Keep the temporary work directory.""")
+
+    arg_parser.add_argument(
+        '--profile', action='store_true',
+        help="""Also write an ingest --profile report for each dataset to
+            the work directory.""")
+
+    args = arg_parser.parse_args()
+    args.datasets = [d for d in DATASETS if d in args.datasets]
+    return args
+
+
+if __name__ == '__main__':
+    ARGS = parse_args()
+    main(ARGS)
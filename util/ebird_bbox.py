@@ -8,7 +8,8 @@ from pathlib import Path
 
 import pandas as pd
 
-from pylib import util
+from pylib import readers, util
+from pylib.ebird_ingest import CATEGORIES
 from pylib.util import log
 
 RAW_DIR = Path('data') / 'raw' / 'ebird'
@@ -18,12 +19,13 @@ RAW_CSV = 'ebd_relMay-2020.txt.gz'
 def main(args):
     """Ingest eBird data."""
     chunk = 1_000_000
-    reader = pd.read_csv(
+    reader = readers.read_csv(
         RAW_DIR / RAW_CSV,
+        categories=CATEGORIES,
+        numbers=['LONGITUDE', 'LATITUDE'],
         delimiter='\t',
         quoting=3,
-        chunksize=chunk,
-        dtype='unicode')
+        chunksize=chunk)
 
     first_chunk = True
     for i, raw_data in enumerate(reader, 1):
@@ -2,9 +2,9 @@
 
 from pathlib import Path
 import pandas as pd
-import lib.db as db
-import lib.util as util
-from lib.util import log
+import pylib.db as db
+import pylib.util as util
+from pylib.util import log
 
 
 DATASET_ID = 'ebird'
@@ -14,9 +14,9 @@ RAW_CSV = 'ebd_relDec-2018.txt.gz'
 TARGETS = ['Ammospiza caudacuta', 'Ammospiza nelsoni']
 
 
-def ingest():
+def ingest(session):
     """Ingest eBird data."""
-    to_taxon_id = get_taxa()
+    to_taxon_id = get_taxa(session)
 
     chunk = 1_000_000
     reader = pd.read_csv(
@@ -27,42 +27,43 @@ def ingest():
         compression='infer',
         dtype='unicode')
 
-    to_event_id = get_events()
+    to_event_id = get_events(session)
 
     for i, raw_data in enumerate(reader, 1):
         log(f'Processing {DATASET_ID} chunk {i * chunk:,}')
         util.normalize_columns_names(raw_data)
-        insert_counts(raw_data, to_event_id, to_taxon_id)
+        insert_counts(session, raw_data, to_event_id, to_taxon_id)
+        session.commit()
 
 
-def get_taxa():
+def get_taxa(session):
     """Build a dictionary of scientific names and taxon_ids."""
     log(f'Getting {DATASET_ID} taxa')
     sql = """SELECT taxon_id, sci_name
                FROM taxa
               WHERE sci_name IN ({})"""
     sql = sql.format(','.join([f"'{x}'" for x in TARGETS]))
-    taxa = pd.read_sql(sql, db.connect())
+    taxa = pd.read_sql(sql, session.cxn)
     return taxa.set_index('sci_name').taxon_id.to_dict()
 
 
-def get_events():
+def get_events(session):
     """Get events."""
     log(f'Getting {DATASET_ID} events')
 
+    sei = db.json_field('events', 'SAMPLING_EVENT_IDENTIFIER')
     sql = f"""SELECT
-        json_extract(event_json, '$.SAMPLING_EVENT_IDENTIFIER')
-            AS SAMPLING_EVENT_IDENTIFIER,
+        {sei} AS SAMPLING_EVENT_IDENTIFIER,
         event_id
         FROM events
         WHERE DATASET_ID = '{DATASET_ID}'"""
 
-    events = pd.read_sql(sql, db.connect())
+    events = pd.read_sql(sql, session.cxn)
 
     return events.set_index('SAMPLING_EVENT_IDENTIFIER').event_id.to_dict()
 
 
-def insert_counts(counts, to_event_id, to_taxon_id):
+def insert_counts(session, counts, to_event_id, to_taxon_id):
     """Insert counts."""
     in_species = counts['SCIENTIFIC_NAME'].isin(to_taxon_id)
     has_event = counts['SAMPLING_EVENT_IDENTIFIER'].isin(to_event_id)
@@ -71,7 +72,7 @@ def insert_counts(counts, to_event_id, to_taxon_id):
     if counts.shape[0] == 0:
         return
 
-    counts['count_id'] = db.create_ids(counts, 'counts')
+    counts['count_id'] = db.create_ids(session, counts, 'counts')
     counts['event_id'] = counts.SAMPLING_EVENT_IDENTIFIER.map(to_event_id)
     counts['taxon_id'] = counts.SCIENTIFIC_NAME.map(to_taxon_id)
     counts['dataset_id'] = DATASET_ID
@@ -88,11 +89,11 @@ def insert_counts(counts, to_event_id, to_taxon_id):
 
     print(counts.shape)
 
-    counts.loc[:, db.COUNT_FIELDS].to_sql(
-        'counts', db.connect(), if_exists='append', index=False)
+    db.insert_records(session, 'counts', counts.loc[:, db.COUNT_FIELDS])
 
 
 if __name__ == '__main__':
-    ingest()
+    with db.IngestSession() as SESSION:
+        ingest(SESSION)
 
 #SELECT * FROM counts WHERE dataset_id = 'ebird' AND taxon_id in (30923, 30928)
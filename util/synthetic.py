@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+
+"""
+Write synthetic raw data files for every ingest module.
+
+The files are in each source's real format and go where the ingest modules
+look for them, under a root directory: an eBird Basic Dataset gzipped TSV,
+the BBS SQLite database, the MAPS DBF files & stations CSV, the BBL CSVs &
+species page, and the NestWatch, Pollard, NABA, & Clements CSVs. The values
+are random but shaped like the real ones, with the same kinds of gaps & junk
+that the ingest has to filter out. The scale factor multiplies the number of
+records. Run this from the repository root, it reads the taxonomy files that
+ship with the repository.
+"""
+
+import argparse
+import csv
+import gzip
+import random
+import shutil
+import sqlite3
+import struct
+import textwrap
+from datetime import date, timedelta
+from pathlib import Path
+
+from pylib import bbl_ingest, bbs_ingest, clements_ingest, ebird_ingest
+from pylib import maps_ingest, naba_ingest, nestwatch_ingest, pollard_ingest
+from pylib.util import log
+
+TAXONOMY = Path('data') / 'raw' / 'taxonomy'
+TARGETS = 'target_birds.csv'
+BBS_SPECIES = 'breed_bird_survey_species.csv'
+CLEMENTS_CSV = 'eBird-Clements-v2018-integrated-checklist-August-2018.csv'
+
+EBIRD_COLUMNS = [
+    'GLOBAL UNIQUE IDENTIFIER', 'LAST EDITED DATE', 'TAXONOMIC ORDER',
+    'CATEGORY', 'COMMON NAME', 'SCIENTIFIC NAME', 'SUBSPECIES COMMON NAME',
+    'SUBSPECIES SCIENTIFIC NAME', 'OBSERVATION COUNT',
+    'BREEDING BIRD ATLAS CODE', 'BREEDING BIRD ATLAS CATEGORY', 'AGE/SEX',
+    'COUNTRY', 'COUNTRY CODE', 'STATE', 'STATE CODE', 'COUNTY',
+    'COUNTY CODE', 'IBA CODE', 'BCR CODE', 'USFWS CODE', 'ATLAS BLOCK',
+    'LOCALITY', 'LOCALITY ID', ' LOCALITY TYPE', 'LATITUDE', 'LONGITUDE',
+    'OBSERVATION DATE', 'TIME OBSERVATIONS STARTED', 'OBSERVER ID',
+    'SAMPLING EVENT IDENTIFIER', 'PROTOCOL TYPE', 'PROTOCOL CODE',
+    'PROJECT CODE', 'DURATION MINUTES', 'EFFORT DISTANCE KM',
+    'EFFORT AREA HA', 'NUMBER OBSERVERS', 'ALL SPECIES REPORTED',
+    'GROUP IDENTIFIER', 'HAS MEDIA', 'APPROVED', 'REVIEWED', 'REASON',
+    'TRIP COMMENTS', 'SPECIES COMMENTS', '']
+
+BBS_ROUTES = """countrynum INTEGER, statenum INTEGER, route INTEGER,
+    routename TEXT, active INTEGER, latitude REAL, longitude REAL,
+    stratum INTEGER, bcr INTEGER, routetypeid INTEGER,
+    routetypedetailid INTEGER"""
+BBS_WEATHER = """routedataid INTEGER, countrynum INTEGER, statenum INTEGER,
+    route INTEGER, rpid INTEGER, year INTEGER, month INTEGER, day INTEGER,
+    obsn INTEGER, totalspp INTEGER, starttemp INTEGER, endtemp INTEGER,
+    tempscale TEXT, startwind INTEGER, endwind INTEGER, startsky INTEGER,
+    endsky INTEGER, starttime INTEGER, endtime INTEGER, assistant INTEGER,
+    runtype INTEGER"""
+BBS_COUNTS = """record_id INTEGER, countrynum INTEGER, statenum INTEGER,
+    route INTEGER, rpid INTEGER, year INTEGER, aou INTEGER, count10 INTEGER,
+    count20 INTEGER, count30 INTEGER, count40 INTEGER, count50 INTEGER,
+    stoptotal INTEGER, speciestotal INTEGER"""
+
+MAPS_BAND_FIELDS = """LOC BI BS PG C OBAND BAND SSN NUMB OSP SPEC OSP6 SPEC6
+    OA OHA AGE HA OWRP WRP OS OHS SEX HS SK CP BP F BM FM FW JP WNG WEIGHT
+    STATUS DATE TIME STA STATION NET ANET DISP NOTE PPC SSC PPF SSF TT RR HD
+    UPP UNP BPL NF FP SW COLOR SC CC BC MC WC JC OV1 V1 VM V94 V95 V96 V97
+    OVYR VYR N B A""".split()
+MAPS_STATION_FIELDS = """STATION LOC STA STA2 NAME LHOLD HOLDCERT O NEARTOWN
+    COUNTY STATE US REGION BLOCK LATITUDE LONGITUDE PRECISION SOURCE DATUM
+    DECLAT DECLNG NAD83 ELEV STRATUM BCR HABITAT REG PASSED""".split()
+
+NESTWATCH_FIELDS = """LOC_ID LATITUDE LONGITUDE SUBNATIONAL1_CODE ELEVATION_M
+    HEIGHT_M REL_TO_SUBSTRATE SUBSTRATE_CODE CAVITY_ENTRANCE_DIAM_CM
+    FIRST_LAY_DT HATCH_DT FLEDGE_DT ENTRANCE_ORIENTATION HABITAT_CODE_1
+    HABITAT_CODE_2 HABITAT_CODE_3 PROJ_PERIOD_ID USER_ID OUTCOME_CODE_LIST
+    ATTEMPT_ID SPECIES_CODE CLUTCH_SIZE_HOST_ATLEAST EGGS_HOST_UNH_ATLEAST
+    YOUNG_HOST_TOTAL_ATLEAST YOUNG_HOST_FLEDGED_ATLEAST
+    YOUNG_HOST_DEAD_ATLEAST""".split()
+
+POLLARD_PLACE_FIELDS = [
+    'Site', 'Route', 'Land Owner', 'transect_id', 'Route Poin', 'Route_Po_1',
+    'Route_Po_2', 'CLIMDIV_ID', 'CD_sub', 'CD_Name', 'ST', 'PRE_MEAN',
+    'PRE_STD', 'TMP_MEAN', 'TMP_STD', 'lat', 'long']
+POLLARD_FIELDS = [
+    'Site', 'Route', 'County', 'State', 'Start time', 'End time', 'Duration',
+    'Survey', 'Temp', 'Sky', 'Wind', 'Archived', 'Was the survey completed?',
+    'Monitoring Program', 'Date', 'Temperature end', 'Sky end', 'Wind end',
+    'Scientific Name', 'Species', 'Total', 'A', 'B', 'C', 'D', 'E', 'A key',
+    'B key', 'C key', 'D key', 'E key', 'Observer/Spotter',
+    'Other participants', 'Recorder/Scribe', 'Taxon as reported']
+
+NABA_FIELDS = [
+    'SITE_ID', 'LATITUDE', 'LONGITUDE', 'iYear', 'Month', 'Day',
+    'PARTY_HOURS', 'SPECIES_CODE', 'Gen_Tribe_Fam', 'Species',
+    'SumOfBFLY_COUNT']
+
+BUTTERFLIES = [
+    'Papilio canadensis', 'Anthocharis midea', 'Plebejus saepiolus',
+    'Cercyonis pegala', 'Erynnis icelus']
+
+
+def main(args):
+    """Write every dataset's raw files."""
+    root = Path(args.root)
+    rand = random.Random(args.seed)
+    scale = args.scale
+
+    log(f'Writing synthetic raw data at scale {scale} to {root}')
+    names = clements(root)
+    ebird(root, rand, scale, names)
+    bbs(root, rand, scale)
+    maps(root, rand, scale, names)
+    bbl(root, rand, scale, names)
+    nestwatch(root, rand, scale, len(names))
+    pollard(root, rand, scale)
+    naba(root, rand, scale)
+    log('Done')
+
+
+def clements(root):
+    """Write the Clements checklist with the target birds & some others."""
+    taxonomy = root / clements_ingest.TAXON_DIR
+    taxonomy.mkdir(parents=True, exist_ok=True)
+    if (taxonomy / TARGETS).resolve() != (TAXONOMY / TARGETS).resolve():
+        shutil.copy(TAXONOMY / TARGETS, taxonomy)
+
+    with open(TAXONOMY / TARGETS) as in_file:
+        names = [r['sci_name'] for r in csv.DictReader(in_file)]
+    names += [f'Avis other{i}' for i in range(40)]
+
+    with open(taxonomy / CLEMENTS_CSV, 'w', encoding='ISO-8859-1',
+              newline='') as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow([
+            'sort v2018', 'eBird species code 2018', 'category',
+            'English name', 'scientific name', 'range', 'order', 'family',
+            'eBird species group', 'extinct'])
+        for i, name in enumerate(names, 1):
+            writer.writerow([
+                i, f'sp{i:04d}', 'species', f'Bird {i}', name,
+                'North America' if i % 3 else '', 'Passeriformes', 'Fam',
+                'Group', '' if i % 7 else '1'])
+
+    return names
+
+
+def ebird(root, rand, scale, names):
+    """Write the eBird Basic Dataset, about 8 lines per checklist."""
+    path = root / ebird_ingest.RAW_DIR / ebird_ingest.RAW_CSV
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    checklists = int(2000 * scale)
+    localities = [
+        (round(rand.uniform(-100, -45), 6), round(rand.uniform(15, 60), 6))
+        for _ in range(max(10, checklists // 8))]
+
+    guid = 0
+    with gzip.open(path, 'wt') as out_file:
+        out_file.write('\t'.join(EBIRD_COLUMNS) + '\n')
+        for event in range(checklists):
+            lng, lat = rand.choice(localities)
+            day = date(2000, 1, 1) + timedelta(days=rand.randrange(7000))
+            approved = '1' if rand.random() > 0.05 else '0'
+            complete = '1' if rand.random() > 0.2 else '0'
+            started = '' if rand.random() < 0.1 else (
+                f'{rand.randrange(24):02d}:{rand.randrange(60):02d}:00')
+            minutes = '' if rand.random() < 0.2 else str(
+                rand.randrange(1, 300))
+            km = '' if rand.random() < 0.3 else f'{rand.random() * 5:.3f}'
+            state = rand.choice(['US-NY', 'US-PA', 'CA-ON', 'US-ME'])
+            protocol = rand.choice(['Traveling', 'Stationary', 'Incidental'])
+            group = '' if rand.random() < 0.9 else f'G{event}'
+            comments = 'Café "good" \\ note' if rand.random() < 0.1 else ''
+
+            for _ in range(rand.randrange(1, 15)):
+                guid += 1
+                row = [
+                    f'URN:CornellLabOfOrnithology:EBIRD:OBS{guid}',
+                    f'2019-0{rand.randrange(1, 10)}-01 12:00:00',
+                    str(rand.randrange(1000, 30000)),
+                    rand.choice(['species', 'issf', 'slash']),
+                    'Common', rand.choice(names), '', '',
+                    rand.choice(['X', '1', '2', '5', '12']), '', '', '',
+                    'United States', state[:2], 'State', state, 'County',
+                    f'{state}-001', '', str(rand.randrange(1, 40)), '', '',
+                    'Loc', f'L{hash((lng, lat)) % 10 ** 7}', 'H',
+                    str(lat), str(lng), day.isoformat(), started,
+                    f'obsr{rand.randrange(500)}', f'S{event}', protocol,
+                    'P22', 'EBIRD', minutes, km, '', '1', complete, group,
+                    '0', approved, '0', '', comments, '', '']
+                out_file.write('\t'.join(row) + '\n')
+
+
+def bbs(root, rand, scale):
+    """Write the BBS species, routes, weather, & counts tables."""
+    path = root / bbs_ingest.BBS_DB
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        path.unlink()
+    cxn = sqlite3.connect(path)
+
+    with open(TAXONOMY / BBS_SPECIES, encoding='latin-1') as in_file:
+        species = list(csv.DictReader(in_file))[:100]
+    fields = list(species[0].keys())
+    columns = ', '.join(fields)
+    cxn.execute(f'CREATE TABLE breed_bird_survey_species ({columns})')
+    insert(cxn, 'breed_bird_survey_species', [
+        [int(s['species_id']), int(s['aou'])] + [s[f] for f in fields[2:]]
+        for s in species])
+
+    routes = [(840, state, route) for state in range(1, 6)
+              for route in range(1, int(20 * scale) + 2)]
+    cxn.execute(f'CREATE TABLE breed_bird_survey_routes ({BBS_ROUTES})')
+    insert(cxn, 'breed_bird_survey_routes', [
+        (country, state, route, f'Route {route}', 1, rand.uniform(25, 50),
+         rand.uniform(-120, -70), 1, 2, 1, 1)
+        for country, state, route in routes])
+
+    weather = []
+    for country, state, route in routes:
+        for year in range(2010, 2016):
+            weather.append((
+                len(weather) + 1, country, state, route, 101, year,
+                rand.randrange(5, 8), rand.randrange(1, 29), 1, 30, 50, 60,
+                'F', 1, 2, 1, 1, rand.choice([None, 500, 530, 1015]),
+                rand.choice([None, 1000, 1059]), 0, 1))
+    cxn.execute(f'CREATE TABLE breed_bird_survey_weather ({BBS_WEATHER})')
+    insert(cxn, 'breed_bird_survey_weather', weather)
+
+    counts = []
+    for run in weather:
+        for bird in rand.sample(species, 5):
+            counts.append((
+                len(counts) + 1, *run[1:6], int(bird['aou']), 1, 2, 3, 4, 5,
+                5, rand.randrange(1, 20)))
+    cxn.execute(f'CREATE TABLE breed_bird_survey_counts ({BBS_COUNTS})')
+    insert(cxn, 'breed_bird_survey_counts', counts)
+
+    cxn.commit()
+    cxn.close()
+
+
+def insert(cxn, table, rows):
+    """Insert rows into a raw BBS table."""
+    params = ', '.join('?' * len(rows[0]))
+    cxn.executemany(f'INSERT INTO {table} VALUES ({params})', rows)
+
+
+def maps(root, rand, scale, names):
+    """Write the MAPS species, band, effort, & status DBFs & stations."""
+    path = root / maps_ingest.RAW_DIR
+    path.mkdir(parents=True, exist_ok=True)
+
+    specs = [f'S{i:03d}' for i in range(len(names))]
+    write_dbf(path / f'{maps_ingest.LIST}.DBF', [
+        ('SPEC', 'C', 4, 0), ('SCINAME', 'C', 40, 0),
+        ('COMMONNAME', 'C', 40, 0), ('NUMB', 'N', 4, 0)], [
+        (spec, name, f'Bird {spec}', i)
+        for i, (spec, name) in enumerate(zip(specs, names))])
+
+    stations = [f'ST{i:02d}' for i in range(max(3, int(10 * scale)))]
+    with open(path / f'{maps_ingest.STATIONS}.csv', 'w',
+              newline='') as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow(MAPS_STATION_FIELDS)
+        for station in stations:
+            row = dict.fromkeys(MAPS_STATION_FIELDS, '')
+            row.update(
+                STATION=station, LOC='L1', STA=station + 'X',
+                NAME=f'Station {station}',
+                DECLAT=f'{rand.uniform(30, 50):.4f}',
+                DECLNG=f'{rand.uniform(-120, -70):.4f}',
+                PRECISION=rand.choice(['01S', '10M', 'BLK', 'XXX']))
+            writer.writerow(row.values())
+
+    types = {'DATE': ('D', 8, 0), 'WEIGHT': ('N', 6, 1), 'NUMB': ('N', 4, 0)}
+    fields = [(f, *types.get(f, ('C', 10, 0))) for f in MAPS_BAND_FIELDS]
+    bands = []
+    for i in range(int(3000 * scale)):
+        day = date(2015 + rand.randrange(3), rand.randrange(5, 9),
+                   rand.randrange(1, 29))
+        band = dict.fromkeys(MAPS_BAND_FIELDS, '')
+        band.update(
+            BAND=str(100000 + i), SPEC=rand.choice(specs),
+            DATE=day.strftime('%Y%m%d'), STA=rand.choice(stations) + 'X',
+            STATION=rand.choice(stations),
+            NET=rand.choice(['1', '2', '3', '']), AGE=rand.choice(['1', '2']),
+            WEIGHT=rand.choice(['', f'{rand.uniform(5, 30):.1f}']),
+            NUMB=str(rand.randrange(100)), TIME='0730')
+        bands.append(band)
+    write_dbf(path / f'{maps_ingest.BAND}.DBF', fields,
+              [b.values() for b in bands])
+
+    nets = dict.fromkeys((b['STA'], b['NET'], b['DATE']) for b in bands)
+    write_dbf(path / f'{maps_ingest.EFFORT}.DBF', [
+        ('STA', 'C', 10, 0), ('NET', 'C', 10, 0), ('DATE', 'D', 8, 0),
+        ('START', 'C', 4, 0), ('END', 'C', 4, 0), ('LENGTH', 'N', 5, 1)], [
+        (*net, '0600', '1200', 6.0) for net in nets if rand.random() < 0.8])
+
+    status = sorted({(b['DATE'][:4], b['STA'], b['SPEC']) for b in bands})
+    write_dbf(path / f'{maps_ingest.STATUS}.DBF', [
+        ('YR', 'C', 4, 0), ('STA', 'C', 10, 0), ('SPEC', 'C', 4, 0),
+        ('YS', 'C', 2, 0)], [
+        (*key, rand.choice(['B', 'T', 'U'])) for key in status])
+
+
+def write_dbf(path, fields, rows):
+    """Write a dBASE III file. The fields are (name, type, size, decimals)."""
+    header_size = 32 + 32 * len(fields) + 1
+    record_size = 1 + sum(f[2] for f in fields)
+
+    with open(path, 'wb') as out_file:
+        out_file.write(struct.pack(
+            '<BBBBIHH20x', 3, 120, 1, 1, len(rows), header_size,
+            record_size))
+        for name, type_, size, decimals in fields:
+            out_file.write(struct.pack(
+                '<11sc4xBB14x', name.encode(), type_.encode(), size,
+                decimals))
+        out_file.write(b'\r')
+
+        for row in rows:
+            out_file.write(b' ')
+            for (_, type_, size, _), value in zip(fields, row):
+                value = '' if value is None else str(value)
+                value = value.rjust(size) if type_ == 'N' else value.ljust(
+                    size)
+                out_file.write(value.encode('latin-1')[:size])
+        out_file.write(b'\x1a')
+
+
+def bbl(root, rand, scale, names):
+    """Write the BBL species page & the banding & encounter CSVs."""
+    for path in (bbl_ingest.BANDING, bbl_ingest.ENCOUNTERS,
+                 bbl_ingest.RECAPTURES):
+        (root / path).mkdir(parents=True, exist_ok=True)
+
+    species_ids = {name: 1000 + i for i, name in enumerate(names)}
+    with open(root / bbl_ingest.SPECIES, 'w') as out_file:
+        out_file.write('<html><body><table><tr><th>Species Number</th>'
+                       '<th>Scientific Name</th></tr>')
+        for name, species_id in species_ids.items():
+            out_file.write(f'<tr><td>{species_id}</td><td>{name}</td></tr>')
+        out_file.write('</table></body></html>')
+
+    for file_no in range(2):
+        path = root / bbl_ingest.BANDING / f'band_{file_no}.csv'
+        with open(path, 'w', newline='') as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow([
+                'BAND_NUM', 'BANDING_DATE', 'SPECIES_ID', 'SPECIES_NAME',
+                'AGE_CODE', 'SEX_CODE', 'COORD_PRECISION',
+                'LAT_DECIMAL_DEGREES', 'LON_DECIMAL_DEGREES', 'OTHER_FIELD'])
+            for i in range(int(1000 * scale)):
+                name = rand.choice(names)
+                writer.writerow([
+                    f'{file_no}{i:08d}', random_day(rand, 1990, 9000),
+                    species_ids[name], name, rand.choice(['1', '2', '']),
+                    rand.choice(['M', 'F']),
+                    rand.choice(['0', '1', '10', '12', '60', '72']),
+                    f'{rand.uniform(25, 50):.2f}',
+                    f'{rand.uniform(-120, -70):.2f}', 'x'])
+
+    for path in (bbl_ingest.ENCOUNTERS, bbl_ingest.RECAPTURES):
+        path = root / path / f'{path.name.lower()}_0.csv'
+        with open(path, 'w', newline='') as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow([
+                'BAND_NUM', 'ENCOUNTER_DATE', 'B_SPECIES_ID',
+                'B_SPECIES_NAME', 'B_AGE_CODE', 'B_SEX_CODE',
+                'MIN_AGE_AT_ENC', 'ORIGINAL_BAND', 'E_COORD_PRECISION',
+                'E_LAT_DECIMAL_DEGREES', 'E_LON_DECIMAL_DEGREES'])
+            for i in range(int(500 * scale)):
+                name = rand.choice(names)
+                writer.writerow([
+                    f'9{i:08d}', random_day(rand, 1990, 9000),
+                    species_ids[name], name, '1', 'U',
+                    str(rand.randrange(5)), '',
+                    rand.choice(['0', '1', '10']),
+                    f'{rand.uniform(25, 50):.2f}',
+                    f'{rand.uniform(-120, -70):.2f}'])
+
+
+def random_day(rand, year, days):
+    """Get a random ISO date in the days after the start of the year."""
+    day = date(year, 1, 1) + timedelta(days=rand.randrange(days))
+    return day.isoformat()
+
+
+def nestwatch(root, rand, scale, species):
+    """Write the NestWatch nesting attempts, 1 or 2 lines per attempt."""
+    path = root / nestwatch_ingest.DATA_CSV
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    locations = [
+        (f'L{i}', f'{rand.uniform(25, 50):.4f}',
+         f'{rand.uniform(-120, -70):.4f}')
+        for i in range(int(200 * scale) + 1)]
+
+    def stamp(day, chance):
+        if rand.random() >= chance:
+            return ''
+        return day.strftime('%d%b%Y').upper() + ':00:00:00'
+
+    with open(path, 'w', newline='') as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow(NESTWATCH_FIELDS)
+        for attempt in range(int(1000 * scale)):
+            loc_id, lat, lng = rand.choice(locations)
+            day = date(2005, 1, 1) + timedelta(days=rand.randrange(5000))
+            laid = stamp(day, 0.8)
+            hatched = stamp(day + timedelta(days=14), 0.6)
+            fledged = stamp(day + timedelta(days=30), 0.5)
+            for _ in range(rand.randrange(1, 3)):
+                row = dict.fromkeys(NESTWATCH_FIELDS, '')
+                row.update(
+                    LOC_ID=loc_id, LATITUDE=lat, LONGITUDE=lng,
+                    SUBNATIONAL1_CODE='US-NY', FIRST_LAY_DT=laid,
+                    HATCH_DT=hatched, FLEDGE_DT=fledged,
+                    ATTEMPT_ID=str(attempt + 1),
+                    SPECIES_CODE=f'sp{rand.randrange(1, species):04d}',
+                    PROJ_PERIOD_ID='P1',
+                    CLUTCH_SIZE_HOST_ATLEAST=rand.choice(['', '3', '4']),
+                    EGGS_HOST_UNH_ATLEAST=rand.choice(['', '0', '1']),
+                    YOUNG_HOST_TOTAL_ATLEAST=rand.choice(['', '2']),
+                    YOUNG_HOST_FLEDGED_ATLEAST=rand.choice(['', '2']),
+                    YOUNG_HOST_DEAD_ATLEAST=rand.choice(['', '0']))
+                writer.writerow(row.values())
+
+
+def pollard(root, rand, scale):
+    """Write the Pollard transects & butterfly counts."""
+    path = root / pollard_ingest.PLACE_CSV
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    sites = [(f'Site{i}', str(route))
+             for i in range(max(2, int(10 * scale))) for route in (1, 2)]
+    with open(path, 'w', newline='') as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow(POLLARD_PLACE_FIELDS)
+        for site, route in sites:
+            writer.writerow([
+                site, route, 'Owner', '1', '', '', '', '1', '', '', 'OH', '1',
+                '1', '1', '1', f'{rand.uniform(38, 42):.4f}',
+                f'{rand.uniform(-85, -80):.4f}'])
+
+    with open(root / pollard_ingest.DATA_CSV, 'w', newline='') as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow(POLLARD_FIELDS)
+        for _ in range(int(1000 * scale)):
+            site, route = rand.choice(sites)
+            day = (date(2012, 4, 1)
+                   + timedelta(days=rand.randrange(1500))).isoformat()
+            started = (f'{day} {rand.randrange(8, 12):02d}:'
+                       f'{rand.randrange(60):02d}:00')
+            row = dict.fromkeys(POLLARD_FIELDS, '')
+            row.update({
+                'Site': site, 'Route': route, 'County': 'C', 'State': 'OH',
+                'Start time': started,
+                'End time': rand.choice(['', f'{day} 13:15:00']),
+                'Scientific Name': rand.choice(BUTTERFLIES),
+                'Species': 'Lep', 'Total': str(rand.randrange(10)),
+                'Date': day})
+            writer.writerow(row.values())
+
+
+def naba(root, rand, scale):
+    """Write the NABA July 4th butterfly counts."""
+    path = root / naba_ingest.DATA_CSV
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    sites = [
+        (f'N{i}', f'{rand.uniform(30, 45):.4f}',
+         f'{rand.uniform(-100, -70):.4f}')
+        for i in range(int(50 * scale) + 1)]
+
+    with open(path, 'w', newline='') as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow(NABA_FIELDS)
+        for _ in range(int(2000 * scale)):
+            site_id, lat, lng = rand.choice(sites)
+            genus, species = rand.choice(BUTTERFLIES).split()
+            writer.writerow([
+                site_id, lat, lng, str(rand.randrange(1995, 2010)), '7',
+                str(rand.randrange(1, 28)), '5.5',
+                rand.choice(['', 'C1', 'C2']), genus, species,
+                rand.choice(['', '3', '10'])])
+
+
+def parse_args():
+    """Process command-line arguments."""
+    description = """Write synthetic raw data files for every dataset, in
+        each source's own format, under a root directory. Use them to try out
+        or benchmark the ingest without the real data."""
+    arg_parser = argparse.ArgumentParser(
+        description=textwrap.dedent(description),
+        fromfile_prefix_chars='@')
+
+    arg_parser.add_argument(
+        'root', help="""Write the data/raw/... files under this
+            directory.""")
+
+    arg_parser.add_argument(
+        '--scale', type=float, default=1.0,
+        help="""Multiply the number of records by this. At 1.0 eBird gets
+            2,000 checklists & about 15,000 lines. (default: %(default)s)""")
+
+    arg_parser.add_argument(
+        '--seed', type=int, default=42,
+        help="""Random number seed. (default: %(default)s)""")
+
+    return arg_parser.parse_args()
+
+
+if __name__ == '__main__':
+    ARGS = parse_args()
+    main(ARGS)